@@ -3,6 +3,11 @@ ASGI config for hallaOrder project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Production serves this through gunicorn with uvicorn workers (see Procfile),
+so the live order board stream (``orders.views.order_board_stream``) can keep
+one long-lived connection per board screen without tying up a worker.  Under
+a WSGI server the stream answers 204 and the board polls instead.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -98,6 +98,18 @@ DATABASES = {
     
 }
 
+# Shared cache for every worker process (needs the ``redis`` package), e.g.
+# CACHE_URL=redis://localhost:6379/1.  Without it each process keeps its own
+# LocMem cache; anything that must be seen by all workers at once (the online
+# ordering pause, branch access) is read from the database, not the cache.
+if os.getenv("CACHE_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["CACHE_URL"],
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -152,11 +164,46 @@ STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY", "")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY", "")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "")
 STRIPE_DEFAULT_CURRENCY = "sar"  
+# Orders are built by the Stripe webhook; the success page asks Stripe itself
+# only if the webhook has not arrived this many seconds after checkout.
+CHECKOUT_WEBHOOK_GRACE_SECONDS = int(os.getenv("CHECKOUT_WEBHOOK_GRACE_SECONDS", "10"))
 
+# Invoice emails are queued in the outbox and sent by
+# `python manage.py email_worker --loop` over one SMTP connection per batch.
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = "smtp.gmail.com"       
 EMAIL_PORT = 587                             
 EMAIL_HOST_USER = os.environ.get("EMAIL_USER")
 EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_PASS")
 EMAIL_USE_TLS = True                         
-DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
\ No newline at end of file
+DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+
+# Live order board: broker used to push order events to board screens.
+# DatabaseBroker polls the branch change sequence, so it works across worker
+# processes and nodes; LocalBroker only reaches screens connected to the same
+# process; RedisBroker pushes through Redis pub/sub.  Streams need the ASGI
+# server from the Procfile; under WSGI the board polls instead.
+ORDERS_BOARD_BROKER = {
+    "BACKEND": os.getenv("ORDERS_BOARD_BROKER", "orders.events.DatabaseBroker"),
+    "OPTIONS": {"url": os.environ["ORDERS_BROKER_URL"]} if os.getenv("ORDERS_BROKER_URL") else {},
+}
+
+# Delivered/Cancelled orders older than this many days are moved to the
+# archive tables by `python manage.py archive_orders`.
+ORDERS_ARCHIVE_AFTER_DAYS = int(os.getenv("ORDERS_ARCHIVE_AFTER_DAYS", "180"))
+
+# Pre-orders (pickup/delivery/reservation time in the future) stay off the
+# board until this many minutes before they are due; released by
+# `python manage.py release_scheduled_orders --loop`.
+ORDERS_SCHEDULE_LEAD_MINUTES = int(os.getenv("ORDERS_SCHEDULE_LEAD_MINUTES", "30"))
+
+# Kitchen tickets are printed by `python manage.py print_worker --loop`.
+# PDF printers render through Pillow; point this at a TTF with Arabic glyphs.
+ORDERS_PRINT_FONT = os.getenv("ORDERS_PRINT_FONT") or None
+
+# Order lifecycle metrics at /metrics (Prometheus text format).  Worker
+# processes share them through the files in PROMETHEUS_MULTIPROC_DIR (set and
+# emptied on start by the Procfile); without it each process counts alone.
+# With a token the scraper sends "Authorization: Bearer <token>"; without one
+# only staff users can read the page.
+ORDERS_METRICS_TOKEN = os.getenv("ORDERS_METRICS_TOKEN") or None
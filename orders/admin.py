@@ -1,19 +1,26 @@
 # orders/admin.py
+import datetime
+
 from django.contrib import admin, messages
-from .models import Order, OrderItem, OrderStatus, DineInDetails, DeliveryDetails, PickupDetails, PaymentMethod
+from django.db.models import Q
+from django.utils import timezone
+from .models import Order, OrderItem, OrderItemOption, OrderStatus, ScheduledOrder, Printer, PrintJob, OrderStatusEvent, BranchCapacity, DineInDetails, DeliveryDetails, PickupDetails, PaymentMethod
+from .services import bulk_set_status, set_order_status
+from .pricing import recalc_order_totals
+from .changelist import ApproximateCountPaginator, KeysetChangeList
 
 # ---- Inlines ----
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 1
     raw_id_fields = ("product",)  # faster than a huge dropdown
-    fields = ("product", "quantity", "options", "addons")
+    fields = ("product", "quantity", "options", "addons", "option_adjustment")
     show_change_link = True
 
 
 # ---- Actions ----
 def _bulk_set_status(modeladmin, request, queryset, status_value, label):
-    updated = queryset.update(status=status_value)
+    updated = bulk_set_status(queryset, status_value)
     messages.success(request, f"تم تحديث حالة {updated} طلب(ات) إلى «{label}».")
 
 @admin.action(description="تعيين الحالة: جديد")
@@ -39,21 +46,45 @@ def set_status_cancelled(modeladmin, request, queryset):
 
 @admin.action(description="إعادة حساب المجموع من العناصر")
 def recalc_total_from_items(modeladmin, request, queryset):
-    total_updated = 0
-    for order in queryset.prefetch_related("items__product"):
-        total = 0
-        for it in order.items.all():
-            price = getattr(it.product, "price", 0) or 0
-            qty = it.quantity or 0
-            total += price * qty
-        # NOTE: 
-        if order.total_price != total:
-            order.total_price = total
-            order.save(update_fields=["total_price"])
-            total_updated += 1
+    # مجموع إجماليات الأسطر المحفوظة، استعلام UPDATE واحد لكل دفعة بدل حفظ كل طلب
+    total_updated = recalc_order_totals(queryset)
     messages.success(request, f"تم تحديث الإجمالي في {total_updated} طلب(ات).")
 
 
+# ---- Filters ----
+class CreatedMonthFilter(admin.SimpleListFilter):
+    """
+    Month drill-down without ``date_hierarchy``'s DISTINCT-dates scan: the
+    last 12 months are computed in Python and filtered as a ``created_at``
+    range, which the ``created_at`` index serves.
+    """
+    title = "شهر الإنشاء"
+    parameter_name = "created_month"
+    MONTHS = 12
+
+    def lookups(self, request, model_admin):
+        today = timezone.localdate()
+        year, month = today.year, today.month
+        choices = []
+        for _ in range(self.MONTHS):
+            choices.append((f"{year:04d}-{month:02d}", f"{year:04d}-{month:02d}"))
+            year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+        return choices
+
+    def queryset(self, request, queryset):
+        try:
+            year, month = (int(x) for x in (self.value() or "").split("-"))
+            start = datetime.date(year, month, 1)
+        except ValueError:
+            return queryset
+        end = datetime.date(year + (month == 12), month % 12 + 1, 1)
+        tz = timezone.get_current_timezone()
+        return queryset.filter(
+            created_at__gte=datetime.datetime.combine(start, datetime.time.min, tz),
+            created_at__lt=datetime.datetime.combine(end, datetime.time.min, tz),
+        )
+
+
 # ---- Order Admin ----
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
@@ -64,11 +95,17 @@ class OrderAdmin(admin.ModelAdmin):
         "total_price", "created_at",
     )
     list_display_links = ("id",)
-    list_editable = ("status", "payment_method", "total_price")
-    list_filter = ("branch", "status", "payment_method", ("created_at", admin.DateFieldListFilter))
+    list_select_related = ("branch", "customer")
+    list_filter = (
+        "branch", "status", "payment_method",
+        ("created_at", admin.DateFieldListFilter), CreatedMonthFilter,
+    )
     search_fields = ("id", "customer__username", "customer__email")
-    date_hierarchy = "created_at"
-    ordering = ("-created_at",)
+    # جدول كبير: ترتيب ثابت بالمعرّف (ترقيم بالمؤشر)، بدون عدّ كامل ولا date_hierarchy
+    ordering = ("-id",)
+    sortable_by = ()
+    show_full_result_count = False
+    paginator = ApproximateCountPaginator
     readonly_fields = ("created_at", "updated_at")
     actions = [
         set_status_new,
@@ -79,8 +116,42 @@ class OrderAdmin(admin.ModelAdmin):
         recalc_total_from_items,
     ]
 
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        # رقم => بحث بالمعرّف فقط؛ نص => بداية اسم المستخدم أو البريد كاملاً (يستخدمان الفهارس)
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            return queryset.filter(pk=int(term)), False
+        return queryset.filter(Q(customer__username__startswith=term) | Q(customer__email__iexact=term)), False
+
+    def save_model(self, request, obj, form, change):
+        # تغيير الحالة من نموذج الإدارة يمر عبر الخدمة ليُسجَّل في سجل الحالات
+        new_status = obj.status
+        if change and "status" in form.changed_data:
+            obj.status = form.initial["status"]
+        super().save_model(request, obj, form, change)
+        if obj.status != new_status:
+            set_order_status(obj, new_status)
+
+class OrderItemOptionInline(admin.TabularInline):
+    # لقطة وقت البيع: للعرض فقط
+    model = OrderItemOption
+    extra = 0
+    can_delete = False
+    fields = ("group_name", "option_name", "price_adjustment", "option")
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
+    inlines = [OrderItemOptionInline]
     list_display = ("id", "order", "product", "quantity")
     list_filter = ("order__branch",)
     search_fields = ("order__id", "product__name")
@@ -88,7 +159,66 @@ class OrderItemAdmin(admin.ModelAdmin):
     ordering = ("-id",)
 
 
+@admin.register(OrderStatusEvent)
+class OrderStatusEventAdmin(admin.ModelAdmin):
+    # سجل للإضافة فقط: للعرض دون تعديل أو حذف
+    list_display = ("id", "order_id", "branch", "from_status", "to_status", "duration_seconds", "created_at")
+    list_filter = ("branch", "to_status", "order_method")
+    search_fields = ("order_id",)
+    ordering = ("-id",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(BranchCapacity)
+class BranchCapacityAdmin(admin.ModelAdmin):
+    list_display = ("branch", "paused", "max_open_orders", "max_open_items", "base_prep_minutes", "minutes_per_item")
+    list_editable = ("paused",)
+    raw_id_fields = ("branch",)
+
+
+@admin.register(ScheduledOrder)
+class ScheduledOrderAdmin(admin.ModelAdmin):
+    # الطلبات المسبقة التي لم تُطلق بعد إلى اللوحة
+    list_display = ("order", "branch", "due_at", "release_at")
+    list_filter = ("branch",)
+    list_select_related = ("order", "branch")
+    raw_id_fields = ("order",)
+    ordering = ("release_at",)
+
+
+
+@admin.register(Printer)
+class PrinterAdmin(admin.ModelAdmin):
+    list_display = ("name", "branch", "transport", "address", "format", "is_active")
+    list_filter = ("branch", "transport", "format", "is_active")
+    list_select_related = ("branch",)
+
+
+@admin.action(description="إعادة الطباعة")
+def retry_print_jobs(modeladmin, request, queryset):
+    updated = queryset.update(status=PrintJob.Status.PENDING, attempts=0, available_at=timezone.now())
+    messages.success(request, f"أُعيدت {updated} مهمة طباعة إلى الطابور.")
+
+
+@admin.register(PrintJob)
+class PrintJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "order", "printer", "status", "attempts", "created_at", "printed_at")
+    list_filter = ("status", "printer")
+    list_select_related = ("printer", "order")
+    raw_id_fields = ("order",)
+    readonly_fields = ("last_error",)
+    ordering = ("-id",)
+    actions = [retry_print_jobs]
+
 admin.site.register(DeliveryDetails)
 admin.site.register(DineInDetails)
 # admin.site.register(PaymentMethod)
-admin.site.register(PickupDetails)
\ No newline at end of file
+admin.site.register(PickupDetails)
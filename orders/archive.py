@@ -0,0 +1,134 @@
+# orders/archive.py
+"""
+Hot/cold split for orders.
+
+Finished orders (Delivered/Cancelled) older than
+``settings.ORDERS_ARCHIVE_AFTER_DAYS`` are copied to ``orders_archive`` /
+``order_items_archive`` and removed from the hot tables, one chunk per
+transaction, so board and report queries only scan recent rows.  Ids are
+kept, and invoices/payments/wallet rows keep pointing at them.
+
+Reads that must include archived orders use ``OrderHistory`` /
+``OrderItemHistory`` (views over both tables) or ``get_order_any``;
+``history_models`` picks the hot tables instead when a date range cannot
+reach the archive, so recent reports skip the UNION ALL.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import (
+    ArchivedOrder, ArchivedOrderItem, Order, OrderHistory, OrderItem, OrderItemHistory, OrderStatus,
+)
+
+ARCHIVABLE_STATUSES = (OrderStatus.DELIVERED, OrderStatus.CANCELLED)
+
+
+def archive_cutoff(days=None):
+    if days is None:
+        days = getattr(settings, "ORDERS_ARCHIVE_AFTER_DAYS", 180)
+    return timezone.now() - timedelta(days=days)
+
+
+def history_models(since=None):
+    """
+    ``(Order, OrderItem)`` when no order created on or after ``since`` can
+    be archived, otherwise the ``(OrderHistory, OrderItemHistory)`` views.
+    ``since`` is a date or an aware datetime; ``None`` means all time.
+    """
+    if since is not None:
+        if not isinstance(since, datetime):
+            since = timezone.make_aware(datetime.combine(since, time.min))
+        if since >= archive_cutoff():
+            # الأرشيف قد يكون نُقل بـ --days أقصر من الإعداد؛ آخر طلب مؤرشف هو الحد الفعلي
+            last = ArchivedOrder.objects.aggregate(last=Max("created_at"))["last"]
+            if last is None or last < since:
+                return Order, OrderItem
+    return OrderHistory, OrderItemHistory
+
+
+def _details(order) -> dict:
+    details = {}
+    for attr, fields in (
+        ("delivery_details", ("address", "city", "delivery_time")),
+        ("pickup_details", ("branch_id", "pickup_time")),
+        ("dinein_details", ("branch_id", "number_of_people", "reservation_time", "special_requests")),
+    ):
+        obj = getattr(order, attr, None)
+        if obj is None:
+            continue
+        row = {}
+        for f in fields:
+            value = getattr(obj, f)
+            row[f] = value.isoformat() if hasattr(value, "isoformat") else value
+        details[attr] = row
+    return details
+
+
+def archive_chunk(cutoff, chunk_size=500) -> int:
+    """Move up to ``chunk_size`` finished orders created before ``cutoff``."""
+    ids = list(
+        Order.objects.filter(status__in=ARCHIVABLE_STATUSES, created_at__lt=cutoff)
+        .order_by("created_at", "pk")
+        .values_list("pk", flat=True)[:chunk_size]
+    )
+    if not ids:
+        return 0
+
+    now = timezone.now()
+    with transaction.atomic():
+        # نعيد التحقق تحت القفل: قد يكون الطلب تغيّر بعد اختياره
+        orders = list(
+            Order.objects.select_for_update(of=("self",))
+            .select_related("delivery_details", "pickup_details", "dinein_details")
+            .filter(pk__in=ids, status__in=ARCHIVABLE_STATUSES)
+        )
+        if not orders:
+            return 0
+        ids = [o.pk for o in orders]
+
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(
+                id=o.pk,
+                customer_id=o.customer_id,
+                guest_name=o.guest_name,
+                guest_phone=o.guest_phone,
+                branch_id=o.branch_id,
+                status=o.status,
+                total_price=o.total_price,
+                payment_method=o.payment_method,
+                order_method=o.order_method,
+                created_at=o.created_at,
+                updated_at=o.updated_at,
+                status_changed_at=o.status_changed_at,
+                version=o.version,
+                ticket_day=o.ticket_day,
+                ticket_number=o.ticket_number,
+                details=_details(o),
+                archived_at=now,
+            )
+            for o in orders
+        ])
+        ArchivedOrderItem.objects.bulk_create([
+            ArchivedOrderItem(**row)
+            for row in OrderItem.objects.filter(order_id__in=ids).values(
+                "id", "order_id", "product_id", "quantity", "options", "addons", "option_adjustment",
+                "unit_price", "line_total",
+            )
+        ])
+        Order.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def get_order_any(**filters):
+    """
+    An ``Order`` matching ``filters``, or its ``ArchivedOrder`` if it has
+    been archived, or ``None``.
+    """
+    order = Order.objects.filter(**filters).first()
+    if order is None:
+        order = ArchivedOrder.objects.filter(**filters).first()
+    return order
@@ -0,0 +1,102 @@
+# orders/capacity.py
+"""
+Is a branch taking online orders right now, and how long will they take?
+
+The answer comes from the branch's open queue (New/Preparing orders and
+their item count) against its ``BranchCapacity`` limits.  Only the queue
+counts are cached per branch (dropped on every order event, and expiring
+after ``CAPACITY_CACHE_TIMEOUT`` where the drop did not reach the cache).
+The limits and the manual ``paused`` flag are read from the database on
+every call, so a pause takes effect in every worker process at once.
+"""
+import math
+
+from django.core.cache import cache
+from django.db.models import Count, Sum
+
+from .models import BranchCapacity, Order, OrderStatus
+
+QUEUE_STATUSES = (OrderStatus.NEW, OrderStatus.PREPARING)
+CAPACITY_CACHE_TIMEOUT = 30
+
+
+def _cache_key(branch_id) -> str:
+    return f"orders:capacity:queue:{int(branch_id)}"
+
+
+def invalidate_capacity(branch_id) -> None:
+    cache.delete(_cache_key(branch_id))
+
+
+def _compute_queue(branch_id) -> tuple:
+    queue = Order.objects.filter(branch_id=branch_id, status__in=QUEUE_STATUSES).aggregate(
+        orders=Count("id", distinct=True), items=Sum("items__quantity"),
+    )
+    return queue["orders"] or 0, queue["items"] or 0
+
+
+def _status(branch_id, limits, queue) -> dict:
+    open_orders, open_items = queue
+    load = max(
+        open_orders / limits.max_open_orders if limits.max_open_orders else 0,
+        open_items / limits.max_open_items if limits.max_open_items else 0,
+    )
+    accepting = not limits.paused and load < 1
+    eta = limits.base_prep_minutes + math.ceil(open_items * float(limits.minutes_per_item))
+    return {
+        "branch_id": int(branch_id),
+        "accepting": accepting,
+        "paused": limits.paused,
+        "eta_minutes": eta,
+        "load": round(load, 2),
+        "open_orders": open_orders,
+        "open_items": open_items,
+    }
+
+
+def _limits(branch_ids) -> dict:
+    # صف واحد لكل فرع بالمفتاح الأساسي؛ الإيقاف اليدوي لا يمر بالكاش
+    rows = {c.branch_id: c for c in BranchCapacity.objects.filter(branch_id__in=branch_ids)}
+    return {b: rows.get(b) or BranchCapacity(branch_id=b) for b in branch_ids}
+
+
+def compute_capacity(branch_id) -> dict:
+    """Capacity of one branch straight from the database (uncached)."""
+    branch_id = int(branch_id)
+    return _status(branch_id, _limits([branch_id])[branch_id], _compute_queue(branch_id))
+
+
+def branch_capacity(branch_id) -> dict:
+    """Capacity of one branch: fresh limits/pause, cached queue counts."""
+    return capacity_for_branches([branch_id])[int(branch_id)]
+
+
+def capacity_for_branches(branch_ids) -> dict:
+    """``{branch_id: capacity}`` with one limits query and one cache round-trip."""
+    branch_ids = [int(b) for b in branch_ids]
+    keys = {_cache_key(b): b for b in branch_ids}
+    queues = {keys[k]: tuple(v) for k, v in cache.get_many(list(keys)).items()}
+    for key, branch_id in keys.items():
+        if branch_id not in queues:
+            queues[branch_id] = _compute_queue(branch_id)
+            cache.set(key, queues[branch_id], CAPACITY_CACHE_TIMEOUT)
+    limits = _limits(branch_ids)
+    return {b: _status(b, limits[b], queues[b]) for b in branch_ids}
+
+
+def checkout_branch_id(order_data, restaurant):
+    """
+    Branch the storefront checkout will send the order to: the branch chosen
+    for dine-in/pickup, otherwise the restaurant's first branch.
+    """
+    order_data = order_data or {}
+    method = order_data.get("order_method")
+    if method == "dine_in":
+        branch_id = (order_data.get("dinein") or {}).get("branch_id")
+    elif method == "pickup":
+        branch_id = (order_data.get("pickup") or {}).get("branch_id")
+    else:
+        branch_id = None
+    if branch_id:
+        return int(branch_id)
+    return restaurant.branches.order_by("id").values_list("id", flat=True).first()
@@ -0,0 +1,148 @@
+# orders/changelist.py
+"""
+Admin changelist pieces for the large ``orders`` table.
+
+* ``ApproximateCountPaginator`` never runs ``COUNT(*)`` over the whole table:
+  an unfiltered list uses the database's own row estimate, a filtered one
+  counts at most ``COUNT_CAP`` rows and shows "N+" beyond that.
+* ``KeysetChangeList`` pages with ``?after=<id>`` (``WHERE id < after``
+  ordered by ``-id``) and back with ``?before=<id>`` (``WHERE id > before``,
+  read ascending and flipped) instead of ``OFFSET``, so page 10,000 costs
+  the same as page 1.  Changing a filter or search drops the cursor.
+"""
+from django.contrib.admin.views.main import ChangeList, ORDER_VAR, PAGE_VAR
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+CURSOR_VAR = "after"
+BEFORE_VAR = "before"
+CURSOR_VARS = (CURSOR_VAR, BEFORE_VAR)
+COUNT_CAP = 10000
+ESTIMATE_CACHE_TIMEOUT = 60
+
+
+# ---- counts -----------------------------------------------------------------
+
+def _estimate_sql(vendor):
+    if vendor == "mysql":
+        return (
+            "SELECT TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s"
+        )
+    if vendor == "postgresql":
+        return "SELECT reltuples::bigint FROM pg_class WHERE relname = %s"
+    return None
+
+
+def estimated_table_rows(model, using="default"):
+    """Row estimate from the table statistics, or None if unavailable."""
+    table = model._meta.db_table
+    key = f"orders:rows_estimate:{using}:{table}"
+    estimate = cache.get(key)
+    if estimate is None:
+        connection = connections[using]
+        sql = _estimate_sql(connection.vendor)
+        if sql is None:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+        estimate = int(row[0]) if row and row[0] is not None and row[0] >= 0 else -1
+        cache.set(key, estimate, ESTIMATE_CACHE_TIMEOUT)
+    return estimate if estimate >= 0 else None
+
+
+class ApproximateCountPaginator(Paginator):
+    approximate = False
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if not qs.query.where:
+            estimate = estimated_table_rows(qs.model, qs.db)
+            # الإحصاءات غير دقيقة للجداول الصغيرة؛ العدّ الفعلي رخيص هناك
+            if estimate is not None and estimate > COUNT_CAP:
+                self.approximate = True
+                return estimate
+        capped = qs.order_by()[: COUNT_CAP + 1].count()
+        if capped > COUNT_CAP:
+            self.approximate = True
+            return COUNT_CAP
+        return capped
+
+
+# ---- keyset pagination -------------------------------------------------------
+
+class KeysetChangeList(ChangeList):
+    """ChangeList that pages by ``?after=<id>`` / ``?before=<id>`` when ordered by ``-id``."""
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = self._parse_cursor(request.GET.get(CURSOR_VAR))
+        self.before = self._parse_cursor(request.GET.get(BEFORE_VAR)) if self.cursor is None else None
+        self.next_cursor = None
+        self.prev_cursor = None
+        super().__init__(request, *args, **kwargs)
+
+    @staticmethod
+    def _parse_cursor(value):
+        try:
+            return int(value) if value else None
+        except (TypeError, ValueError):
+            return None
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        for var in CURSOR_VARS:
+            lookup_params.pop(var, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # أي رابط غير "التالي"/"السابق" (فلتر، بحث، ترتيب) يبدأ من أول الصفحات
+        new_params = new_params or {}
+        remove = [*(remove or []), *(var for var in CURSOR_VARS if var not in new_params)]
+        return super().get_query_string(new_params, remove)
+
+    @property
+    def keyset_enabled(self):
+        return ORDER_VAR not in self.params
+
+    def get_results(self, request):
+        super().get_results(request)
+        if not self.keyset_enabled or (self.show_all and self.can_show_all):
+            return
+        per_page = self.list_per_page
+        if self.before is not None:
+            # الصفحة السابقة: أقرب المعرّفات الأكبر تصاعديًا ثم نقلبها؛ الصف الزائد يعني أن قبلها صفحة أخرى
+            rows = list(self.queryset.filter(pk__gt=self.before).reverse()[: per_page + 1])
+            if len(rows) > per_page:
+                rows = rows[:per_page]
+                self.prev_cursor = rows[-1].pk
+            rows.reverse()
+            self.multi_page = True
+            if rows:
+                self.next_cursor = rows[-1].pk
+        else:
+            if self.cursor is not None:
+                self.result_list = self.queryset.filter(pk__lt=self.cursor)[:per_page]
+                self.multi_page = True
+            rows = list(self.result_list)
+            if self.cursor is not None and rows:
+                self.prev_cursor = rows[0].pk
+            if len(rows) == per_page:
+                self.next_cursor = rows[-1].pk
+        self.result_list = rows
+
+    def first_page_url(self):
+        return self.get_query_string(remove=[PAGE_VAR])
+
+    def next_page_url(self):
+        if self.next_cursor is None:
+            return None
+        return self.get_query_string({CURSOR_VAR: self.next_cursor}, [PAGE_VAR])
+
+    def prev_page_url(self):
+        if self.prev_cursor is None:
+            return None
+        return self.get_query_string({BEFORE_VAR: self.prev_cursor}, [PAGE_VAR])
@@ -0,0 +1,270 @@
+# orders/events.py
+"""
+Live order-board events.
+
+Every order create/advance/cancel is published to the order's branch so that
+open board screens can apply the change in place instead of reloading.
+
+The broker is pluggable through ``settings.ORDERS_BOARD_BROKER``:
+
+    ORDERS_BOARD_BROKER = {
+        "BACKEND": "orders.events.LocalBroker",   # single node / tests
+        "OPTIONS": {},
+    }
+
+``DatabaseBroker`` (the default) works across processes and nodes without
+an extra service: each stream reads the orders the branch's change
+sequence stamped since its last poll.  ``LocalBroker`` fans events out
+inside one process only (tests, ``runserver``).  ``RedisBroker`` (needs the
+``redis`` package) pushes without polling; any class implementing
+``publish`` / ``subscribe`` works.
+
+Streams need an ASGI server (see Procfile); under WSGI the board falls back
+to polling the ``changes`` endpoint.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+ORDER_CREATED = "created"
+ORDER_ADVANCED = "advanced"
+ORDER_CANCELLED = "cancelled"
+
+
+class BaseBroker:
+    def publish(self, branch_id: int, event: dict) -> None:
+        raise NotImplementedError
+
+    async def subscribe(self, branch_id: int, heartbeat: float = 15.0):
+        """
+        Async iterator of events for one branch.
+        Yields ``None`` every ``heartbeat`` seconds without traffic so the
+        caller can keep the connection alive.
+        """
+        raise NotImplementedError
+        yield  # pragma: no cover
+
+
+class LocalBroker(BaseBroker):
+    """In-process fan-out: one bounded queue per connected screen."""
+
+    def __init__(self, maxsize: int = 100):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._subscribers = {}  # branch_id -> set of (loop, queue)
+
+    def publish(self, branch_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(int(branch_id), ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:
+                # loop already closed; the subscriber cleans itself up
+                pass
+
+    @staticmethod
+    def _offer(queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # شاشة بطيئة: نتجاهل الحدث، وتعيد المزامنة عند إعادة الاتصال
+            pass
+
+    def subscriber_count(self, branch_id) -> int:
+        with self._lock:
+            return len(self._subscribers.get(int(branch_id), ()))
+
+    async def subscribe(self, branch_id, heartbeat=15.0):
+        entry = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.maxsize))
+        key = int(branch_id)
+        with self._lock:
+            self._subscribers.setdefault(key, set()).add(entry)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(entry[1].get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                subs = self._subscribers.get(key)
+                if subs is not None:
+                    subs.discard(entry)
+                    if not subs:
+                        del self._subscribers[key]
+
+
+class RedisBroker(BaseBroker):
+    """Redis pub/sub broker for multi-node deployments."""
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "halaorder:board:"):
+        import redis  # optional dependency, only needed for this backend
+
+        self.url = url
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def _channel(self, branch_id):
+        return f"{self.prefix}{int(branch_id)}"
+
+    def publish(self, branch_id, event):
+        self._client.publish(self._channel(branch_id), json.dumps(event, ensure_ascii=False))
+
+    async def subscribe(self, branch_id, heartbeat=15.0):
+        import redis.asyncio as aioredis
+
+        client = aioredis.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(self._channel(branch_id))
+        try:
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat)
+                if message is None:
+                    yield None
+                elif message.get("type") == "message":
+                    yield json.loads(message["data"])
+        finally:
+            await pubsub.unsubscribe(self._channel(branch_id))
+            await pubsub.close()
+            await client.close()
+
+
+class DatabaseBroker(BaseBroker):
+    """
+    Polls the committed rows instead of passing messages: every ``interval``
+    seconds a stream asks for the branch's orders after its ``(change_seq,
+    id)`` cursor (one indexed query).  Writes from any process or node show
+    up, and ``publish`` has nothing to do.
+    """
+
+    def __init__(self, interval: float = 1.0, batch: int = 100):
+        self.interval = interval
+        self.batch = batch
+
+    def publish(self, branch_id, event):
+        pass
+
+    def _poll(self, branch_id, cursor):
+        orders = changed_orders(branch_id, *cursor, limit=self.batch, with_html=True)
+        if orders:
+            cursor = (orders[-1].change_seq, orders[-1].pk)
+        return [build_order_event(o, "changed") for o in orders], cursor
+
+    async def subscribe(self, branch_id, heartbeat=15.0):
+        from asgiref.sync import sync_to_async
+
+        cursor = await sync_to_async(board_head)(branch_id)
+        idle = 0.0
+        while True:
+            await asyncio.sleep(self.interval)
+            events, cursor = await sync_to_async(self._poll)(branch_id, cursor)
+            for event in events:
+                yield event
+            idle = 0.0 if events else idle + self.interval
+            if idle >= heartbeat:
+                idle = 0.0
+                yield None
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> BaseBroker:
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                conf = getattr(settings, "ORDERS_BOARD_BROKER", {}) or {}
+                backend = import_string(conf.get("BACKEND", "orders.events.DatabaseBroker"))
+                _broker = backend(**conf.get("OPTIONS", {}))
+    return _broker
+
+
+def reset_broker():
+    """Drop the cached broker (tests / settings overrides)."""
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+# ---- change feed --------------------------------------------------------------
+
+def board_head(branch_id) -> tuple:
+    """``(change_seq, id)`` of the branch's most recently changed order."""
+    from .models import Order
+
+    row = (Order.objects.filter(branch_id=branch_id).order_by("-change_seq", "-pk")
+                        .values_list("change_seq", "pk").first())
+    return row or (0, 0)
+
+
+def changed_orders(branch_id, since, after_id=0, limit=200, with_html=False) -> list:
+    """
+    Orders of a branch changed after the cursor ``(since, after_id)``, in
+    cursor order.  Bulk writes stamp many orders with one sequence value,
+    so the id breaks ties and a page never cuts a value in half.
+    """
+    from .models import Order
+
+    qs = (Order.objects.filter(branch_id=branch_id)
+                       .filter(Q(change_seq__gt=since) | Q(change_seq=since, pk__gt=after_id))
+                       .order_by("change_seq", "pk"))
+    if with_html:
+        qs = qs.select_related("customer", "branch").prefetch_related("invoices")
+    else:
+        qs = qs.only("id", "branch_id", "status", "total_price", "payment_method", "change_seq", "created_at")
+    return list(qs[:limit])
+
+
+# ---- publishing -------------------------------------------------------------
+
+def build_order_event(order, kind: str) -> dict:
+    return {
+        "type": kind,
+        "order_id": order.pk,
+        "branch_id": order.branch_id,
+        "status": order.status,
+        "seq": order.change_seq,
+        "html": render_to_string("orders/_order_card.html", {"order": order}),
+    }
+
+
+def publish_order_event(order, kind: str) -> None:
+    """
+    Publish after the surrounding transaction commits, so screens never see
+    a change that was rolled back.  Also drops the branch's cached capacity
+    queue counts.  Broker failures never break the caller.
+    """
+    order_id = order.pk
+    branch_id = order.branch_id
+
+    def _publish():
+        from .capacity import invalidate_capacity
+        from .models import Order
+
+        invalidate_capacity(branch_id)
+        try:
+            fresh = (
+                Order.objects.select_related("customer", "branch")
+                .prefetch_related("invoices")
+                .filter(pk=order_id)
+                .first()
+            )
+            if fresh is None:
+                return
+            get_broker().publish(fresh.branch_id, build_order_event(fresh, kind))
+        except Exception:
+            logger.exception("Failed to publish board event for order %s", order_id)
+
+    transaction.on_commit(_publish)
@@ -0,0 +1,105 @@
+# orders/kitchen.py
+"""
+Kitchen display: items still to prepare across every open order of a branch.
+
+One grouped query over ``OrderItem`` joined to the branch's New/Preparing
+orders (served by the ``(branch, status, -created_at)`` index), then the raw
+``options``/``addons`` text is parsed and equal selections are merged.
+The result is cached per branch under the branch's ``BranchOrderSequence``
+value, which every order change advances, so each worker process sees a
+status change on its next request (one indexed read) without having to
+be told.
+"""
+import ast
+import json
+
+from django.core.cache import cache
+from django.db.models import Count, Sum
+
+from .models import BranchOrderSequence, OrderItem, OrderStatus
+
+KITCHEN_STATUSES = (OrderStatus.NEW, OrderStatus.PREPARING)
+KITCHEN_CACHE_TIMEOUT = 300
+
+
+def _cache_key(branch_id, seq) -> str:
+    return f"orders:kitchen:{int(branch_id)}:{int(seq)}"
+
+
+# ---- parsing ----------------------------------------------------------------
+
+def parse_options(raw) -> tuple:
+    """
+    ``OrderItem.options`` holds the cart's ``{group: value | [values]}`` either
+    as JSON or as a Python repr (what ``str(dict)`` stores).  Returns a sorted
+    tuple of ``"group: value"`` labels so equal selections compare equal.
+    """
+    raw = (raw or "").strip()
+    if not raw:
+        return ()
+    data = None
+    for loader in (json.loads, ast.literal_eval):
+        try:
+            data = loader(raw)
+            break
+        except (ValueError, SyntaxError):
+            continue
+    if data is None:
+        return (raw,)
+    if isinstance(data, dict):
+        labels = []
+        for group, value in data.items():
+            values = value if isinstance(value, (list, tuple)) else [value]
+            labels.extend(f"{group}: {v}" for v in values if v not in (None, ""))
+        return tuple(sorted(labels))
+    if isinstance(data, (list, tuple)):
+        return tuple(sorted(str(v) for v in data if v not in (None, "")))
+    return (str(data),)
+
+
+def parse_addons(raw) -> tuple:
+    """Addons are stored comma separated."""
+    return tuple(sorted(a.strip() for a in (raw or "").split(",") if a.strip()))
+
+
+# ---- aggregation ------------------------------------------------------------
+
+def _aggregate(branch_id) -> list:
+    rows = (
+        OrderItem.objects
+        .filter(order__branch_id=branch_id, order__status__in=KITCHEN_STATUSES)
+        .values("product_id", "product__name", "options", "addons")
+        .annotate(qty=Sum("quantity"), orders=Count("order_id", distinct=True))
+        .order_by()
+    )
+    merged = {}
+    for r in rows:
+        options = parse_options(r["options"])
+        addons = parse_addons(r["addons"])
+        key = (r["product_id"], options, addons)
+        entry = merged.get(key)
+        if entry is None:
+            merged[key] = {
+                "product_id": r["product_id"],
+                "product": r["product__name"],
+                "options": list(options),
+                "addons": list(addons),
+                "qty": r["qty"] or 0,
+                "orders": r["orders"] or 0,
+            }
+        else:
+            # نفس الاختيارات بصيغة نصية مختلفة؛ عدد الطلبات تقريبي هنا
+            entry["qty"] += r["qty"] or 0
+            entry["orders"] += r["orders"] or 0
+    return sorted(merged.values(), key=lambda e: (-e["qty"], e["product"] or ""))
+
+
+def kitchen_summary(branch_id) -> list:
+    """Cached aggregated rows for one branch, largest quantities first."""
+    # المفتاح يتبع تسلسل الفرع: أي تغيير في طلب يجعل النسخة القديمة غير مقروءة في كل العمليات
+    key = _cache_key(branch_id, BranchOrderSequence.current(branch_id))
+    rows = cache.get(key)
+    if rows is None:
+        rows = _aggregate(branch_id)
+        cache.set(key, rows, KITCHEN_CACHE_TIMEOUT)
+    return rows
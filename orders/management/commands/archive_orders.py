@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.archive import archive_cutoff, archive_chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Move Delivered/Cancelled orders older than --days (default "
+        "ORDERS_ARCHIVE_AFTER_DAYS) to the archive tables, in chunks. "
+        "With --loop it keeps running and re-checks every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None)
+        parser.add_argument("--chunk", type=int, default=500, help="orders per transaction")
+        parser.add_argument("--pause", type=float, default=0.2, help="seconds between chunks")
+        parser.add_argument("--loop", action="store_true", help="run as a scheduled worker")
+        parser.add_argument("--interval", type=int, default=3600, help="seconds between runs with --loop")
+
+    def handle(self, *args, **opts):
+        while True:
+            moved = self._run_once(opts)
+            self.stdout.write(f"archived {moved} order(s)")
+            if not opts["loop"]:
+                return
+            time.sleep(opts["interval"])
+
+    def _run_once(self, opts):
+        cutoff = archive_cutoff(opts["days"])
+        total = 0
+        while True:
+            moved = archive_chunk(cutoff, opts["chunk"])
+            if not moved:
+                return total
+            total += moved
+            # نترك فرصة للاستعلامات الأخرى بين الدفعات
+            time.sleep(opts["pause"])
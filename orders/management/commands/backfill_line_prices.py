@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from orders.models import ArchivedOrderItem, OrderItem
+from orders.pricing import backfill_line_prices
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill unit_price/line_total on order lines (hot and archived) created "
+        "before the price snapshot existed, from the current menu, in chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk", type=int, default=1000, help="lines per UPDATE")
+        parser.add_argument("--pause", type=float, default=0.1, help="seconds between chunks")
+
+    def handle(self, *args, **opts):
+        for model in (OrderItem, ArchivedOrderItem):
+            filled = backfill_line_prices(model, chunk_size=opts["chunk"], pause=opts["pause"])
+            self.stdout.write(f"{model._meta.db_table}: filled {filled} line(s)")
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.printing import process_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Render queued kitchen tickets (ESC/POS or PDF) and send them to the "
+        "branch printers. With --loop it keeps polling every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=50, help="jobs claimed per round")
+        parser.add_argument("--loop", action="store_true", help="run as a worker process")
+        parser.add_argument("--interval", type=float, default=2, help="seconds between polls with --loop")
+
+    def handle(self, *args, **opts):
+        while True:
+            result = process_jobs(limit=opts["batch"])
+            if result["printed"] or result["failed"] or not opts["loop"]:
+                self.stdout.write(f"printed {result['printed']}, failed {result['failed']}")
+            if not opts["loop"]:
+                return
+            # دفعة ممتلئة: نكمل مباشرة بدل الانتظار
+            if result["printed"] + result["failed"] < opts["batch"]:
+                time.sleep(opts["interval"])
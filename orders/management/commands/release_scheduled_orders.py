@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.scheduling import release_due
+
+
+class Command(BaseCommand):
+    help = (
+        "Release pre-orders whose time has come (due time minus "
+        "ORDERS_SCHEDULE_LEAD_MINUTES) to the live board. "
+        "With --loop it keeps running and checks every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=500, help="orders per transaction")
+        parser.add_argument("--loop", action="store_true", help="run as a scheduler process")
+        parser.add_argument("--interval", type=float, default=15, help="seconds between checks with --loop")
+
+    def handle(self, *args, **opts):
+        while True:
+            released = release_due(batch=opts["batch"])
+            if released or not opts["loop"]:
+                self.stdout.write(f"released {released} order(s)")
+            if not opts["loop"]:
+                return
+            time.sleep(opts["interval"])
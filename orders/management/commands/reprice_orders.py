@@ -0,0 +1,40 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from orders.models import Order
+from orders.pricing import recalc_order_totals
+
+
+def _date(value):
+    try:
+        day = datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"invalid date: {value!r} (expected YYYY-MM-DD)")
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute order totals from their stored line totals, one UPDATE "
+        "per chunk. Lines older than the price snapshots are priced from the "
+        "current menu first; snapshotted lines are never repriced."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="orders created on/after YYYY-MM-DD")
+        parser.add_argument("--until", help="orders created before YYYY-MM-DD")
+        parser.add_argument("--branch", type=int, default=None)
+        parser.add_argument("--chunk", type=int, default=1000, help="orders per UPDATE")
+
+    def handle(self, *args, **opts):
+        qs = Order.objects.all()
+        if opts["since"]:
+            qs = qs.filter(created_at__gte=_date(opts["since"]))
+        if opts["until"]:
+            qs = qs.filter(created_at__lt=_date(opts["until"]))
+        if opts["branch"]:
+            qs = qs.filter(branch_id=opts["branch"])
+        changed = recalc_order_totals(qs, chunk_size=opts["chunk"])
+        self.stdout.write(f"repriced {changed} order(s)")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from orders.models import OrderItem
+from orders.pricing import snapshot_item_options
+
+
+class Command(BaseCommand):
+    help = (
+        "Create structured option rows (OrderItemOption) for order lines "
+        "that only have the legacy text options/addons. Safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk", type=int, default=1000, help="order lines per batch")
+
+    def handle(self, *args, **opts):
+        created = snapshot_item_options(OrderItem.objects.all(), chunk_size=opts["chunk"])
+        self.stdout.write(f"created {created} option row(s)")
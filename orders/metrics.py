@@ -0,0 +1,98 @@
+# orders/metrics.py
+"""
+Order lifecycle metrics in the Prometheus text format (served at /metrics).
+
+* ``hallaorder_order_status_seconds`` — histogram of the time an order spent
+  in a status before leaving it, per branch, order method and status.
+* ``hallaorder_orders_created_total`` / ``hallaorder_orders_cancelled_total``.
+
+Recorded with ``prometheus_client``.  They are fed from ``orders.services``
+and ``Order.save`` after the transaction commits, so every transition path
+is counted once.  With ``PROMETHEUS_MULTIPROC_DIR`` set (the Procfile does)
+every worker process writes its values to files in that directory and a
+scrape of any worker adds them all up; without it the values live in the
+process that recorded them (tests, ``runserver``).
+
+Alert example: ``histogram_quantile(0.95, sum by (branch, le)
+(rate(hallaorder_order_status_seconds_bucket{status="Preparing"}[15m])))``.
+"""
+import os
+
+from django.db import transaction
+from prometheus_client import CollectorRegistry, Counter, Histogram, disable_created_metrics, generate_latest
+from prometheus_client import multiprocess
+
+# بدون سلاسل *_created: لا تُجمع بين العمليات ولا تستخدمها التنبيهات
+disable_created_metrics()
+
+# حدود الفئات بالثواني: من نصف دقيقة إلى ساعتين
+DURATION_BUCKETS = (30, 60, 120, 300, 600, 900, 1200, 1800, 2700, 3600, 7200)
+LABELS = ("branch", "method")
+
+_registry = CollectorRegistry()
+COUNTERS = {
+    "hallaorder_orders_created_total": Counter(
+        "hallaorder_orders_created", "Orders created.", LABELS, registry=_registry,
+    ),
+    "hallaorder_orders_cancelled_total": Counter(
+        "hallaorder_orders_cancelled", "Orders cancelled.", LABELS, registry=_registry,
+    ),
+}
+STATUS_SECONDS = Histogram(
+    "hallaorder_order_status_seconds", "Time an order spent in a status before moving on.",
+    LABELS + ("status",), buckets=DURATION_BUCKETS, registry=_registry,
+)
+
+
+# ---- recording --------------------------------------------------------------
+
+def _labels(branch_id, order_method, status=None) -> tuple:
+    labels = (("branch", str(branch_id or "")), ("method", order_method or ""))
+    if status is not None:
+        labels += (("status", status),)
+    return labels
+
+
+def inc(name, labels, amount=1) -> None:
+    COUNTERS[name].labels(**dict(labels)).inc(amount)
+
+
+def observe(labels, seconds) -> None:
+    STATUS_SECONDS.labels(**dict(labels)).observe(seconds)
+
+
+def _record_events(events) -> None:
+    from .models import OrderStatus
+
+    for event in events:
+        if event.from_status and event.duration_seconds is not None:
+            observe(_labels(event.branch_id, event.order_method, event.from_status), event.duration_seconds)
+        if event.to_status == OrderStatus.CANCELLED:
+            inc("hallaorder_orders_cancelled_total", _labels(event.branch_id, event.order_method))
+        elif not event.from_status:
+            inc("hallaorder_orders_created_total", _labels(event.branch_id, event.order_method))
+
+
+def record_transitions(events) -> None:
+    """Count ``OrderStatusEvent`` objects once their transaction commits."""
+    events = list(events)
+    if events:
+        transaction.on_commit(lambda: _record_events(events))
+
+
+def reset() -> None:
+    """Forget this process's values (tests; files in multiprocess mode are kept)."""
+    for metric in (*COUNTERS.values(), STATUS_SECONDS):
+        metric.clear()
+
+
+# ---- exposition -------------------------------------------------------------
+
+def render() -> str:
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # سجل جديد لكل قراءة يجمع ملفات كل العمليات
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = _registry
+    return generate_latest(registry).decode()
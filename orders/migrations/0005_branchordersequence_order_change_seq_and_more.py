@@ -0,0 +1,34 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0002_restaurantverification'),
+        ('orders', '0004_alter_deliverydetails_delivery_time_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BranchOrderSequence',
+            fields=[
+                ('branch', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='order_sequence', serialize=False, to='restaurants.branch')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'order_branch_sequences',
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='change_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['branch', 'change_seq'], name='orders_branch__ac3029_idx'),
+        ),
+    ]
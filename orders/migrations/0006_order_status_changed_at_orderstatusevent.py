@@ -0,0 +1,38 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0002_restaurantverification'),
+        ('orders', '0005_branchordersequence_order_change_seq_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='status_changed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='OrderStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_method', models.CharField(blank=True, max_length=20)),
+                ('from_status', models.CharField(blank=True, max_length=20)),
+                ('to_status', models.CharField(choices=[('New', 'New'), ('Preparing', 'Preparing'), ('Ready', 'Ready'), ('OutForDelivery', 'Out for Delivery'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled')], max_length=20)),
+                ('duration_seconds', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_status_events', to='restaurants.branch')),
+                ('order', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='status_events', to='orders.order')),
+            ],
+            options={
+                'db_table': 'order_status_events',
+                'indexes': [models.Index(fields=['branch', 'from_status', 'created_at', 'duration_seconds'], name='order_statu_branch__5cf59e_idx'), models.Index(fields=['order', 'created_at'], name='order_statu_order_i_1b1eb0_idx')],
+            },
+        ),
+    ]
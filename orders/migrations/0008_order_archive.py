@@ -0,0 +1,121 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+ORDER_COLUMNS = (
+    "id, customer_id, guest_name, guest_phone, branch_id, status, total_price, "
+    "payment_method, order_method, created_at, updated_at, status_changed_at"
+)
+ITEM_COLUMNS = "id, order_id, product_id, quantity, options, addons"
+
+CREATE_VIEWS = [
+    f"""CREATE VIEW orders_history AS
+        SELECT {ORDER_COLUMNS}, 0 AS is_archived FROM orders
+        UNION ALL
+        SELECT {ORDER_COLUMNS}, 1 AS is_archived FROM orders_archive""",
+    f"""CREATE VIEW order_items_history AS
+        SELECT {ITEM_COLUMNS} FROM order_items
+        UNION ALL
+        SELECT {ITEM_COLUMNS} FROM order_items_archive""",
+]
+DROP_VIEWS = ["DROP VIEW IF EXISTS order_items_history", "DROP VIEW IF EXISTS orders_history"]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('restaurants', '0002_restaurantverification'),
+        ('menu', '0007_alter_product_category'),
+        ('orders', '0007_order_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderHistory',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('guest_name', models.CharField(max_length=100, null=True)),
+                ('guest_phone', models.CharField(max_length=15, null=True)),
+                ('status', models.CharField(choices=[('New', 'New'), ('Preparing', 'Preparing'), ('Ready', 'Ready'), ('OutForDelivery', 'Out for Delivery'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled')], max_length=20)),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('payment_method', models.CharField(choices=[('Cash', 'Cash'), ('Online', 'Online')], max_length=10)),
+                ('order_method', models.CharField(choices=[('delivery', 'Delivery'), ('pickup', 'Pickup'), ('dine_in', 'Dine-in')], max_length=20, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('status_changed_at', models.DateTimeField(null=True)),
+                ('is_archived', models.BooleanField()),
+            ],
+            options={
+                'db_table': 'orders_history',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderItemHistory',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.PositiveIntegerField()),
+                ('options', models.TextField()),
+                ('addons', models.TextField()),
+            ],
+            options={
+                'db_table': 'order_items_history',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('guest_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('guest_phone', models.CharField(blank=True, max_length=15, null=True)),
+                ('status', models.CharField(choices=[('New', 'New'), ('Preparing', 'Preparing'), ('Ready', 'Ready'), ('OutForDelivery', 'Out for Delivery'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled')], max_length=20)),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('payment_method', models.CharField(choices=[('Cash', 'Cash'), ('Online', 'Online')], default='Cash', max_length=10)),
+                ('order_method', models.CharField(blank=True, choices=[('delivery', 'Delivery'), ('pickup', 'Pickup'), ('dine_in', 'Dine-in')], max_length=20, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('status_changed_at', models.DateTimeField(blank=True, null=True)),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('details', models.JSONField(blank=True, default=dict)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to='restaurants.branch')),
+                ('customer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_orders', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'orders_archive',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('options', models.TextField(blank=True)),
+                ('addons', models.TextField(blank=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='orders.archivedorder')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_order_items', to='menu.product')),
+            ],
+            options={
+                'db_table': 'order_items_archive',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['branch', '-created_at'], name='orders_arch_branch__2c9adf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['created_at'], name='orders_arch_created_66e297_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['customer', '-created_at'], name='orders_arch_custome_00eaf6_idx'),
+        ),
+        migrations.RunSQL(CREATE_VIEWS, DROP_VIEWS),
+    ]
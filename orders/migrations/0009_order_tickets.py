@@ -0,0 +1,77 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+OLD_ORDER_COLUMNS = (
+    "id, customer_id, guest_name, guest_phone, branch_id, status, total_price, "
+    "payment_method, order_method, created_at, updated_at, status_changed_at"
+)
+ORDER_COLUMNS = OLD_ORDER_COLUMNS + ", ticket_day, ticket_number"
+
+
+def _orders_view(columns):
+    return f"""CREATE VIEW orders_history AS
+        SELECT {columns}, 0 AS is_archived FROM orders
+        UNION ALL
+        SELECT {columns}, 1 AS is_archived FROM orders_archive"""
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0002_restaurantverification'),
+        ('orders', '0008_order_archive'),
+    ]
+
+    operations = [
+        # الجدول يتغير؛ نعيد إنشاء العرض بعد إضافة الأعمدة
+        migrations.RunSQL("DROP VIEW IF EXISTS orders_history", _orders_view(OLD_ORDER_COLUMNS)),
+        migrations.CreateModel(
+            name='BranchTicketCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('last', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'order_ticket_counters',
+            },
+        ),
+        migrations.AddField(
+            model_name='archivedorder',
+            name='ticket_day',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedorder',
+            name='ticket_number',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='ticket_day',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='ticket_number',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('branch', 'ticket_day', 'ticket_number'), name='uniq_order_ticket_per_branch_day'),
+        ),
+        migrations.AddField(
+            model_name='branchticketcounter',
+            name='branch',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ticket_counters', to='restaurants.branch'),
+        ),
+        migrations.AddConstraint(
+            model_name='branchticketcounter',
+            constraint=models.UniqueConstraint(fields=('branch', 'day'), name='uniq_ticket_counter_branch_day'),
+        ),
+        migrations.RunSQL(_orders_view(ORDER_COLUMNS), "DROP VIEW IF EXISTS orders_history"),
+    ]
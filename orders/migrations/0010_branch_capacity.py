@@ -0,0 +1,29 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0002_restaurantverification'),
+        ('orders', '0009_order_tickets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BranchCapacity',
+            fields=[
+                ('branch', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='capacity', serialize=False, to='restaurants.branch')),
+                ('paused', models.BooleanField(default=False)),
+                ('max_open_orders', models.PositiveIntegerField(default=40)),
+                ('max_open_items', models.PositiveIntegerField(default=150)),
+                ('base_prep_minutes', models.PositiveIntegerField(default=10)),
+                ('minutes_per_item', models.DecimalField(decimal_places=2, default=0.5, max_digits=5)),
+            ],
+            options={
+                'db_table': 'branch_capacity',
+            },
+        ),
+    ]
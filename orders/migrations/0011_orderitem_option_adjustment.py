@@ -0,0 +1,37 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:35
+
+from django.db import migrations, models
+
+
+OLD_ITEM_COLUMNS = "id, order_id, product_id, quantity, options, addons"
+ITEM_COLUMNS = OLD_ITEM_COLUMNS + ", option_adjustment"
+
+
+def _items_view(columns):
+    return f"""CREATE VIEW order_items_history AS
+        SELECT {columns} FROM order_items
+        UNION ALL
+        SELECT {columns} FROM order_items_archive"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_branch_capacity'),
+    ]
+
+    operations = [
+        # الجدول يتغير؛ نعيد إنشاء العرض بعد إضافة العمود
+        migrations.RunSQL("DROP VIEW IF EXISTS order_items_history", _items_view(OLD_ITEM_COLUMNS)),
+        migrations.AddField(
+            model_name='archivedorderitem',
+            name='option_adjustment',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='option_adjustment',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunSQL(_items_view(ITEM_COLUMNS), "DROP VIEW IF EXISTS order_items_history"),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0007_alter_product_category'),
+        ('orders', '0011_orderitem_option_adjustment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderItemOption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_name', models.CharField(blank=True, max_length=100)),
+                ('option_name', models.CharField(max_length=100)),
+                ('price_adjustment', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='menu.optiongroup')),
+                ('option', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='menu.option')),
+                ('order_item', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='selected_options', to='orders.orderitem')),
+            ],
+            options={
+                'db_table': 'order_item_options',
+                'indexes': [models.Index(fields=['group_name', 'option_name'], name='order_item__group_n_fbbe79_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+OLD_ITEM_COLUMNS = "id, order_id, product_id, quantity, options, addons, option_adjustment"
+ITEM_COLUMNS = OLD_ITEM_COLUMNS + ", unit_price, line_total"
+
+
+def _items_view(columns):
+    return f"""CREATE VIEW order_items_history AS
+        SELECT {columns} FROM order_items
+        UNION ALL
+        SELECT {columns} FROM order_items_archive"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_order_item_options'),
+    ]
+
+    operations = [
+        # الجدول يتغير؛ نعيد إنشاء العرض بعد إضافة الأعمدة
+        migrations.RunSQL("DROP VIEW IF EXISTS order_items_history", _items_view(OLD_ITEM_COLUMNS)),
+        migrations.AddField(
+            model_name='archivedorderitem',
+            name='line_total',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedorderitem',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='line_total',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunSQL(_items_view(ITEM_COLUMNS), "DROP VIEW IF EXISTS order_items_history"),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0002_restaurantverification'),
+        ('orders', '0013_orderitem_unit_price'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedorder',
+            name='status',
+            field=models.CharField(choices=[('Scheduled', 'Scheduled'), ('New', 'New'), ('Preparing', 'Preparing'), ('Ready', 'Ready'), ('OutForDelivery', 'Out for Delivery'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('Scheduled', 'Scheduled'), ('New', 'New'), ('Preparing', 'Preparing'), ('Ready', 'Ready'), ('OutForDelivery', 'Out for Delivery'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled')], default='New', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='orderstatusevent',
+            name='to_status',
+            field=models.CharField(choices=[('Scheduled', 'Scheduled'), ('New', 'New'), ('Preparing', 'Preparing'), ('Ready', 'Ready'), ('OutForDelivery', 'Out for Delivery'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='ScheduledOrder',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='schedule', serialize=False, to='orders.order')),
+                ('due_at', models.DateTimeField()),
+                ('release_at', models.DateTimeField()),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scheduled_orders', to='restaurants.branch')),
+            ],
+            options={
+                'db_table': 'order_schedule',
+                'indexes': [models.Index(fields=['release_at'], name='order_sched_release_44ae2f_idx'), models.Index(fields=['branch', 'release_at'], name='order_sched_branch__ca6ac7_idx')],
+            },
+        ),
+    ]
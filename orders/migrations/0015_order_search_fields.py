@@ -0,0 +1,97 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:44
+
+import datetime
+import re
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+ORDER_COLUMNS = (
+    "id, customer_id, guest_name, guest_phone, branch_id, status, total_price, "
+    "payment_method, order_method, created_at, updated_at, status_changed_at, ticket_day, ticket_number"
+)
+ORDERS_VIEW = f"""CREATE VIEW orders_history AS
+    SELECT {ORDER_COLUMNS}, 0 AS is_archived FROM orders
+    UNION ALL
+    SELECT {ORDER_COLUMNS}, 1 AS is_archived FROM orders_archive"""
+
+BACKFILL_DAYS = 31  # نافذة البحث القصوى؛ الأقدم لا يظهر في البحث أصلًا
+BACKFILL_CHUNK = 1000
+
+# نسخة ثابتة من orders.search وقت كتابة الهجرة: تعديل الوحدة لاحقًا لا يغيّر ما تفعله الهجرة
+DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+ARABIC_MARKS = re.compile("[ؐ-ًؚ-ٰٟۖ-ۭـ]")
+ARABIC_LETTERS = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي", "ئ": "ي", "ؤ": "و", "ة": "ه"})
+
+
+def normalize_phone(value):
+    digits = re.sub(r"\D", "", str(value or "").translate(DIGITS))
+    if digits.startswith("00966"):
+        digits = "0" + digits[5:]
+    elif digits.startswith("966") and len(digits) > 9:
+        digits = "0" + digits[3:]
+    elif len(digits) == 9 and digits.startswith("5"):
+        digits = "0" + digits
+    return digits[:15]
+
+
+def normalize_name(value):
+    text = ARABIC_MARKS.sub("", str(value or "")).translate(ARABIC_LETTERS).casefold()
+    return " ".join(text.split())[:100]
+
+
+def backfill_recent(apps, schema_editor):
+    Order = apps.get_model("orders", "Order")
+    since = timezone.now() - datetime.timedelta(days=BACKFILL_DAYS)
+    rows = Order.objects.filter(created_at__gte=since).order_by("pk").values_list(
+        "pk", "guest_name", "guest_phone",
+        "customer__first_name", "customer__last_name", "customer__username", "customer__profile__phone",
+    )
+    last_pk = 0
+    while True:
+        chunk = list(rows.filter(pk__gt=last_pk)[:BACKFILL_CHUNK])
+        if not chunk:
+            return
+        last_pk = chunk[-1][0]
+        updates = []
+        for pk, guest_name, guest_phone, first, last, username, profile_phone in chunk:
+            name = guest_name or " ".join(x for x in (first, last) if x) or username
+            updates.append(Order(
+                pk=pk, phone_digits=normalize_phone(guest_phone or profile_phone), name_search=normalize_name(name),
+            ))
+        # دفعة واحدة لكل كتلة بدل UPDATE لكل طلب
+        Order.objects.bulk_update(updates, ["phone_digits", "name_search"], batch_size=BACKFILL_CHUNK)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0014_scheduled_orders'),
+        ('users', '0004_alter_profile_role'),
+    ]
+
+    operations = [
+        # الجدول يتغير؛ نعيد إنشاء العرض بعد إضافة الأعمدة (بنفس أعمدته)
+        migrations.RunSQL("DROP VIEW IF EXISTS orders_history", ORDERS_VIEW),
+        migrations.AddField(
+            model_name='order',
+            name='name_search',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='phone_digits',
+            field=models.CharField(blank=True, default='', max_length=15),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['branch', 'phone_digits', 'created_at'], name='orders_branch__0be16c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['branch', 'name_search', 'created_at'], name='orders_branch__8e0336_idx'),
+        ),
+        migrations.RunSQL(ORDERS_VIEW, "DROP VIEW IF EXISTS orders_history"),
+        migrations.RunPython(backfill_recent, migrations.RunPython.noop),
+    ]
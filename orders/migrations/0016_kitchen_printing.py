@@ -0,0 +1,51 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0002_restaurantverification'),
+        ('orders', '0015_order_search_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Printer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('transport', models.CharField(choices=[('network', 'Network (raw TCP, host:port)'), ('file', 'Spool directory')], default='network', max_length=10)),
+                ('address', models.CharField(max_length=255)),
+                ('format', models.CharField(choices=[('escpos', 'ESC/POS'), ('pdf', 'PDF')], default='escpos', max_length=10)),
+                ('encoding', models.CharField(default='cp864', max_length=20)),
+                ('codepage', models.PositiveSmallIntegerField(default=37)),
+                ('is_active', models.BooleanField(default=True)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='printers', to='restaurants.branch')),
+            ],
+            options={
+                'db_table': 'order_printers',
+            },
+        ),
+        migrations.CreateModel(
+            name='PrintJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('printing', 'Printing'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('printed_at', models.DateTimeField(blank=True, null=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='print_jobs', to='orders.order')),
+                ('printer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='orders.printer')),
+            ],
+            options={
+                'db_table': 'order_print_jobs',
+                'indexes': [models.Index(fields=['status', 'available_at'], name='order_print_status_bd4935_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.23 on 2026-10-18 09:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+ITEM_COLUMNS = (
+    "id, order_id, product_id, quantity, options, addons, option_adjustment, unit_price, line_total"
+)
+CREATE_ITEMS_VIEW = f"""CREATE VIEW order_items_history AS
+    SELECT {ITEM_COLUMNS} FROM order_items
+    UNION ALL
+    SELECT {ITEM_COLUMNS} FROM order_items_archive"""
+DROP_ITEMS_VIEW = "DROP VIEW IF EXISTS order_items_history"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0007_alter_product_category'),
+        ('orders', '0016_kitchen_printing'),
+    ]
+
+    operations = [
+        # الجدول يُعاد بناؤه على SQLite؛ العرض يُحذف قبله ويُنشأ بعده
+        migrations.RunSQL(DROP_ITEMS_VIEW, CREATE_ITEMS_VIEW),
+        migrations.AlterField(
+            model_name='archivedorderitem',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_order_items', to='menu.product'),
+        ),
+        migrations.RunSQL(CREATE_ITEMS_VIEW, DROP_ITEMS_VIEW),
+    ]
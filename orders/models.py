@@ -1,12 +1,18 @@
 # orders/models.py
 # orders/models.py
-from django.db import models
+from decimal import Decimal
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.auth.models import User
 from restaurants.models import Branch
 from menu.models import Product
 # -------- choices --------
 class OrderStatus(models.TextChoices):
+    # طلب مسبق ينتظر وقت إطلاقه إلى اللوحة (orders.scheduling)
+    SCHEDULED = "Scheduled", "Scheduled"
     NEW = "New", "New"
     PREPARING = "Preparing", "Preparing"
     READY = "Ready", "Ready"
@@ -20,6 +26,93 @@ class PaymentMethod(models.TextChoices):
     ONLINE = "Online", "Online"
 
 # -------- core models --------
+class BranchOrderSequence(models.Model):
+    """
+    Monotonic per-branch change counter.  Every write that changes what the
+    board shows takes the next value and stamps it on ``Order.change_seq``,
+    so pollers can ask for "everything after N".
+    """
+    branch = models.OneToOneField(
+        Branch, on_delete=models.CASCADE, primary_key=True, related_name="order_sequence"
+    )
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = "order_branch_sequences"
+
+    @classmethod
+    def current(cls, branch_id) -> int:
+        return cls.objects.filter(branch_id=branch_id).values_list("value", flat=True).first() or 0
+
+    @classmethod
+    def next_value(cls, branch_id) -> int:
+        """
+        Reserve the next value.  Call inside the transaction that writes the
+        order: the row lock is held until commit, so changes become visible
+        in sequence order and a cursor never skips a late commit.  Because
+        of that lock, take it as late as possible in long transactions (see
+        ``Order.save(defer_change_seq=True)``).
+        """
+        with transaction.atomic():
+            cls.objects.get_or_create(branch_id=branch_id)
+            cls.objects.filter(branch_id=branch_id).update(value=F("value") + 1)
+            return cls.objects.filter(branch_id=branch_id).values_list("value", flat=True).get()
+
+
+class BranchTicketCounter(models.Model):
+    """
+    Highest ticket number handed out to a branch on a given day.
+    Workers reserve numbers in blocks (see orders.tickets), so this row is
+    touched once per block rather than once per order.
+    """
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name="ticket_counters")
+    day = models.DateField()
+    last = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "order_ticket_counters"
+        constraints = [
+            models.UniqueConstraint(fields=["branch", "day"], name="uniq_ticket_counter_branch_day"),
+        ]
+
+    @classmethod
+    def reserve(cls, branch_id, day, size: int) -> int:
+        """Reserve ``size`` consecutive numbers; returns the first one."""
+        rows = cls.objects.filter(branch_id=branch_id, day=day)
+        with transaction.atomic():
+            # نبدأ بالتحديث (قفل كتابة مباشرة) بدل قراءة ثم كتابة
+            if not rows.update(last=F("last") + size):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(branch_id=branch_id, day=day, last=size)
+                except IntegrityError:
+                    # عامل آخر أنشأ صف اليوم في نفس اللحظة
+                    rows.update(last=F("last") + size)
+            last = rows.values_list("last", flat=True).get()
+        return last - size + 1
+
+
+class BranchCapacity(models.Model):
+    """
+    Kitchen limits of a branch.  Branches without a row use the defaults.
+    The storefront reads the derived accepting/ETA flag through
+    orders.capacity, which caches only the queue counts.
+    """
+    branch = models.OneToOneField(Branch, on_delete=models.CASCADE, primary_key=True, related_name="capacity")
+    # إيقاف يدوي للطلب أونلاين
+    paused = models.BooleanField(default=False)
+    max_open_orders = models.PositiveIntegerField(default=40)
+    max_open_items = models.PositiveIntegerField(default=150)
+    base_prep_minutes = models.PositiveIntegerField(default=10)
+    minutes_per_item = models.DecimalField(max_digits=5, decimal_places=2, default=0.5)
+
+    class Meta:
+        db_table = "branch_capacity"
+
+    def __str__(self):
+        return f"Capacity of {self.branch}"
+
+
 class Order(models.Model): 
     DELIVERY = 'delivery'
     PICKUP = 'pickup'
@@ -58,17 +151,134 @@ class Order(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # آخر قيمة من BranchOrderSequence لمسّت هذا الطلب (مؤشر التحديثات التزايدية)
+    change_seq = models.BigIntegerField(default=0)
+    # متى دخل الطلب حالته الحالية (لحساب مدة البقاء في كل حالة)
+    status_changed_at = models.DateTimeField(null=True, blank=True)
+    # يزيد مع أي تعديل على الطلب أو عناصره أو فاتورته (مفتاح الكاش و ETag)
+    version = models.PositiveIntegerField(default=1)
+    # رقم التذكرة اليومي للفرع (ينادى به العميل بدل رقم الطلب)
+    ticket_day = models.DateField(null=True, blank=True)
+    ticket_number = models.PositiveIntegerField(null=True, blank=True)
+    # نسخ مطبّعة للبحث من شاشة الكاشير (orders.search)
+    phone_digits = models.CharField(max_length=15, blank=True, default="")
+    name_search = models.CharField(max_length=100, blank=True, default="")
 
     class Meta:
         db_table = "orders"
         indexes = [
             models.Index(fields=["branch", "status", "-created_at"]),
             models.Index(fields=["created_at"]),
+            models.Index(fields=["branch", "change_seq"]),
+            models.Index(fields=["branch", "phone_digits", "created_at"]),
+            models.Index(fields=["branch", "name_search", "created_at"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["branch", "ticket_day", "ticket_number"], name="uniq_order_ticket_per_branch_day"
+            ),
         ]
 
     def __str__(self):
         return f"Order #{self.pk} — {self.get_status_display()}"
 
+    @property
+    def ticket(self) -> str:
+        from .tickets import format_ticket
+
+        return format_ticket(self.ticket_number) if self.ticket_number else f"#{self.pk}"
+
+    # change_seq of an order created with defer_change_seq until it is stamped
+    PENDING_CHANGE_SEQ = -1
+
+    def save(self, *args, defer_change_seq=False, **kwargs):
+        """
+        ``defer_change_seq=True`` creates the order without taking the
+        branch sequence; the caller stamps it with ``stamp_change_seq`` as
+        the last statement of its transaction (checkout), so the branch row
+        lock is not held while the rest of the order is written.
+        """
+        from .search import search_fields_for
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or {"guest_name", "guest_phone", "customer"} & set(update_fields):
+            for name, value in search_fields_for(self).items():
+                setattr(self, name, value)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "phone_digits", "name_search"}
+        if self._state.adding and not self.change_seq and self.branch_id:
+            from .metrics import record_transitions
+            from .tickets import allocate_ticket
+
+            with transaction.atomic():
+                if not self.ticket_number:
+                    self.ticket_day, self.ticket_number = allocate_ticket(self.branch_id)
+                if defer_change_seq:
+                    # لا يظهر في تغييرات اللوحة حتى يُختم بتسلسله
+                    self.change_seq = self.PENDING_CHANGE_SEQ
+                else:
+                    self.change_seq = BranchOrderSequence.next_value(self.branch_id)
+                self.status_changed_at = self.status_changed_at or timezone.now()
+                super().save(*args, **kwargs)
+                event = OrderStatusEvent.objects.create(
+                    order=self,
+                    branch_id=self.branch_id,
+                    order_method=self.order_method or "",
+                    from_status="",
+                    to_status=self.status,
+                    created_at=self.status_changed_at,
+                )
+                record_transitions([event])
+            return
+        if not self._state.adding:
+            # الزيادة داخل UPDATE لا من النسخة المحمّلة: نسخة قديمة (بعد bump_version مثلًا)
+            # لا تعيد كتابة رقم نسخة سبق استخدامه في مفتاح الكاش و ETag
+            self.version = F("version") + 1
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "version", "change_seq"}
+            if self.branch_id:
+                # أي تعديل يظهر على اللوحة يحرّك عدّاد الفرع (نسخة اللوحة و ETag)
+                with transaction.atomic():
+                    self.change_seq = BranchOrderSequence.next_value(self.branch_id)
+                    super().save(*args, **kwargs)
+            else:
+                super().save(*args, **kwargs)
+            self.refresh_from_db(fields=["version"])
+            return
+        return super().save(*args, **kwargs)
+
+    @classmethod
+    def stamp_change_seq(cls, order) -> int:
+        """Give a new order (saved with ``defer_change_seq``) its sequence value."""
+        order.change_seq = BranchOrderSequence.next_value(order.branch_id)
+        cls.objects.filter(pk=order.pk).update(change_seq=order.change_seq)
+        return order.change_seq
+
+    @classmethod
+    def bump_version(cls, order_ids) -> int:
+        """
+        Invalidate cached renderings of the given orders and move their
+        branches' board version, so pollers and ETags see the change.
+        """
+        updated = 0
+        by_branch = {}
+        rows = cls.objects.filter(pk__in=order_ids).values_list("pk", "branch_id", "change_seq")
+        for pk, branch_id, seq in rows:
+            # طلب جديد ينتظر ختم تسلسله (stamp_change_seq): لا نأخذ قفل الفرع له الآن
+            by_branch.setdefault(branch_id if seq != cls.PENDING_CHANGE_SEQ else None, []).append(pk)
+        for branch_id, ids in by_branch.items():
+            with transaction.atomic():
+                fields = {"version": F("version") + 1, "updated_at": timezone.now()}
+                if branch_id:
+                    fields["change_seq"] = BranchOrderSequence.next_value(branch_id)
+                updated += cls.objects.filter(pk__in=ids).update(**fields)
+        return updated
+
+    @property
+    def status_entered_at(self):
+        return self.status_changed_at or self.created_at
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
@@ -81,6 +291,11 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     options = models.TextField(blank=True)  # store JSON string if you like
     addons  = models.TextField(blank=True)  # store JSON string if you like
+    # مجموع تعديلات أسعار الخيارات والإضافات للقطعة الواحدة
+    option_adjustment = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # سعر القطعة وقت البيع (شامل الخيارات) وإجمالي السطر؛ التقارير لا تعود لسعر المنتج الحالي
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
 
     class Meta:
         db_table = "order_items"
@@ -88,6 +303,93 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.order} / {self.product} × {self.quantity}"
 
+    def save(self, *args, **kwargs):
+        # سطر يُضاف بدون سعر (الإدارة مثلًا) يأخذ سعر المنتج الحالي
+        if self.unit_price is None and self.product_id:
+            self.unit_price = Decimal(self.product.price) + Decimal(self.option_adjustment or 0)
+        if self.unit_price is not None:
+            self.line_total = Decimal(self.unit_price) * (self.quantity or 0)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"quantity", "unit_price"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "unit_price", "line_total"}
+        super().save(*args, **kwargs)
+
+
+class OrderItemOption(models.Model):
+    """
+    One option/addon chosen on an order line, with the names and price
+    adjustment as they were at checkout.  Menu edits or deletions do not
+    change it, so option popularity and upsell revenue are plain SQL
+    aggregates (see reports ``api_sales_options``).
+
+    The line link has no database constraint: archived lines move to
+    ``order_items_archive`` with the same id and keep their options.
+    """
+    order_item = models.ForeignKey(
+        OrderItem, on_delete=models.DO_NOTHING, db_constraint=False, related_name="selected_options"
+    )
+    group = models.ForeignKey(
+        "menu.OptionGroup", on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    option = models.ForeignKey(
+        "menu.Option", on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    group_name = models.CharField(max_length=100, blank=True)  # فارغ للإضافات
+    option_name = models.CharField(max_length=100)
+    price_adjustment = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = "order_item_options"
+        indexes = [models.Index(fields=["group_name", "option_name"])]
+
+    def __str__(self):
+        label = f"{self.group_name}: {self.option_name}" if self.group_name else self.option_name
+        return f"{label} (+{self.price_adjustment})"
+
+
+class OrderStatusEvent(models.Model):
+    """
+    Append-only log of status transitions.  ``duration_seconds`` is the time
+    the order spent in ``from_status`` before this transition, so
+    time-in-status percentiles per branch are a range scan on one index.
+    """
+    # سجل للإلحاق فقط: يبقى حتى لو نُقل الطلب أو حُذف
+    order = models.ForeignKey(
+        Order, on_delete=models.DO_NOTHING, db_constraint=False, related_name="status_events"
+    )
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name="order_status_events")
+    order_method = models.CharField(max_length=20, blank=True)
+    from_status = models.CharField(max_length=20, blank=True)
+    to_status = models.CharField(max_length=20, choices=OrderStatus.choices)
+    duration_seconds = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = "order_status_events"
+        indexes = [
+            # covering index for per-branch time-in-status percentiles
+            models.Index(fields=["branch", "from_status", "created_at", "duration_seconds"]),
+            models.Index(fields=["order", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.order_id}: {self.from_status or '-'} → {self.to_status}"
+
+    @classmethod
+    def for_transition(cls, order_id, branch_id, order_method, from_status, to_status, entered_at, at):
+        duration = None
+        if from_status and entered_at:
+            duration = max(int((at - entered_at).total_seconds()), 0)
+        return cls(
+            order_id=order_id,
+            branch_id=branch_id,
+            order_method=order_method or "",
+            from_status=from_status or "",
+            to_status=to_status,
+            duration_seconds=duration,
+            created_at=at,
+        )
+
 
 class DeliveryDetails(models.Model):
     order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='delivery_details')
@@ -117,3 +419,204 @@ class DineInDetails(models.Model):
 
     def __str__(self):
         return f"Dine-in for {self.number_of_people} people"
+
+
+class ScheduledOrder(models.Model):
+    """
+    Pending pre-order.  The order stays in ``Scheduled`` (off the board)
+    until ``release_at`` = due time minus the lead time; the
+    ``release_scheduled_orders`` worker then moves it to ``New`` and deletes
+    this row, so the table only ever holds what is still waiting.
+    """
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name="schedule")
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name="scheduled_orders")
+    due_at = models.DateTimeField()
+    release_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "order_schedule"
+        indexes = [
+            models.Index(fields=["release_at"]),
+            models.Index(fields=["branch", "release_at"]),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.order_id} due {self.due_at:%Y-%m-%d %H:%M}"
+
+
+# -------- kitchen printing --------
+class Printer(models.Model):
+    """
+    A branch's kitchen printer.  Active printers get a ticket for every
+    order that moves to Preparing (see orders.printing).
+    """
+    class Transport(models.TextChoices):
+        NETWORK = "network", "Network (raw TCP, host:port)"
+        FILE = "file", "Spool directory"
+
+    class Format(models.TextChoices):
+        ESCPOS = "escpos", "ESC/POS"
+        PDF = "pdf", "PDF"
+
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name="printers")
+    name = models.CharField(max_length=100)
+    transport = models.CharField(max_length=10, choices=Transport.choices, default=Transport.NETWORK)
+    # host:port للشبكة (عادة 9100) أو مسار مجلد للملفات
+    address = models.CharField(max_length=255)
+    format = models.CharField(max_length=10, choices=Format.choices, default=Format.ESCPOS)
+    # ترميز النص وجدول الحروف في الطابعة (ESC t n)؛ 37 = PC864 العربي في طابعات Epson
+    encoding = models.CharField(max_length=20, default="cp864")
+    codepage = models.PositiveSmallIntegerField(default=37)
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        db_table = "order_printers"
+
+    def __str__(self):
+        return f"{self.name} ({self.branch})"
+
+
+class PrintJob(models.Model):
+    """One ticket for one printer.  Rendered and sent by the print worker."""
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        PRINTING = "printing", "Printing"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    printer = models.ForeignKey(Printer, on_delete=models.CASCADE, related_name="jobs")
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="print_jobs")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # لا يُعاد المحاولة قبل هذا الوقت؛ ووقت الحجز أثناء الطباعة
+    available_at = models.DateTimeField(default=timezone.now)
+    printed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "order_print_jobs"
+        indexes = [models.Index(fields=["status", "available_at"])]
+
+    def __str__(self):
+        return f"Print #{self.order_id} on {self.printer_id} ({self.status})"
+
+
+# -------- archive (cold storage) --------
+class ArchivedOrder(models.Model):
+    """
+    Delivered/Cancelled orders moved out of ``orders`` by the
+    ``archive_orders`` command.  Keeps the original id so invoices, payments
+    and wallet rows still point at it.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name="archived_orders"
+    )
+    guest_name = models.CharField(max_length=100, null=True, blank=True)
+    guest_phone = models.CharField(max_length=15, null=True, blank=True)
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name="archived_orders")
+    status = models.CharField(max_length=20, choices=OrderStatus.choices)
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    payment_method = models.CharField(max_length=10, choices=PaymentMethod.choices, default=PaymentMethod.CASH)
+    order_method = models.CharField(max_length=20, choices=Order.ORDER_METHOD_CHOICES, null=True, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    status_changed_at = models.DateTimeField(null=True, blank=True)
+    version = models.PositiveIntegerField(default=1)
+    ticket_day = models.DateField(null=True, blank=True)
+    ticket_number = models.PositiveIntegerField(null=True, blank=True)
+    # تفاصيل التوصيل/الاستلام/الجلوس كما كانت وقت الأرشفة
+    details = models.JSONField(default=dict, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    is_archived = True
+
+    class Meta:
+        db_table = "orders_archive"
+        indexes = [
+            models.Index(fields=["branch", "-created_at"]),
+            models.Index(fields=["created_at"]),
+            models.Index(fields=["customer", "-created_at"]),
+        ]
+
+    def __str__(self):
+        return f"Archived order #{self.pk} — {self.get_status_display()}"
+
+    ticket = Order.ticket
+
+    @property
+    def invoices(self):
+        from payments.models import Invoice
+
+        return Invoice.objects.filter(order_id=self.pk)
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name="items")
+    # الأرشيف لا يمنع حذف المنتج؛ السطر يبقى بسعره وإجماليه وقت البيع
+    product = models.ForeignKey(
+        Product, on_delete=models.SET_NULL, null=True, blank=True, related_name="archived_order_items"
+    )
+    quantity = models.PositiveIntegerField(default=1)
+    options = models.TextField(blank=True)
+    addons = models.TextField(blank=True)
+    option_adjustment = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        db_table = "order_items_archive"
+
+    def __str__(self):
+        return f"{self.order} / {self.product_id} × {self.quantity}"
+
+
+# -------- read models over hot + cold --------
+class OrderHistory(models.Model):
+    """
+    Read-only view over ``orders`` UNION ALL ``orders_archive`` (see
+    migration 0008).  Reports and history pages query this so archived
+    orders keep showing up; writes always go to ``Order``.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(User, on_delete=models.DO_NOTHING, null=True, related_name="+")
+    guest_name = models.CharField(max_length=100, null=True)
+    guest_phone = models.CharField(max_length=15, null=True)
+    branch = models.ForeignKey(Branch, on_delete=models.DO_NOTHING, related_name="+")
+    status = models.CharField(max_length=20, choices=OrderStatus.choices)
+    total_price = models.DecimalField(max_digits=12, decimal_places=2)
+    payment_method = models.CharField(max_length=10, choices=PaymentMethod.choices)
+    order_method = models.CharField(max_length=20, choices=Order.ORDER_METHOD_CHOICES, null=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    status_changed_at = models.DateTimeField(null=True)
+    ticket_day = models.DateField(null=True)
+    ticket_number = models.PositiveIntegerField(null=True)
+    is_archived = models.BooleanField()
+
+    class Meta:
+        managed = False
+        db_table = "orders_history"
+
+    def __str__(self):
+        return f"Order #{self.pk} — {self.get_status_display()}"
+
+    ticket = Order.ticket
+
+
+class OrderItemHistory(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(OrderHistory, on_delete=models.DO_NOTHING, related_name="items")
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, null=True, related_name="+")
+    quantity = models.PositiveIntegerField()
+    options = models.TextField()
+    addons = models.TextField()
+    option_adjustment = models.DecimalField(max_digits=10, decimal_places=2)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2, null=True)
+
+    class Meta:
+        managed = False
+        db_table = "order_items_history"
@@ -0,0 +1,213 @@
+# orders/pricing.py
+"""
+Order line prices and totals.
+
+A line's ``unit_price`` is ``product.price + option_adjustment`` at the time
+of sale, where ``OrderItem.option_adjustment`` is the per-unit price
+adjustment of the selected options/addons (``menu.Option``); ``line_total``
+is ``unit_price * quantity`` and an order total is the sum of its stored
+line totals.  These are snapshots: a later menu change never rewrites them.
+Only legacy lines without a snapshot (``unit_price`` NULL) are priced from
+the current menu, set-based, so a whole chunk costs a couple of UPDATEs.
+"""
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from menu.models import Option, Product
+
+from .kitchen import parse_addons, parse_options
+from .models import Order, OrderItem, OrderItemOption
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+ZERO = Decimal("0.00")
+
+
+# ---- option adjustments ----------------------------------------------------
+
+class OptionPrices:
+    """One restaurant's options, looked up by (group, name) or by name alone."""
+
+    def __init__(self, restaurant_id):
+        self.by_group = {}
+        self.by_name = {}
+        rows = Option.objects.filter(group__restaurant_id=restaurant_id).values_list(
+            "group_id", "group__name", "pk", "name", "price_adjustment"
+        )
+        for group_id, group, option_id, name, adjustment in rows:
+            entry = (group_id, group, option_id, name, adjustment or ZERO)
+            self.by_group[(group, name)] = entry
+            self.by_name.setdefault(name, entry)
+
+    def resolve(self, options_raw, addons_raw) -> list:
+        """
+        ``(group_id, group_name, option_id, option_name, adjustment)`` for
+        every selected option and addon.  Names no longer on the menu are
+        kept with no ids and a zero adjustment.
+        """
+        selected = []
+        for label in parse_options(options_raw):
+            group, sep, name = label.partition(": ")
+            if not sep:
+                group, name = "", label
+            entry = self.by_group.get((group, name)) or self.by_name.get(name)
+            selected.append(entry or (None, group, None, name, ZERO))
+        for name in parse_addons(addons_raw):
+            entry = self.by_name.get(name)
+            selected.append((None, "", entry[2], name, entry[4]) if entry else (None, "", None, name, ZERO))
+        return selected
+
+    def adjustment(self, options_raw, addons_raw) -> Decimal:
+        return sum((entry[4] for entry in self.resolve(options_raw, addons_raw)), ZERO)
+
+
+def item_option_rows(item, selected) -> list:
+    """Unsaved ``OrderItemOption`` snapshots of ``selected`` for a saved ``item``."""
+    return [
+        OrderItemOption(
+            order_item_id=item.pk, group_id=group_id, option_id=option_id,
+            group_name=group[:100], option_name=name[:100], price_adjustment=adjustment,
+        )
+        for group_id, group, option_id, name, adjustment in selected
+    ]
+
+
+def fill_option_adjustments(items) -> int:
+    """
+    Compute ``option_adjustment`` from the current menu for the legacy
+    ``items`` (an OrderItem queryset) that have no price snapshot yet.
+    Items are grouped by the resulting value, so it costs one UPDATE per
+    distinct adjustment, not one per row.
+    """
+    rows = items.filter(unit_price__isnull=True).values_list(
+        "pk", "options", "addons", "option_adjustment", "order__branch__restaurant_id"
+    )
+    prices = {}
+    changed = defaultdict(list)
+    for pk, options, addons, current, restaurant_id in rows:
+        if not (options or addons):
+            if current:
+                changed[ZERO].append(pk)
+            continue
+        if restaurant_id not in prices:
+            prices[restaurant_id] = OptionPrices(restaurant_id)
+        value = prices[restaurant_id].adjustment(options, addons)
+        if value != current:
+            changed[value].append(pk)
+    for value, pks in changed.items():
+        OrderItem.objects.filter(pk__in=pks).update(option_adjustment=value)
+    return sum(len(pks) for pks in changed.values())
+
+
+def snapshot_item_options(items, chunk_size=1000) -> int:
+    """
+    Create the missing ``OrderItemOption`` rows of older ``items`` from
+    their text ``options``/``addons``, priced from the current menu.
+    Returns the number of rows created.
+    """
+    items = (
+        items.exclude(options="", addons="")
+        .exclude(pk__in=OrderItemOption.objects.values("order_item_id"))
+        .order_by("pk")
+    )
+    prices = {}
+    created = 0
+    last_pk = 0
+    while True:
+        chunk = list(
+            items.filter(pk__gt=last_pk)
+            .values_list("pk", "options", "addons", "order__branch__restaurant_id")[:chunk_size]
+        )
+        if not chunk:
+            return created
+        last_pk = chunk[-1][0]
+        rows = []
+        for pk, options, addons, restaurant_id in chunk:
+            if restaurant_id not in prices:
+                prices[restaurant_id] = OptionPrices(restaurant_id)
+            rows += item_option_rows(OrderItem(pk=pk), prices[restaurant_id].resolve(options, addons))
+        created += len(OrderItemOption.objects.bulk_create(rows))
+
+
+# ---- totals ----------------------------------------------------------------
+
+def current_unit_price():
+    """A line's unit price from the current menu: ``product.price + option_adjustment``."""
+    price = Product.objects.filter(pk=OuterRef("product_id")).values("price")[:1]
+    return ExpressionWrapper(Subquery(price, output_field=MONEY) + F("option_adjustment"), output_field=MONEY)
+
+
+def fill_line_prices(items) -> int:
+    """Price the ``items`` without a snapshot from the current menu, in one UPDATE."""
+    unit = current_unit_price()
+    # سطر أرشيف حُذف منتجه لا سعر له في القائمة فيبقى بلا لقطة
+    return items.filter(unit_price__isnull=True, product_id__isnull=False).update(
+        unit_price=unit, line_total=ExpressionWrapper(unit * F("quantity"), output_field=MONEY)
+    )
+
+
+def items_total_subquery():
+    """Correlated subquery: the sum of ``OuterRef("pk")``'s line totals."""
+    total = (
+        OrderItem.objects.filter(order=OuterRef("pk"))
+        .order_by()
+        .values("order")
+        .annotate(total=Sum("line_total"))
+        .values("total")
+    )
+    return Coalesce(Subquery(total, output_field=MONEY), Value(ZERO), output_field=MONEY)
+
+
+def recalc_order_totals(queryset, chunk_size=1000, fill_options=True) -> int:
+    """
+    Set every order's ``total_price`` in ``queryset`` to the sum of its
+    stored line totals.  Walks the queryset by primary key in chunks; per
+    chunk, legacy lines get their snapshot first (``fill_line_prices``) and
+    one UPDATE sets the totals, touching only orders whose total actually
+    changes.  Returns the number of orders changed.
+    """
+    ids = queryset.order_by("pk").values_list("pk", flat=True)
+    changed = 0
+    last_pk = None
+    while True:
+        page = ids.filter(pk__gt=last_pk) if last_pk is not None else ids
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return changed
+        last_pk = chunk[-1]
+        with transaction.atomic():
+            items = OrderItem.objects.filter(order_id__in=chunk)
+            if fill_options:
+                fill_option_adjustments(items)
+            fill_line_prices(items)
+            new_total = items_total_subquery()
+            changed += (
+                Order.objects.filter(pk__in=chunk)
+                .exclude(total_price=new_total)
+                .update(total_price=new_total, version=F("version") + 1)
+            )
+
+
+def backfill_line_prices(model=OrderItem, chunk_size=1000, pause=0) -> int:
+    """
+    Fill ``unit_price``/``line_total`` on ``model`` rows (``OrderItem`` or
+    ``ArchivedOrderItem``) that predate them, from the current menu, one
+    UPDATE per chunk.  Returns the number of rows filled; rows the menu
+    cannot price (deleted product) are passed over, not retried.
+    """
+    pending = model.objects.filter(unit_price__isnull=True).order_by("pk").values_list("pk", flat=True)
+    filled = 0
+    last_pk = None
+    while True:
+        page = pending.filter(pk__gt=last_pk) if last_pk is not None else pending
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return filled
+        last_pk = chunk[-1]
+        filled += fill_line_prices(model.objects.filter(pk__in=chunk))
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,236 @@
+# orders/printing.py
+"""
+Kitchen tickets.
+
+When an order moves to Preparing, ``services`` calls ``enqueue_tickets``,
+which reads the active printers of the affected branches (one indexed
+query, so a printer added or deactivated in the admin applies to the very
+next order in every process) and inserts one ``PrintJob`` row per printer.
+The ``print_worker`` command claims pending jobs, renders them (ESC/POS
+bytes, or a PDF through Pillow) and sends them to the printer, in job
+order per printer.  A printer that fails keeps its remaining jobs for the
+next round; each job is retried with a growing delay up to MAX_ATTEMPTS.
+
+Transports: ``network`` writes the raw bytes to host:port (port 9100 on
+most kitchen printers); ``file`` drops one file per job into a directory,
+which is also what tests and printer-less setups use.
+"""
+import datetime
+import io
+import os
+import socket
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .kitchen import parse_addons, parse_options
+from .models import Order, Printer, PrintJob
+
+CLAIM_TIMEOUT = datetime.timedelta(minutes=2)
+MAX_ATTEMPTS = 5
+RETRY_DELAY_SECONDS = 15
+SOCKET_TIMEOUT = 5
+
+ESC, GS = b"\x1b", b"\x1d"
+ESCPOS_INIT = ESC + b"@"
+ESCPOS_CENTER, ESCPOS_LEFT = ESC + b"a\x01", ESC + b"a\x00"
+ESCPOS_BOLD_ON, ESCPOS_BOLD_OFF = ESC + b"E\x01", ESC + b"E\x00"
+ESCPOS_DOUBLE, ESCPOS_NORMAL = GS + b"!\x11", GS + b"!\x00"
+ESCPOS_FEED_CUT = b"\n\n\n" + GS + b"V\x42\x00"
+
+PDF_WIDTH_PX = 576  # 80 mm عند 203 نقطة/بوصة
+PDF_DPI = 203
+
+
+# ---- queue ------------------------------------------------------------------
+
+def branch_printer_ids(branch_ids) -> dict:
+    """``{branch_id: [printer ids]}`` of the active printers, read from the table every time."""
+    printers = defaultdict(list)
+    rows = Printer.objects.filter(branch_id__in=set(branch_ids), is_active=True).values_list("branch_id", "pk")
+    for branch_id, printer_id in rows.order_by("pk"):
+        printers[branch_id].append(printer_id)
+    return printers
+
+
+def enqueue_tickets(rows) -> int:
+    """Queue a ticket per active printer for each ``{"pk", "branch_id"}`` row."""
+    if not rows:
+        return 0
+    printers = branch_printer_ids(row["branch_id"] for row in rows)
+    jobs = [
+        PrintJob(printer_id=printer_id, order_id=row["pk"])
+        for row in rows
+        for printer_id in printers.get(row["branch_id"], ())
+    ]
+    PrintJob.objects.bulk_create(jobs)
+    return len(jobs)
+
+
+# ---- rendering --------------------------------------------------------------
+
+def ticket_lines(order) -> list:
+    """``(style, text)`` lines of a kitchen ticket; style is "title", "bold" or ""."""
+    method = dict(Order.ORDER_METHOD_CHOICES).get(order.order_method, order.order_method or "")
+    created = timezone.localtime(order.created_at)
+    lines = [("title", order.ticket), ("", f"{method}  {created:%H:%M}"), ("", "-" * 32)]
+    for item in order.items.all():
+        lines.append(("bold", f"{item.quantity} x {item.product.name}"))
+        for label in parse_options(item.options) + parse_addons(item.addons):
+            lines.append(("", f"   + {label}"))
+    dinein = getattr(order, "dinein_details", None)
+    if dinein is not None and dinein.special_requests:
+        lines += [("", "-" * 32), ("", dinein.special_requests)]
+    return lines
+
+
+def render_escpos(order, printer) -> bytes:
+    out = [ESCPOS_INIT, ESC + b"t" + bytes([printer.codepage])]
+    for style, text in ticket_lines(order):
+        data = text.encode(printer.encoding, errors="replace") + b"\n"
+        if style == "title":
+            out += [ESCPOS_CENTER, ESCPOS_DOUBLE, data, ESCPOS_NORMAL, ESCPOS_LEFT]
+        elif style == "bold":
+            out += [ESCPOS_BOLD_ON, data, ESCPOS_BOLD_OFF]
+        else:
+            out.append(data)
+    out.append(ESCPOS_FEED_CUT)
+    return b"".join(out)
+
+
+def _pdf_font(size):
+    from PIL import ImageFont
+
+    path = getattr(settings, "ORDERS_PRINT_FONT", None)
+    if path:
+        return ImageFont.truetype(path, size)
+    return ImageFont.load_default()
+
+
+def render_pdf(order, printer=None) -> bytes:
+    """
+    One-page raster PDF for printers that only accept PDF.  Arabic needs
+    ``ORDERS_PRINT_FONT`` pointing at a TTF that has Arabic glyphs.
+    """
+    return lines_to_pdf(ticket_lines(order))
+
+
+def lines_to_pdf(lines) -> bytes:
+    """Raster PDF of ``(style, text)`` lines, 80 mm wide (also used for invoices)."""
+    from PIL import Image, ImageDraw
+
+    fonts = {"title": _pdf_font(48), "bold": _pdf_font(28), "": _pdf_font(24)}
+    heights = [int(fonts[style].getbbox(text or " ")[3]) + 12 for style, text in lines]
+    image = Image.new("L", (PDF_WIDTH_PX, sum(heights) + 40), 255)
+    draw = ImageDraw.Draw(image)
+    y = 20
+    for (style, text), height in zip(lines, heights):
+        draw.text((16, y), text, fill=0, font=fonts[style])
+        y += height
+    buf = io.BytesIO()
+    image.save(buf, format="PDF", resolution=PDF_DPI)
+    return buf.getvalue()
+
+
+def render_job(job) -> bytes:
+    if job.printer.format == Printer.Format.PDF:
+        return render_pdf(job.order, job.printer)
+    return render_escpos(job.order, job.printer)
+
+
+# ---- transports -------------------------------------------------------------
+
+def send_network(address, data) -> None:
+    host, _, port = address.rpartition(":")
+    with socket.create_connection((host or address, int(port or 9100)), timeout=SOCKET_TIMEOUT) as sock:
+        sock.sendall(data)
+
+
+def send_file(directory, name, data) -> None:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    with open(path + ".part", "wb") as fh:
+        fh.write(data)
+    os.replace(path + ".part", path)
+
+
+def send_job(job, data) -> None:
+    printer = job.printer
+    if printer.transport == Printer.Transport.FILE:
+        ext = "pdf" if printer.format == Printer.Format.PDF else "bin"
+        send_file(printer.address, f"job-{job.pk:08d}-order-{job.order_id}.{ext}", data)
+    else:
+        send_network(printer.address, data)
+
+
+# ---- worker -----------------------------------------------------------------
+
+def claim_jobs(limit=50) -> list:
+    """
+    Mark up to ``limit`` due jobs as printing and return them.  A claim
+    expires after CLAIM_TIMEOUT, so jobs of a crashed worker come back.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            PrintJob.objects.filter(
+                status__in=(PrintJob.Status.PENDING, PrintJob.Status.PRINTING), available_at__lte=now,
+            )
+            .order_by("pk")
+            .select_for_update(skip_locked=True)
+            .values_list("pk", flat=True)[:limit]
+        )
+        PrintJob.objects.filter(pk__in=ids).update(
+            status=PrintJob.Status.PRINTING, available_at=now + CLAIM_TIMEOUT,
+        )
+    return list(
+        PrintJob.objects.filter(pk__in=ids)
+        .select_related("printer", "order", "order__dinein_details")
+        .prefetch_related("order__items__product")
+        .order_by("pk")
+    )
+
+
+def _finish(job, error=None):
+    """Record the outcome; on failure returns when the job is retried."""
+    now = timezone.now()
+    if error is None:
+        PrintJob.objects.filter(pk=job.pk).update(
+            status=PrintJob.Status.DONE, printed_at=now, attempts=job.attempts + 1, last_error="",
+        )
+        return None
+    attempts = job.attempts + 1
+    retry_at = now + datetime.timedelta(seconds=RETRY_DELAY_SECONDS * attempts)
+    PrintJob.objects.filter(pk=job.pk).update(
+        status=PrintJob.Status.FAILED if attempts >= MAX_ATTEMPTS else PrintJob.Status.PENDING,
+        attempts=attempts,
+        last_error=str(error)[:1000],
+        available_at=retry_at,
+    )
+    return retry_at
+
+
+def process_jobs(limit=50) -> dict:
+    """Print one batch.  Returns ``{"printed": n, "failed": n}``."""
+    by_printer = defaultdict(list)
+    for job in claim_jobs(limit):
+        by_printer[job.printer_id].append(job)
+
+    printed = failed = 0
+    for jobs in by_printer.values():
+        for i, job in enumerate(jobs):
+            try:
+                send_job(job, render_job(job))
+            except Exception as exc:
+                retry_at = _finish(job, exc)
+                failed += 1
+                # نحافظ على ترتيب التذاكر: باقي مهام هذه الطابعة تنتظر إعادة محاولة الأولى
+                PrintJob.objects.filter(pk__in=[j.pk for j in jobs[i + 1:]]).update(
+                    status=PrintJob.Status.PENDING, available_at=retry_at,
+                )
+                break
+            _finish(job)
+            printed += 1
+    return {"printed": printed, "failed": failed}
@@ -0,0 +1,101 @@
+# orders/scheduling.py
+"""
+Pre-orders.
+
+An order whose pickup/delivery/reservation time is further away than the
+lead time (``ORDERS_SCHEDULE_LEAD_MINUTES``) is created as ``Scheduled`` with
+a ``ScheduledOrder`` row keyed by its release time.  The
+``release_scheduled_orders`` worker wakes up every few seconds, takes the
+rows whose release time has passed (an index range scan, however many
+orders wait further ahead) and releases them per branch with one UPDATE
+each through ``services.release_orders``.  Several workers may run: rows
+are claimed with ``SKIP LOCKED`` where the database supports it.
+"""
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import OrderStatus, ScheduledOrder
+from .services import release_orders
+
+DEFAULT_LEAD_MINUTES = 30
+
+
+def lead_time() -> datetime.timedelta:
+    return datetime.timedelta(minutes=getattr(settings, "ORDERS_SCHEDULE_LEAD_MINUTES", DEFAULT_LEAD_MINUTES))
+
+
+def parse_due_time(value):
+    """``datetime-local`` form value (or ISO string) -> aware datetime, else None."""
+    due = parse_datetime((value or "").strip()) if value else None
+    if due is not None and timezone.is_naive(due):
+        due = timezone.make_aware(due)
+    return due
+
+
+# مفاتيح الوقت في session["order_data"] حسب طريقة الطلب
+ORDER_DATA_TIME_KEYS = {
+    "dine_in": ("dinein", "reservation_time"),
+    "pickup": ("pickup", "pickup_time"),
+    "delivery": ("delivery", "delivery_time"),
+}
+
+
+def due_time_from_order_data(order_data):
+    section, key = ORDER_DATA_TIME_KEYS.get((order_data or {}).get("order_method"), (None, None))
+    if not section:
+        return None
+    return parse_due_time((order_data.get(section) or {}).get(key))
+
+
+def initial_status(due_at, now=None) -> str:
+    """Scheduled if the order should not reach the board yet, else New."""
+    now = now or timezone.now()
+    if due_at is not None and due_at - lead_time() > now:
+        return OrderStatus.SCHEDULED
+    return OrderStatus.NEW
+
+
+def schedule_order(order, due_at) -> ScheduledOrder:
+    return ScheduledOrder.objects.create(
+        order=order, branch_id=order.branch_id, due_at=due_at, release_at=due_at - lead_time(),
+    )
+
+
+def _release_batch(now, batch) -> tuple:
+    """Claim up to ``batch`` due rows and release them; ``(claimed, released)``."""
+    with transaction.atomic():
+        due = list(
+            ScheduledOrder.objects.filter(release_at__lte=now)
+            .order_by("release_at")
+            .select_for_update(skip_locked=True)
+            .values_list("order_id", "branch_id")[:batch]
+        )
+        by_branch = defaultdict(list)
+        for order_id, branch_id in due:
+            by_branch[branch_id].append(order_id)
+        released = 0
+        for branch_id, ids in by_branch.items():
+            released += len(release_orders(branch_id, ids))
+        # الملغى أو المعدّل يدويًا يُحذف من الطابور أيضًا
+        ScheduledOrder.objects.filter(order_id__in=[order_id for order_id, _ in due]).delete()
+    return len(due), released
+
+
+def release_due(now=None, batch=500) -> int:
+    """
+    Release every pre-order whose release time has passed, ``batch`` rows
+    per transaction; returns the number released.
+    """
+    now = now or timezone.now()
+    total = 0
+    while True:
+        # نتوقف حين لا يبقى صف مستحق، لا حين يقل المُطلق عن الدفعة (الملغى يُحذف دون إطلاق)
+        claimed, released = _release_batch(now, batch)
+        total += released
+        if not claimed:
+            return total
@@ -0,0 +1,109 @@
+# orders/search.py
+"""
+Cashier order search ("the order for 05xxxxxxxx").
+
+Orders carry two normalized copies of the contact fields, filled on save:
+
+* ``phone_digits``: digits only (Arabic-Indic digits folded to ASCII),
+  Saudi ``+966``/``00966`` prefixes rewritten to the local ``0``;
+* ``name_search``: case-folded name with Arabic diacritics and tatweel
+  removed and letter variants unified (أ/إ/آ → ا, ى → ي, ة → ه ...).
+
+Both are indexed as ``(branch, column, created_at)``, so a prefix match
+(``LIKE 'q%'``) inside one branch and a date window is an index range
+scan.  Tickets use the existing ``(branch, ticket_day, ticket_number)``
+unique index.
+"""
+import datetime
+import re
+
+from django.utils import timezone
+
+from .models import Order
+
+DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+ARABIC_MARKS = re.compile("[ؐ-ًؚ-ٰٟۖ-ۭـ]")
+ARABIC_LETTERS = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي", "ئ": "ي", "ؤ": "و", "ة": "ه"})
+TICKET_RE = re.compile(r"^([A-Za-z])-?(\d{1,3})$")
+
+MIN_PHONE_PREFIX = 3
+MIN_NAME_PREFIX = 2
+MAX_DAYS = 31
+RESULT_LIMIT = 20
+
+
+# ---- normalization ----------------------------------------------------------
+
+def normalize_phone(value) -> str:
+    digits = re.sub(r"\D", "", str(value or "").translate(DIGITS))
+    if digits.startswith("00966"):
+        digits = "0" + digits[5:]
+    elif digits.startswith("966") and len(digits) > 9:
+        digits = "0" + digits[3:]
+    elif len(digits) == 9 and digits.startswith("5"):
+        digits = "0" + digits
+    return digits[:15]
+
+
+def normalize_name(value) -> str:
+    text = ARABIC_MARKS.sub("", str(value or "")).translate(ARABIC_LETTERS).casefold()
+    return " ".join(text.split())[:100]
+
+
+def search_fields_for(order) -> dict:
+    """
+    Normalized ``phone_digits``/``name_search`` for ``order``.  Guest fields
+    win; a registered customer's profile phone and name are read only
+    while the normalized fields are still empty, so later saves stay cheap.
+    """
+    phone, name = order.guest_phone, order.guest_name
+    if order.customer_id and not (phone and name):
+        if order.phone_digits or order.name_search:
+            return {"phone_digits": order.phone_digits, "name_search": order.name_search}
+        customer = order.customer
+        profile = getattr(customer, "profile", None)
+        phone = phone or getattr(profile, "phone", "")
+        name = name or customer.get_full_name() or customer.get_username()
+    return {"phone_digits": normalize_phone(phone), "name_search": normalize_name(name)}
+
+
+# ---- search -----------------------------------------------------------------
+
+def _ticket_number(letter, number) -> int:
+    return (ord(letter.upper()) - ord("A")) * 999 + int(number)
+
+
+def search_orders(branch_id, query, days=1, limit=RESULT_LIMIT):
+    """
+    Orders of ``branch_id`` from the last ``days`` days matching ``query``:
+    ``A-042`` is a ticket, a number of up to four digits not starting with
+    0 is a ticket or order id, other numbers a phone prefix, anything else
+    a name prefix.
+    """
+    query = (query or "").strip().translate(DIGITS)
+    if not query:
+        return Order.objects.none()
+    days = max(1, min(int(days or 1), MAX_DAYS))
+    since = timezone.now() - datetime.timedelta(days=days)
+    base = Order.objects.filter(branch_id=branch_id, created_at__gte=since)
+
+    ticket = TICKET_RE.match(query)
+    if ticket:
+        qs = base.filter(
+            ticket_day__gte=timezone.localdate() - datetime.timedelta(days=days),
+            ticket_number=_ticket_number(*ticket.groups()),
+        )
+    elif query.isdigit() and not query.startswith("0") and len(query) <= 4:
+        number = int(query)
+        qs = base.filter(ticket_number=number) | base.filter(pk=number)
+    elif normalize_phone(query) and not re.search(r"[^\d\s+()-]", query):
+        phone = normalize_phone(query)
+        if len(phone) < MIN_PHONE_PREFIX:
+            return Order.objects.none()
+        qs = base.filter(phone_digits__startswith=phone)
+    else:
+        name = normalize_name(query)
+        if len(name) < MIN_NAME_PREFIX:
+            return Order.objects.none()
+        qs = base.filter(name_search__startswith=name)
+    return qs.select_related("branch").order_by("-created_at")[:limit]
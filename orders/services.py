@@ -0,0 +1,225 @@
+# orders/services.py
+"""
+Order status writes.
+
+Every path that changes an order's status (board views, admin actions,
+payment callbacks) goes through here so the per-branch change sequence,
+``updated_at`` and the live-board events stay consistent.
+
+Board transitions are compare-and-swap: the UPDATE only matches rows still
+in the status the cashier saw (``WHERE status = expected``), so two screens
+pressing "advance" on the same ticket cannot skip a state or undo a cancel.
+Lock order is always branch sequence row first, then order rows.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .events import publish_order_event, ORDER_ADVANCED, ORDER_CANCELLED, ORDER_CREATED
+from .models import BranchOrderSequence, Order, OrderStatus, OrderStatusEvent
+from .metrics import record_transitions
+from .printing import enqueue_tickets
+
+
+STATUS_FLOW = {
+    OrderStatus.NEW: OrderStatus.PREPARING,
+    OrderStatus.PREPARING: OrderStatus.READY,
+    OrderStatus.READY: OrderStatus.DELIVERED,
+}
+
+CANCELLABLE_STATUSES = (
+    OrderStatus.SCHEDULED,
+    OrderStatus.NEW,
+    OrderStatus.PREPARING,
+    OrderStatus.READY,
+    OrderStatus.OUT_FOR_DELIVERY,
+)
+
+
+def _event_kind(status) -> str:
+    return ORDER_CANCELLED if status == OrderStatus.CANCELLED else ORDER_ADVANCED
+
+
+def _publish_all(order_ids, kind):
+    for order in Order.objects.filter(pk__in=order_ids).only("pk", "branch_id"):
+        publish_order_event(order, kind)
+
+
+def _transition_rows(queryset):
+    """Rows needed to log a transition, read under a row lock."""
+    return list(
+        queryset.select_for_update().values(
+            "pk", "branch_id", "order_method", "status", "status_changed_at", "created_at"
+        )
+    )
+
+
+def _log_rows(rows, to_status, at):
+    events = OrderStatusEvent.objects.bulk_create([
+        OrderStatusEvent.for_transition(
+            row["pk"], row["branch_id"], row["order_method"], row["status"], to_status,
+            row["status_changed_at"] or row["created_at"], at,
+        )
+        for row in rows
+    ])
+    record_transitions(events)
+
+
+def _record_transition(rows, to_status, at):
+    """Log the transition and queue kitchen tickets for orders entering Preparing."""
+    _log_rows(rows, to_status, at)
+    if to_status == OrderStatus.PREPARING:
+        enqueue_tickets(rows)
+
+
+def set_order_status(order: Order, status: str) -> Order:
+    """Set one order's status unconditionally (payment callbacks)."""
+    now = timezone.now()
+    with transaction.atomic():
+        seq = BranchOrderSequence.next_value(order.branch_id)
+        # نقرأ الحالة الحالية من القاعدة لا من النسخة المحمّلة
+        rows = _transition_rows(Order.objects.filter(pk=order.pk).exclude(status=status))
+        fields = {"status": status, "change_seq": seq, "updated_at": now, "version": F("version") + 1}
+        if rows:
+            fields["status_changed_at"] = now
+            _record_transition(rows, status, now)
+        Order.objects.filter(pk=order.pk).update(**fields)
+    order.refresh_from_db(fields=list(fields))
+    publish_order_event(order, _event_kind(status))
+    return order
+
+
+def bulk_set_status(queryset, status: str) -> int:
+    """
+    Admin bulk action: set the status of every order in ``queryset``.
+    One UPDATE per branch (sharing that branch's next sequence value) and
+    one ``bulk_create`` for the event log.  Orders already in ``status`` are
+    left untouched.
+    """
+    now = timezone.now()
+    updated = 0
+    order_ids = []
+    with transaction.atomic():
+        queryset = queryset.exclude(status=status)
+        branch_ids = list(queryset.order_by().values_list("branch_id", flat=True).distinct())
+        for branch_id in branch_ids:
+            seq = BranchOrderSequence.next_value(branch_id)
+            rows = _transition_rows(queryset.filter(branch_id=branch_id).order_by())
+            ids = [row["pk"] for row in rows]
+            _record_transition(rows, status, now)
+            updated += Order.objects.filter(pk__in=ids).update(
+                status=status, change_seq=seq, status_changed_at=now, updated_at=now,
+                version=F("version") + 1,
+            )
+            order_ids.extend(ids)
+    _publish_all(order_ids, _event_kind(status))
+    return updated
+
+
+def advance_order(order: Order, expected: str = None) -> bool:
+    """
+    Move ``order`` one step along STATUS_FLOW, but only if it is still in
+    ``expected`` (defaults to the status it was loaded with).
+    Returns False on conflict.
+    """
+    expected = expected or order.status
+    target = STATUS_FLOW.get(expected)
+    if not target:
+        return False
+    return _compare_and_set(order, expected, target, ORDER_ADVANCED)
+
+
+def cancel_order(order: Order, expected: str = None) -> bool:
+    """
+    Cancel, but only if the order is still in ``expected`` (the status the
+    client saw; defaults to the status it was loaded with).
+    Returns False on conflict.
+    """
+    expected = expected or order.status
+    if expected not in CANCELLABLE_STATUSES:
+        return False
+    return _compare_and_set(order, expected, OrderStatus.CANCELLED, ORDER_CANCELLED)
+
+
+def _compare_and_set(order, expected, target, kind) -> bool:
+    now = timezone.now()
+    with transaction.atomic():
+        seq = BranchOrderSequence.next_value(order.branch_id)
+        rows = _transition_rows(Order.objects.filter(pk=order.pk, status=expected))
+        if not rows:
+            return False
+        Order.objects.filter(pk=order.pk).update(
+            status=target, change_seq=seq, status_changed_at=now, updated_at=now,
+            version=F("version") + 1,
+        )
+        _record_transition(rows, target, now)
+    order.status, order.change_seq, order.status_changed_at = target, seq, now
+    publish_order_event(order, kind)
+    return True
+
+
+def advance_orders(branch_id: int, expected_by_id: dict) -> dict:
+    """
+    Advance many orders of one branch in a single transaction.
+
+    ``expected_by_id`` maps order id -> the status the client saw.  Orders
+    are grouped by expected status and moved with one conditional UPDATE
+    per group.  Returns ``{"advanced": [ids], "conflicts": [{"id", "status"}]}``
+    where ``status`` is the current status of each order that did not move.
+    """
+    groups = {}
+    for order_id, expected in expected_by_id.items():
+        groups.setdefault(expected, []).append(order_id)
+
+    advanced = []
+    now = timezone.now()
+    with transaction.atomic():
+        seq = BranchOrderSequence.next_value(branch_id)
+        for expected, ids in groups.items():
+            target = STATUS_FLOW.get(expected)
+            if not target:
+                continue
+            rows = _transition_rows(
+                Order.objects.filter(pk__in=ids, branch_id=branch_id, status=expected)
+            )
+            if rows:
+                matched = [row["pk"] for row in rows]
+                Order.objects.filter(pk__in=matched).update(
+                    status=target, change_seq=seq, status_changed_at=now, updated_at=now,
+                version=F("version") + 1,
+                )
+                _record_transition(rows, target, now)
+                advanced.extend(matched)
+
+    missed = set(expected_by_id) - set(advanced)
+    current = dict(
+        Order.objects.filter(pk__in=missed, branch_id=branch_id).values_list("pk", "status")
+    ) if missed else {}
+    conflicts = [{"id": pk, "status": current.get(pk)} for pk in sorted(missed)]
+
+    _publish_all(advanced, ORDER_ADVANCED)
+    return {"advanced": sorted(advanced), "conflicts": conflicts}
+
+
+def release_orders(branch_id: int, order_ids) -> list:
+    """
+    Move pre-orders of one branch from Scheduled to New with one UPDATE
+    sharing one sequence value; they appear on the board as new orders.
+    Orders no longer Scheduled (e.g. cancelled meanwhile) are skipped.
+    Returns the released ids.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        seq = BranchOrderSequence.next_value(branch_id)
+        rows = _transition_rows(
+            Order.objects.filter(pk__in=order_ids, branch_id=branch_id, status=OrderStatus.SCHEDULED)
+        )
+        released = [row["pk"] for row in rows]
+        if released:
+            Order.objects.filter(pk__in=released).update(
+                status=OrderStatus.NEW, change_seq=seq, status_changed_at=now, updated_at=now,
+                version=F("version") + 1,
+            )
+            _record_transition(rows, OrderStatus.NEW, now)
+    _publish_all(released, ORDER_CREATED)
+    return released
@@ -0,0 +1,18 @@
+# orders/signals.py
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Order, OrderItem
+
+
+# أي تغيير في عناصر الطلب أو فاتورته يغيّر نسخته، فتسقط نسخ التفاصيل المخزنة
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+@receiver(post_save, sender="payments.Invoice")
+@receiver(post_delete, sender="payments.Invoice")
+def bump_order_version(sender, instance, origin=None, **kwargs):
+    # حذف الطلب نفسه (أو أرشفته) يحذف عناصره؛ لا داعي لتحديث نسخة طلب محذوف
+    if isinstance(origin, Order) or getattr(origin, "model", None) is Order:
+        return
+    if instance.order_id:
+        Order.bump_version([instance.order_id])
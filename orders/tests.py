@@ -1,3 +1,796 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import io
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from menu.models import Category, Option, OptionGroup, Product
+from restaurants.models import Branch, Restaurant
+from users.models import Profile
+
+from . import metrics as order_metrics, services
+from .archive import archive_chunk, archive_cutoff, get_order_any, history_models
+from .capacity import branch_capacity, capacity_for_branches, invalidate_capacity
+from .events import DatabaseBroker, LocalBroker, board_head
+from .kitchen import kitchen_summary
+from .models import (
+    ArchivedOrder, ArchivedOrderItem, BranchCapacity, BranchTicketCounter, Order, OrderHistory, OrderItem,
+    OrderItemHistory, OrderStatus, OrderStatusEvent, Printer, PrintJob, ScheduledOrder,
+)
+from .pricing import backfill_line_prices, recalc_order_totals
+from .printing import process_jobs
+from .scheduling import initial_status, lead_time, release_due, schedule_order
+from .search import normalize_name, normalize_phone, search_orders
+from .tickets import TicketAllocator, format_ticket
+
+
+class LocalBrokerTests(SimpleTestCase):
+    def test_publish_reaches_only_subscribers_of_the_branch(self):
+        broker = LocalBroker()
+
+        async def scenario():
+            stream_1 = broker.subscribe(1, heartbeat=1)
+            stream_2 = broker.subscribe(2, heartbeat=0.05)
+            first = asyncio.ensure_future(stream_1.__anext__())
+            other = asyncio.ensure_future(stream_2.__anext__())
+            await asyncio.sleep(0)  # let both subscribers register
+            broker.publish(1, {"type": "created", "order_id": 7})
+            got = await first
+            heartbeat = await other
+            await stream_1.aclose()
+            await stream_2.aclose()
+            return got, heartbeat
+
+        got, heartbeat = asyncio.run(scenario())
+        self.assertEqual(got["order_id"], 7)
+        self.assertIsNone(heartbeat)
+        self.assertEqual(broker.subscriber_count(1), 0)
+        self.assertEqual(broker.subscriber_count(2), 0)
+
+    def test_publish_without_subscribers_is_a_noop(self):
+        LocalBroker().publish(99, {"type": "cancelled", "order_id": 1})
+
+
+class DatabaseBrokerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser("admin", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=self.user)
+        self.branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+
+    def test_poll_returns_orders_changed_after_the_cursor(self):
+        broker = DatabaseBroker()
+        Order.objects.create(branch=self.branch, total_price="5.00")
+        cursor = board_head(self.branch.id)
+        order = Order.objects.create(branch=self.branch, total_price="7.00")
+
+        events, cursor = broker._poll(self.branch.id, cursor)
+        self.assertEqual([(e["order_id"], e["status"]) for e in events], [(order.pk, "New")])
+        self.assertIn("html", events[0])
+        self.assertEqual(broker._poll(self.branch.id, cursor)[0], [])
+
+    def test_wsgi_board_polls_instead_of_streaming(self):
+        self.client.force_login(self.user)
+        response = self.client.get(f"/board/{self.branch.id}/stream/")
+        self.assertEqual(response.status_code, 204)
+        page = self.client.get(f"/board/{self.branch.id}/")
+        self.assertContains(page, "data-changes-url")
+        self.assertNotContains(page, "data-stream-url")
+
+
+class BoardChangesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser("admin", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=self.user)
+        self.branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+        self.client.force_login(self.user)
+
+    @mock.patch("orders.views.CHANGES_PAGE_SIZE", 2)
+    def test_pages_through_orders_sharing_one_sequence_value(self):
+        orders = [Order.objects.create(branch=self.branch, total_price="5.00") for _ in range(5)]
+        start = self.client.get(f"/board/{self.branch.id}/changes/").json()
+        services.bulk_set_status(Order.objects.filter(branch=self.branch), OrderStatus.PREPARING)
+        self.assertEqual(len(set(Order.objects.values_list("change_seq", flat=True))), 1)
+
+        seen, cursor, cursor_id = [], start["cursor"], start["cursor_id"]
+        while True:
+            page = self.client.get(
+                f"/board/{self.branch.id}/changes/", {"since": cursor, "after": cursor_id},
+            ).json()
+            seen += [o["order_id"] for o in page["orders"]]
+            cursor, cursor_id = page["cursor"], page["cursor_id"]
+            if not page["more"]:
+                break
+        self.assertEqual(seen, [o.pk for o in orders])
+
+
+class StatusTransitionTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=self.owner)
+        Profile.objects.create(user=self.owner, role="RestaurantOwner", restaurant=restaurant)
+        self.branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+        self.order = Order.objects.create(branch=self.branch, total_price="5.00")
+
+    def test_stale_expected_status_loses(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        self.assertTrue(services.advance_order(self.order, OrderStatus.NEW))
+        # شاشة ثانية ما زالت ترى الطلب "جديد"
+        self.assertFalse(services.advance_order(stale, OrderStatus.NEW))
+        self.assertFalse(services.cancel_order(stale))
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, OrderStatus.PREPARING)
+        self.assertEqual(OrderStatusEvent.objects.filter(order=self.order, from_status=OrderStatus.NEW).count(), 1)
+
+    def test_bulk_advance_moves_matches_and_reports_conflicts(self):
+        moved = Order.objects.create(branch=self.branch, total_price="5.00")
+        services.advance_order(self.order)
+        other = Order.objects.create(
+            branch=Branch.objects.create(restaurant=self.branch.restaurant, name="B2", address="a"),
+            total_price="5.00",
+        )
+        result = services.advance_orders(self.branch.id, {
+            moved.pk: OrderStatus.NEW, self.order.pk: OrderStatus.NEW, other.pk: OrderStatus.NEW,
+        })
+        self.assertEqual(result["advanced"], [moved.pk])
+        self.assertEqual(result["conflicts"], [
+            {"id": self.order.pk, "status": OrderStatus.PREPARING}, {"id": other.pk, "status": None},
+        ])
+        self.assertEqual(Order.objects.get(pk=other.pk).status, OrderStatus.NEW)
+
+    def test_single_order_views_require_post_and_branch_access(self):
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(f"/{self.order.pk}/advance/").status_code, 405)
+        self.assertEqual(self.client.get(f"/{self.order.pk}/cancel/").status_code, 405)
+
+        stranger = User.objects.create_user("stranger", password="x")
+        other = Restaurant.objects.create(name="O", description="d", owner=stranger)
+        Profile.objects.create(user=stranger, role="RestaurantOwner", restaurant=other)
+        self.client.force_login(stranger)
+        self.assertEqual(self.client.post(f"/{self.order.pk}/advance/").status_code, 404)
+        self.assertEqual(self.client.post(f"/{self.order.pk}/cancel/").status_code, 404)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, OrderStatus.NEW)
+
+        self.client.force_login(self.owner)
+        self.client.post(f"/{self.order.pk}/advance/", {"expected": OrderStatus.NEW})
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, OrderStatus.PREPARING)
+
+    def test_cancel_from_a_stale_screen_is_a_conflict(self):
+        self.client.force_login(self.owner)
+        services.advance_order(self.order, OrderStatus.NEW)
+        # شاشة ما زالت تعرض الطلب "جديد" بعد أن جهّزته شاشة أخرى
+        response = self.client.post(f"/{self.order.pk}/cancel/", {"expected": OrderStatus.NEW}, follow=True)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, OrderStatus.PREPARING)
+        self.assertIn("من شاشة أخرى", " ".join(str(m) for m in response.context["messages"]))
+
+        self.client.post(f"/{self.order.pk}/cancel/", {"expected": OrderStatus.PREPARING})
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, OrderStatus.CANCELLED)
+
+
+class OrderVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_superuser("admin", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=self.user)
+        self.branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+        self.order = Order.objects.create(branch=self.branch, total_price="5.00")
+
+    def test_stale_instance_never_reuses_a_version(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        start = stale.version
+        Order.bump_version([self.order.pk])  # تعديل عنصر أو فاتورة من مكان آخر
+        stale.guest_name = "Late edit"
+        stale.save()
+        self.assertEqual(stale.version, start + 2)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).version, start + 2)
+        stale.save(update_fields=["guest_name"])
+        self.assertEqual(Order.objects.get(pk=self.order.pk).version, start + 3)
+
+    def test_fragment_answers_304_until_the_order_changes(self):
+        self.client.force_login(self.user)
+        url = f"/{self.order.pk}/fragment/"
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        etag = first["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        stale = Order.objects.get(pk=self.order.pk)
+        Order.bump_version([self.order.pk])
+        stale.guest_name = "Changed"
+        stale.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+
+    def test_board_answers_304_until_a_status_changes(self):
+        self.client.force_login(self.user)
+        url = f"/board/{self.branch.pk}/"
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        etag = first["ETag"]
+        # الجلسة، المستخدم، صلاحيات الفروع (مدير بلا ملف شخصي: بلا كاش)، تسلسل الفرع، حدود الفرع
+        with self.assertNumQueries(6):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        services.advance_order(self.order, OrderStatus.NEW)
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+        self.assertEqual([o.pk for o in changed.context["preparing_orders"]], [self.order.pk])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=changed["ETag"]).status_code, 304)
+
+
+class OrderArchiveTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user("owner", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        self.branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+        category = Category.objects.create(restaurant=restaurant, name="C")
+        self.product = Product.objects.create(category=category, name="Shawarma", price="10.00")
+
+    def _order(self, status, days_ago):
+        order = Order.objects.create(branch=self.branch, total_price="20.00", status=status)
+        OrderItem.objects.create(order=order, product=self.product, quantity=2)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        return order
+
+    def test_archive_chunk_moves_only_old_finished_orders(self):
+        old = self._order(OrderStatus.DELIVERED, 400)
+        old_cancelled = self._order(OrderStatus.CANCELLED, 300)
+        old_open = self._order(OrderStatus.NEW, 400)
+        recent = self._order(OrderStatus.DELIVERED, 1)
+
+        self.assertEqual(archive_chunk(archive_cutoff(), chunk_size=1), 1)
+        self.assertEqual(archive_chunk(archive_cutoff()), 1)
+        self.assertEqual(archive_chunk(archive_cutoff()), 0)
+
+        self.assertEqual(set(Order.objects.values_list("pk", flat=True)), {old_open.pk, recent.pk})
+        self.assertEqual(set(ArchivedOrder.objects.values_list("pk", flat=True)), {old.pk, old_cancelled.pk})
+        line = ArchivedOrderItem.objects.get(order_id=old.pk)
+        self.assertEqual((line.product_id, line.quantity, line.line_total), (self.product.pk, 2, 20))
+
+    def test_archived_orders_read_transparently(self):
+        old = self._order(OrderStatus.DELIVERED, 400)
+        recent = self._order(OrderStatus.DELIVERED, 1)
+        archive_chunk(archive_cutoff())
+
+        self.assertTrue(OrderHistory.objects.get(pk=old.pk).is_archived)
+        self.assertFalse(OrderHistory.objects.get(pk=recent.pk).is_archived)
+        self.assertEqual(OrderItemHistory.objects.filter(order_id=old.pk).get().quantity, 2)
+        self.assertIsInstance(get_order_any(pk=old.pk), ArchivedOrder)
+        self.assertIsInstance(get_order_any(pk=recent.pk), Order)
+
+        today = timezone.localdate()
+        self.assertEqual(history_models(today - timedelta(days=7)), (Order, OrderItem))
+        self.assertEqual(history_models(today - timedelta(days=500)), (OrderHistory, OrderItemHistory))
+        self.assertEqual(history_models(None), (OrderHistory, OrderItemHistory))
+
+    def test_history_models_follows_an_archive_run_with_shorter_days(self):
+        old = self._order(OrderStatus.DELIVERED, 10)
+        archive_chunk(archive_cutoff(days=5))
+        self.assertTrue(ArchivedOrder.objects.filter(pk=old.pk).exists())
+        self.assertEqual(history_models(timezone.localdate() - timedelta(days=29))[0], OrderHistory)
+
+    def test_archived_lines_do_not_block_product_deletion(self):
+        old = self._order(OrderStatus.DELIVERED, 400)
+        archive_chunk(archive_cutoff())
+        self.product.delete()
+        line = ArchivedOrderItem.objects.get(order_id=old.pk)
+        self.assertIsNone(line.product_id)
+        self.assertEqual(line.line_total, 20)
+
+
+class TicketAllocatorTests(TransactionTestCase):
+    def setUp(self):
+        owner = User.objects.create_user("owner", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        self.branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+
+    def test_format_ticket(self):
+        self.assertEqual(format_ticket(42), "A-042")
+        self.assertEqual(format_ticket(999), "A-999")
+        self.assertEqual(format_ticket(1000), "B-001")
+
+    # SQLite يقفل قاعدة البيانات كلها: الخيوط تفشل بـ "database is locked" بدل أن تنتظر صف العداد
+    @skipUnlessDBFeature("has_select_for_update")
+    def test_concurrent_workers_never_hand_out_the_same_number(self):
+        block_size = 5
+        workers = [TicketAllocator(block_size=block_size) for _ in range(4)]
+        committed, reserved, errors = [], [], []
+        lost = [0]  # أرقام من الكتل المحفوظة ضاعت مع عملية دفع تراجعت
+        lock = threading.Lock()
+        local = threading.local()
+        real_reserve = BranchTicketCounter.reserve
+
+        def counting_reserve(branch_id, day, size):
+            local.reserved = True
+            start = real_reserve(branch_id, day, size)
+            transaction.on_commit(lambda: reserved.append(start))
+            return start
+
+        def checkout(worker, rounds):
+            try:
+                for i in range(rounds):
+                    local.reserved = False
+                    try:
+                        with transaction.atomic():
+                            _, number = worker.allocate(self.branch.id)
+                            if i % 7 == 3:
+                                raise RuntimeError("payment failed")  # rolled back checkout
+                    except RuntimeError:
+                        # كتلة حُجزت داخل عملية متراجعة تتراجع معها؛ رقم من كتلة سابقة يضيع
+                        if not local.reserved:
+                            with lock:
+                                lost[0] += 1
+                        continue
+                    with lock:
+                        committed.append(number)
+            except Exception as exc:  # pragma: no cover - reported below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=checkout, args=(workers[i % len(workers)], 25))
+            for i in range(8)
+        ]
+        with mock.patch.object(BranchTicketCounter, "reserve", side_effect=counting_reserve):
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(committed), len(set(committed)))
+        counter = BranchTicketCounter.objects.get(branch=self.branch)
+        # العداد يتقدم بكتلة كاملة لكل حجز ثبت فقط، والكتل متتالية بلا تداخل
+        self.assertEqual(sorted(reserved), list(range(1, counter.last, block_size)))
+        # كل رقم في الكتل: إما سُلّم لطلب ثبت، أو ضاع مع تراجع، أو بقي في ذاكرة عامل
+        leftover = sum(end - start for w in workers for blocks in w._pool.values() for start, end in blocks)
+        self.assertEqual(counter.last, len(committed) + lost[0] + leftover)
+        self.assertLessEqual(max(committed), counter.last)
+
+
+class KitchenPrintingTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user("owner", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        self.branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+        category = Category.objects.create(restaurant=restaurant, name="C")
+        product = Product.objects.create(category=category, name="Shawarma", price="10.00")
+        self.order = Order.objects.create(branch=self.branch, total_price="20.00")
+        OrderItem.objects.create(order=self.order, product=product, quantity=2, options='{"Size": "Large"}')
+        self.spool = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool, ignore_errors=True)
+
+    def _printer(self, **kwargs):
+        fields = {"branch": self.branch, "name": "Kitchen", "transport": Printer.Transport.FILE,
+                  "address": self.spool, "encoding": "ascii"}
+        fields.update(kwargs)
+        return Printer.objects.create(**fields)
+
+    def test_preparing_queues_a_ticket_without_printing_inline(self):
+        self._printer()
+        self.assertTrue(services.advance_order(self.order))
+        job = PrintJob.objects.get()
+        self.assertEqual((job.order_id, job.status), (self.order.pk, PrintJob.Status.PENDING))
+        self.assertEqual(os.listdir(self.spool), [])
+
+    def test_printer_changes_apply_to_the_next_order_in_every_process(self):
+        old = self._printer()
+        self.assertTrue(services.advance_order(self.order))
+        # تعديل من عملية أخرى (أو update جماعي) لا يمر بأي إبطال لكاش هذه العملية
+        Printer.objects.filter(pk=old.pk).update(is_active=False)
+        new = self._printer(name="Grill")
+        second = Order.objects.create(branch=self.branch, total_price="5.00")
+        self.assertTrue(services.advance_order(second))
+        self.assertEqual(
+            list(PrintJob.objects.order_by("pk").values_list("order_id", "printer_id")),
+            [(self.order.pk, old.pk), (second.pk, new.pk)],
+        )
+
+    def test_worker_writes_escpos_to_the_spool_directory(self):
+        self._printer()
+        services.advance_order(self.order)
+        self.assertEqual(process_jobs(), {"printed": 1, "failed": 0})
+        (name,) = os.listdir(self.spool)
+        with open(os.path.join(self.spool, name), "rb") as fh:
+            data = fh.read()
+        self.assertTrue(data.startswith(b"\x1b@"))
+        self.assertIn(self.order.ticket.encode(), data)
+        self.assertIn(b"2 x Shawarma", data)
+        self.assertIn(b"+ Size: Large", data)
+        self.assertTrue(data.endswith(b"\x1dVB\x00"))
+        self.assertEqual(PrintJob.objects.get().status, PrintJob.Status.DONE)
+
+    def test_pdf_fallback(self):
+        self._printer(format=Printer.Format.PDF)
+        services.advance_order(self.order)
+        process_jobs()
+        (name,) = os.listdir(self.spool)
+        with open(os.path.join(self.spool, name), "rb") as fh:
+            self.assertTrue(fh.read().startswith(b"%PDF"))
+
+    def test_network_printer_over_loopback_socket(self):
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        self.addCleanup(server.close)
+        received = []
+
+        def accept():
+            conn, _ = server.accept()
+            with conn:
+                chunks = iter(lambda: conn.recv(4096), b"")
+                received.append(b"".join(chunks))
+
+        thread = threading.Thread(target=accept)
+        thread.start()
+        self._printer(transport=Printer.Transport.NETWORK, address="127.0.0.1:%d" % server.getsockname()[1])
+        services.advance_order(self.order)
+        self.assertEqual(process_jobs()["printed"], 1)
+        thread.join(5)
+        self.assertIn(b"2 x Shawarma", received[0])
+
+    def test_unreachable_printer_is_retried_later(self):
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        port = server.getsockname()[1]
+        server.close()  # لا أحد يستمع على هذا المنفذ
+        self._printer(transport=Printer.Transport.NETWORK, address="127.0.0.1:%d" % port)
+        services.advance_order(self.order)
+        self.assertEqual(process_jobs(), {"printed": 0, "failed": 1})
+        job = PrintJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (PrintJob.Status.PENDING, 1))
+        self.assertGreater(job.available_at, timezone.now())
+        self.assertEqual(process_jobs(), {"printed": 0, "failed": 0})
+
+
+class BranchCapacityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user("owner", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        self.branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+        self.other = Branch.objects.create(restaurant=restaurant, name="B2", address="a")
+        BranchCapacity.objects.create(branch=self.branch, max_open_orders=2)
+
+    def test_pause_from_another_process_applies_without_invalidation(self):
+        self.assertTrue(branch_capacity(self.branch.pk)["accepting"])
+        # عامل آخر أوقف الفرع: لا invalidate_capacity يصل لكاش هذه العملية
+        BranchCapacity.objects.filter(branch=self.branch).update(paused=True)
+        status = branch_capacity(self.branch.pk)
+        self.assertEqual((status["paused"], status["accepting"]), (True, False))
+
+    def test_queue_counts_are_cached_until_an_order_event(self):
+        Order.objects.create(branch=self.branch, total_price="5.00")
+        self.assertEqual(branch_capacity(self.branch.pk)["open_orders"], 1)
+        Order.objects.bulk_create([Order(branch=self.branch, total_price="5.00", change_seq=0)])
+        with self.assertNumQueries(1):  # حدود الفرع فقط، عدد الطابور من الكاش
+            self.assertEqual(branch_capacity(self.branch.pk)["open_orders"], 1)
+        invalidate_capacity(self.branch.pk)
+        status = branch_capacity(self.branch.pk)
+        self.assertEqual((status["open_orders"], status["accepting"]), (2, False))
+
+    def test_capacity_for_branches_uses_defaults_without_a_row(self):
+        result = capacity_for_branches([self.branch.pk, self.other.pk])
+        self.assertEqual(set(result), {self.branch.pk, self.other.pk})
+        self.assertTrue(result[self.other.pk]["accepting"])
+        self.assertEqual(result[self.other.pk]["eta_minutes"], BranchCapacity().base_prep_minutes)
+
+
+class KitchenSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user("owner", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        self.branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+        category = Category.objects.create(restaurant=restaurant, name="C")
+        self.shawarma = Product.objects.create(category=category, name="Shawarma", price="10.00")
+        self.falafel = Product.objects.create(category=category, name="Falafel", price="5.00")
+
+    def _order(self, status=OrderStatus.NEW, **lines):
+        order = Order.objects.create(branch=self.branch, total_price="0", status=status)
+        for product, (quantity, options) in lines.items():
+            OrderItem.objects.create(order=order, product=getattr(self, product), quantity=quantity, options=options)
+        return order
+
+    def test_equal_selections_are_merged_across_open_orders(self):
+        self._order(shawarma=(2, '{"Size": "Large"}'), falafel=(1, ""))
+        self._order(OrderStatus.PREPARING, shawarma=(3, "{'Size': 'Large'}"))
+        self._order(OrderStatus.DELIVERED, falafel=(9, ""))
+
+        rows = [(r["product"], r["options"], r["qty"], r["orders"]) for r in kitchen_summary(self.branch.pk)]
+        self.assertEqual(rows, [("Shawarma", ["Size: Large"], 5, 2), ("Falafel", [], 1, 1)])
+
+    def test_status_change_from_another_process_is_seen_without_invalidation(self):
+        order = self._order(falafel=(4, ""))
+        self.assertEqual(kitchen_summary(self.branch.pk)[0]["qty"], 4)
+        with self.assertNumQueries(1):  # تسلسل الفرع فقط، الصفوف من الكاش
+            self.assertEqual(kitchen_summary(self.branch.pk)[0]["qty"], 4)
+
+        # عامل آخر سلّم الطلب: الحفظ يقدّم تسلسل الفرع ولا شيء يمسح كاش هذه العملية
+        order.status = OrderStatus.DELIVERED
+        order.save()
+        self.assertEqual(kitchen_summary(self.branch.pk), [])
+
+
+class ScheduledOrderTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=self.owner)
+        Profile.objects.create(user=self.owner, role="RestaurantOwner", restaurant=restaurant)
+        self.branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+
+    def _pre_order(self, due_at):
+        order = Order.objects.create(branch=self.branch, total_price="5.00", status=initial_status(due_at))
+        schedule_order(order, due_at)
+        return order
+
+    def _board_ids(self):
+        response = self.client.get(f"/board/{self.branch.pk}/")
+        return [o.pk for o in response.context["new_orders"]]
+
+    def test_pre_order_stays_off_the_board_until_its_release_time(self):
+        due_at = timezone.now() + timedelta(hours=3)
+        order = self._pre_order(due_at)
+        self.assertEqual(order.status, OrderStatus.SCHEDULED)
+        self.client.force_login(self.owner)
+        self.assertEqual(self._board_ids(), [])
+
+        release_at = due_at - lead_time()
+        self.assertEqual(release_due(now=release_at - timedelta(minutes=1)), 0)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, OrderStatus.SCHEDULED)
+
+        self.assertEqual(release_due(now=release_at), 1)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, OrderStatus.NEW)
+        self.assertFalse(ScheduledOrder.objects.exists())
+        self.assertEqual(self._board_ids(), [order.pk])
+
+    def test_cancelled_rows_do_not_end_the_run_early(self):
+        now = timezone.now()
+        orders = [self._pre_order(now + timedelta(hours=1, minutes=i)) for i in range(5)]
+        ScheduledOrder.objects.update(release_at=now - timedelta(minutes=1))
+        # أول دفعة كلها ملغاة: لا يُطلق منها شيء، لكن ما بعدها مستحق
+        Order.objects.filter(pk__in=[o.pk for o in orders[:2]]).update(status=OrderStatus.CANCELLED)
+        ScheduledOrder.objects.filter(order_id=orders[0].pk).update(release_at=now - timedelta(minutes=3))
+        ScheduledOrder.objects.filter(order_id=orders[1].pk).update(release_at=now - timedelta(minutes=2))
+
+        out = io.StringIO()
+        call_command("release_scheduled_orders", batch=2, stdout=out)
+        self.assertIn("released 3 order(s)", out.getvalue())
+        self.assertFalse(ScheduledOrder.objects.exists())
+        self.assertEqual(
+            list(Order.objects.order_by("pk").values_list("status", flat=True)),
+            [OrderStatus.CANCELLED] * 2 + [OrderStatus.NEW] * 3,
+        )
+
+
+@mock.patch("orders.admin.OrderAdmin.list_per_page", 3)
+class OrderChangelistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user("owner", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+        self.ids = [Order.objects.create(branch=branch, total_price="5.00").pk for _ in range(8)][::-1]
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "x"))
+
+    def _page(self, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/admin/orders/order/", params or {})
+        cl = response.context["cl"]
+        return cl, [o.pk for o in cl.result_list], [q["sql"] for q in ctx.captured_queries]
+
+    def test_pages_by_cursor_without_counting_the_table(self):
+        cl, rows, sqls = self._page()
+        self.assertEqual(rows, self.ids[:3])
+        self.assertIsNone(cl.prev_page_url())
+        # العدّ محدود بـ LIMIT دائمًا، وعدد الاستعلامات لا يتغير من صفحة لأخرى
+        counts = [sql for sql in sqls if "COUNT(" in sql]
+        self.assertTrue(counts)
+        self.assertTrue(all("LIMIT" in sql for sql in counts))
+
+        cl, rows, next_sqls = self._page({"after": self.ids[2]})
+        self.assertEqual(rows, self.ids[3:6])
+        self.assertEqual(len(next_sqls), len(sqls))
+        self.assertIn(f"after={self.ids[5]}", cl.next_page_url())
+        self.assertIn(f"before={self.ids[3]}", cl.prev_page_url())
+
+        cl, rows, _ = self._page({"after": self.ids[5]})
+        self.assertEqual(rows, self.ids[6:])
+        self.assertIsNone(cl.next_page_url())
+
+        cl, rows, _ = self._page({"before": self.ids[6]})
+        self.assertEqual(rows, self.ids[3:6])
+        cl, rows, _ = self._page({"before": self.ids[3]})
+        self.assertEqual(rows, self.ids[:3])
+        self.assertIsNone(cl.prev_page_url())
+        self.assertIn(f"after={self.ids[2]}", cl.next_page_url())
+
+    def test_filter_links_drop_the_cursor(self):
+        cl, _, _ = self._page({"after": self.ids[2]})
+        url = cl.get_query_string({"status__exact": OrderStatus.NEW})
+        self.assertNotIn("after=", url)
+        self.assertEqual(self._page({"status__exact": OrderStatus.NEW, "before": self.ids[3]})[1], self.ids[:3])
+
+
+class PriceSnapshotTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user("owner", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        self.branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+        category = Category.objects.create(restaurant=restaurant, name="C")
+        self.product = Product.objects.create(category=category, name="Shawarma", price="10.00")
+        group = OptionGroup.objects.create(restaurant=restaurant, name="Size")
+        self.large = Option.objects.create(group=group, name="Large", price_adjustment="2.00")
+        self.order = Order.objects.create(branch=self.branch, total_price="24.00")
+        self.line = OrderItem.objects.create(
+            order=self.order, product=self.product, quantity=2, options='{"Size": "Large"}',
+            option_adjustment="2.00",
+        )
+
+    def test_menu_price_change_leaves_sold_lines_and_totals_alone(self):
+        self.assertEqual((self.line.unit_price, self.line.line_total), (Decimal("12.00"), Decimal("24.00")))
+        Product.objects.filter(pk=self.product.pk).update(price="15.00")
+        Option.objects.filter(pk=self.large.pk).update(price_adjustment="5.00")
+
+        self.assertEqual(recalc_order_totals(Order.objects.all()), 0)
+        line = OrderItem.objects.get(pk=self.line.pk)
+        self.assertEqual(
+            (line.option_adjustment, line.unit_price, line.line_total),
+            (Decimal("2.00"), Decimal("12.00"), Decimal("24.00")),
+        )
+        self.assertEqual(Order.objects.get(pk=self.order.pk).total_price, Decimal("24.00"))
+
+    def test_total_is_the_sum_of_stored_line_totals(self):
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=1)
+        Product.objects.filter(pk=self.product.pk).update(price="99.00")
+        self.assertEqual(recalc_order_totals(Order.objects.all()), 1)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).total_price, Decimal("34.00"))
+
+    def test_legacy_lines_without_a_snapshot_are_priced_once(self):
+        OrderItem.objects.filter(pk=self.line.pk).update(unit_price=None, line_total=None, option_adjustment=0)
+        recalc_order_totals(Order.objects.all())
+        line = OrderItem.objects.get(pk=self.line.pk)
+        self.assertEqual((line.unit_price, line.line_total), (Decimal("12.00"), Decimal("24.00")))
+
+        Product.objects.filter(pk=self.product.pk).update(price="15.00")
+        self.assertEqual(recalc_order_totals(Order.objects.all()), 0)
+        self.assertEqual(OrderItem.objects.get(pk=self.line.pk).line_total, Decimal("24.00"))
+
+    def test_backfill_passes_over_archived_lines_without_a_product(self):
+        other = Product.objects.create(category=self.product.category, name="Falafel", price="5.00")
+        OrderItem.objects.create(order=self.order, product=other, quantity=1)
+        Order.objects.filter(pk=self.order.pk).update(
+            status=OrderStatus.DELIVERED, created_at=timezone.now() - timedelta(days=400),
+        )
+        archive_chunk(archive_cutoff())
+        ArchivedOrderItem.objects.update(unit_price=None, line_total=None)
+        other.delete()
+
+        # الحلقة تنتهي رغم بقاء سطر المنتج المحذوف بلا سعر
+        self.assertEqual(backfill_line_prices(ArchivedOrderItem, chunk_size=1), 1)
+        self.assertEqual(
+            sorted(ArchivedOrderItem.objects.values_list("product_id", "line_total"), key=str),
+            sorted([(self.product.pk, Decimal("24.00")), (None, None)], key=str),
+        )
+
+
+class OrderSearchTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user("owner", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        self.branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+        self.order = Order.objects.create(
+            branch=self.branch, total_price="5.00", guest_name="أحمد إبراهيم", guest_phone="+966 ٥٠١٢٣٤٥٦٧",
+        )
+        Order.objects.filter(pk=self.order.pk).update(ticket_day=timezone.localdate(), ticket_number=1042)
+        self.other = Order.objects.create(branch=self.branch, total_price="5.00", guest_name="Sara", guest_phone="0559999999")
+
+    def test_normalize_phone(self):
+        for raw in ("+966 ٥٠١٢٣٤٥٦٧", "00966501234567", "966501234567", "501234567", "050-123-4567", "۰۵۰۱۲۳۴۵۶۷"):
+            self.assertEqual(normalize_phone(raw), "0501234567", raw)
+        self.assertEqual(normalize_phone(None), "")
+        self.assertEqual(normalize_phone("966"), "966")
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name("أحمد"), normalize_name("احمد"))
+        self.assertEqual(normalize_name("إيمان"), "ايمان")
+        self.assertEqual(normalize_name("آمنة"), "امنه")
+        self.assertEqual(normalize_name("مُحَمَّد  ـعلـي"), "محمد علي")
+        self.assertEqual(normalize_name("  Sara  ALI "), "sara ali")
+        self.assertEqual(normalize_name("مصطفى"), "مصطفي")
+
+    def test_search_dispatch(self):
+        def ids(query):
+            return [o.pk for o in search_orders(self.branch.pk, query)]
+
+        self.assertEqual(ids("B-043"), [self.order.pk])     # تذكرة (1042 = B-043)
+        self.assertEqual(ids("b043"), [self.order.pk])
+        self.assertEqual(ids(str(self.other.pk)), [self.other.pk])  # رقم الطلب
+        self.assertEqual(ids("1042"), [self.order.pk])      # رقم التذكرة بلا حرف
+        self.assertEqual(ids("٠٥٠١٢"), [self.order.pk])     # بادئة جوال بأرقام عربية
+        self.assertEqual(ids("+966 50 123 4567"), [self.order.pk])
+        self.assertEqual(ids("05"), [])                      # أقصر من الحد الأدنى
+        self.assertEqual(ids("احمد"), [self.order.pk])       # اسم بدون همزة
+        self.assertEqual(ids("sa"), [self.other.pk])
+        self.assertEqual(ids("س"), [])
+        self.assertEqual(list(search_orders(self.branch.pk, "  ")), [])
+
+    def test_migration_backfill_uses_its_own_normalizers(self):
+        from django.apps import apps
+        backfill = importlib.import_module("orders.migrations.0015_order_search_fields")
+
+        Order.objects.update(phone_digits="", name_search="")
+        with mock.patch.object(backfill, "BACKFILL_CHUNK", 1):
+            backfill.backfill_recent(apps, None)
+        self.assertEqual(
+            Order.objects.filter(pk=self.order.pk).values_list("phone_digits", "name_search").get(),
+            ("0501234567", "احمد ابراهيم"),
+        )
+        self.assertEqual(Order.objects.get(pk=self.other.pk).name_search, "sara")
+
+
+class OrderMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        order_metrics.reset()
+        self.addCleanup(order_metrics.reset)
+        owner = User.objects.create_user("owner", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        self.branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+
+    def test_render_counts_transitions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(branch=self.branch, total_price="5.00", order_method="pickup")
+        Order.objects.filter(pk=order.pk).update(status_changed_at=timezone.now() - timedelta(seconds=90))
+        order.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            services.advance_order(order)
+        with self.captureOnCommitCallbacks(execute=True):
+            services.cancel_order(order)
+
+        text = order_metrics.render()
+        labels = f'branch="{self.branch.pk}",method="pickup"'
+        self.assertIn("# TYPE hallaorder_orders_created_total counter", text)
+        self.assertIn(f"hallaorder_orders_created_total{{{labels}}} 1.0", text)
+        self.assertIn(f"hallaorder_orders_cancelled_total{{{labels}}} 1.0", text)
+        self.assertIn("# TYPE hallaorder_order_status_seconds histogram", text)
+        self.assertIn(f'hallaorder_order_status_seconds_bucket{{branch="{self.branch.pk}",le="60.0",method="pickup",status="New"}} 0.0', text)
+        self.assertIn(f'hallaorder_order_status_seconds_bucket{{branch="{self.branch.pk}",le="120.0",method="pickup",status="New"}} 1.0', text)
+        self.assertIn(f'hallaorder_order_status_seconds_count{{{labels},status="New"}} 1.0', text)
+        self.assertNotIn("_created{", text)
+
+    def test_multiprocess_mode_adds_up_every_worker(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": directory}
+        record = (
+            "from orders import metrics as m; "
+            "m.inc('hallaorder_orders_created_total', m._labels(7, 'pickup')); "
+            "m.observe(m._labels(7, 'pickup', 'New'), 45)"
+        )
+        for _ in range(2):  # عاملان منفصلان
+            subprocess.run([sys.executable, "-c", record], env=env, check=True, cwd=settings.BASE_DIR)
+        text = subprocess.run(
+            [sys.executable, "-c", "from orders import metrics as m; print(m.render())"],
+            env=env, check=True, cwd=settings.BASE_DIR, capture_output=True, text=True,
+        ).stdout
+        self.assertIn('hallaorder_orders_created_total{branch="7",method="pickup"} 2.0', text)
+        self.assertIn('hallaorder_order_status_seconds_count{branch="7",method="pickup",status="New"} 2.0', text)
@@ -0,0 +1,81 @@
+# orders/tickets.py
+"""
+Short per-branch daily ticket numbers (A-001 … A-999, B-001 …).
+
+Each worker process reserves a block of numbers from
+``BranchTicketCounter`` and hands them out from memory, so concurrent
+checkouts only meet on the counter row once per block.  Numbers are unique
+per branch and day.  They increase per worker but not globally, and a
+restarted worker leaves the rest of its block unused.
+"""
+import string
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import BranchTicketCounter
+
+DEFAULT_BLOCK_SIZE = 10
+TICKETS_PER_LETTER = 999
+
+
+def format_ticket(number: int) -> str:
+    """42 → "A-042", 1000 → "B-001"."""
+    letter = string.ascii_uppercase[((number - 1) // TICKETS_PER_LETTER) % 26]
+    return f"{letter}-{(number - 1) % TICKETS_PER_LETTER + 1:03d}"
+
+
+class TicketAllocator:
+    """
+    Hands out ticket numbers from per-process blocks.
+
+    A block is reserved inside the caller's transaction.  The caller takes
+    its first number straight away, and the rest join the pool only once
+    that transaction commits.  If it rolls back, the counter rolls back and
+    the block is simply forgotten, so no number is ever handed out twice.
+    """
+
+    def __init__(self, block_size: int = DEFAULT_BLOCK_SIZE):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pool = {}  # (branch_id, day) -> list of [next, end)
+
+    def allocate(self, branch_id, day=None):
+        """Return ``(day, number)`` for a new order of ``branch_id``."""
+        day = day or timezone.localdate()
+        key = (int(branch_id), day)
+        with self._lock:
+            blocks = self._pool.get(key)
+            while blocks:
+                block = blocks[0]
+                if block[0] < block[1]:
+                    number = block[0]
+                    block[0] += 1
+                    return day, number
+                blocks.pop(0)
+
+        start = BranchTicketCounter.reserve(branch_id, day, self.block_size)
+        if self.block_size > 1:
+            transaction.on_commit(
+                lambda: self._add_block(key, start + 1, start + self.block_size)
+            )
+        return day, start
+
+    def _add_block(self, key, start, end):
+        with self._lock:
+            # أيام سابقة لم تعد مطلوبة
+            self._pool = {k: v for k, v in self._pool.items() if k[1] >= key[1]}
+            self._pool.setdefault(key, []).append([start, end])
+
+    def reset(self):
+        with self._lock:
+            self._pool.clear()
+
+
+_allocator = TicketAllocator(getattr(settings, "ORDERS_TICKET_BLOCK_SIZE", DEFAULT_BLOCK_SIZE))
+
+
+def allocate_ticket(branch_id, day=None):
+    return _allocator.allocate(branch_id, day)
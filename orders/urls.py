@@ -6,7 +6,15 @@ app_name = "orders"
 urlpatterns = [
     path("board/", views.order_board_default, name="order_board"),                   # no param
     path("board/<int:branch_id>/", views.order_board, name="order_board_by_branch"),# with param
+    path("board/<int:branch_id>/stream/", views.order_board_stream, name="order_board_stream"),
+    path("board/<int:branch_id>/changes/", views.order_board_changes, name="order_board_changes"),
     path("<int:pk>/advance/", views.advance_status, name="order_advance"),
+    path("board/<int:branch_id>/kitchen/", views.kitchen_board, name="kitchen_board"),
+    path("board/<int:branch_id>/online/", views.toggle_online_orders, name="toggle_online_orders"),
+    path("board/<int:branch_id>/advance/", views.advance_bulk, name="order_advance_bulk"),
+    path("board/<int:branch_id>/search/", views.order_search, name="order_search"),
     path("<int:pk>/cancel/", views.cancel_order, name="order_cancel"),
+    path("<int:pk>/detail/", views.order_detail, name="order_detail"),
     path("<int:pk>/fragment/", views.order_detail_fragment, name="order_detail_fragment"),
+    path("metrics", views.metrics, name="metrics"),
 ]
\ No newline at end of file
@@ -1,20 +1,39 @@
 # orders/views.py
+import hashlib
+import json
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse, NoReverseMatch
-from .models import Order, OrderStatus ,OrderItem
-from restaurants.models import Branch, Restaurant
-from django.http import HttpResponseForbidden, Http404
+from .models import Order, OrderStatus ,OrderItem, BranchOrderSequence, ArchivedOrder, ArchivedOrderItem, BranchCapacity
+from .events import get_broker, build_order_event, board_head, changed_orders
+from .kitchen import kitchen_summary
+from .search import search_orders
+from .capacity import branch_capacity
+from . import metrics as order_metrics
+from . import services
+from .services import CANCELLABLE_STATUSES, STATUS_FLOW
+from restaurants.models import Branch
+from users.access import allowed_branch_ids, can_access_branch, default_branch_id
+from django.http import (
+    HttpResponse, HttpResponseForbidden, Http404, StreamingHttpResponse, JsonResponse,
+)
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_POST
 
 
 # ---- helpers ---------------------------------------------------------------
 
-STATUS_FLOW = {
-    "New": "Preparing",
-    "Preparing": "Ready",
-    "Ready": "Delivered",
-}
+# الحالات الظاهرة كأعمدة في لوحة الطلبات
+BOARD_STATUSES = (OrderStatus.NEW, OrderStatus.PREPARING, OrderStatus.READY)
 
 def _rev(name: str, **kwargs) -> str:
     """
@@ -26,47 +45,86 @@ def _rev(name: str, **kwargs) -> str:
     except NoReverseMatch:
         return reverse(f"orders:{name}", kwargs=kwargs)
 
-def _user_default_branch(user):
-    """
-    Pick a default Branch for the current user:
-      1) If user has one-to-one owned restaurant: user.restaurants -> first branch
-      2) If user has multiple owned restaurants (restaurants_owned): first -> first branch
-      3) Fallback: first branch in DB (admin/superuser)
-    Adjust related_name if your models differ.
-    """
-    # one-to-one (per your current Restaurant model)
-    owner_one = getattr(user, "restaurants", None)
-    if isinstance(owner_one, Restaurant):
-        b = Branch.objects.filter(restaurant=owner_one).order_by("id").first()
-        if b:
-            return b
-
-    # fallback: many-owned
-    owner_many = getattr(user, "restaurants_owned", None)
-    if owner_many and hasattr(owner_many, "first"):
-        rest = owner_many.first()
-        if isinstance(rest, Restaurant):
-            b = Branch.objects.filter(restaurant=rest).order_by("id").first()
-            if b:
-                return b
-
-    # final fallback
-    return Branch.objects.order_by("id").first()
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+def _is_asgi(request) -> bool:
+    """Streams only make sense when the server itself runs ASGI."""
+    return isinstance(request, ASGIRequest)
+
+def _order_version(request, pk) -> tuple:
+    """``(version, updated_at)`` of an order the user may see (404 otherwise)."""
+    branch_ids = allowed_branch_ids(request)
+    row = (Order.objects.filter(pk=pk, branch_id__in=branch_ids)
+                        .values_list("version", "updated_at").first())
+    if row is None:
+        # الطلبات المؤرشفة تبقى قابلة للعرض
+        row = (ArchivedOrder.objects.filter(pk=pk, branch_id__in=branch_ids)
+                                    .values_list("version", "updated_at").first())
+    if row is None:
+        raise Http404
+    return row
+
+def _board_etag(request, branch_id=None) -> str:
+    """
+    Board version: the change counters of the shown branches (one query),
+    the user's branch set and, for a single branch, its cached capacity.
+    """
+    branch_ids = allowed_branch_ids(request)
+    shown = [branch_id] if branch_id is not None else branch_ids
+    seqs = (BranchOrderSequence.objects.filter(branch_id__in=shown)
+                                       .order_by("branch_id").values_list("branch_id", "value"))
+    parts = [str(request.user.pk), ",".join(map(str, branch_ids)), repr(list(seqs))]
+    if branch_id is not None:
+        cap = branch_capacity(branch_id)
+        parts.append(f"{cap['accepting']}:{cap['paused']}:{cap['eta_minutes']}")
+    return '"board-%s"' % hashlib.md5("|".join(parts).encode()).hexdigest()
+
+def _not_modified(request, etag, last_modified=None, page=True):
+    """304 response if the client's copy is current, else None."""
+    # رسائل التنبيه المعلقة تُعرض مرة واحدة في الصفحة؛ لا نخفيها خلف 304
+    if page and len(messages.get_messages(request)):
+        return None
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        _set_validators(response, etag, last_modified)
+    return response
+
+def _set_validators(response, etag, last_modified=None):
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    # المتصفح يحتفظ بالنسخة لكن يتحقق منها في كل طلب
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+def _order_fragment_html(pk, version) -> str:
+    # المفتاح يتضمن النسخة، فأي تعديل على الطلب ينتج مفتاحًا جديدًا ولا حاجة للحذف
+    key = f"orders:fragment:{pk}:{version}"
+    html = cache.get(key)
+    if html is None:
+        order = (Order.objects.select_related("customer", "branch")
+                              .prefetch_related("invoices").filter(pk=pk).first())
+        if order is not None:
+            items = OrderItem.objects.filter(order=order)
+        else:
+            order = get_object_or_404(ArchivedOrder.objects.select_related("customer", "branch"), pk=pk)
+            items = ArchivedOrderItem.objects.filter(order=order)
+        items = items.select_related("product").order_by("id")
+        html = render_to_string("orders/_order_detail.html", {"order": order, "items": items})
+        cache.set(key, html, FRAGMENT_CACHE_TIMEOUT)
+    return html
 
 # ---- views ----------------------------------------------------------------
 
 @login_required(login_url='/users/login/')
 def order_board_default(request):
-    
-    if request.user.profile.role == 'Cashier':
-        return redirect('orders:order_board_by_branch', request.user.profile.branch.id)
-    
     """
     /board/ → find default branch, then redirect to /board/<branch_id>/
     """
-    branch = _user_default_branch(request.user)
-    if branch:
-        return redirect(_rev("order_board_by_branch", branch_id=branch.id))
+    branch_id = default_branch_id(request)
+    if branch_id:
+        return redirect(_rev("order_board_by_branch", branch_id=branch_id))
 
     messages.warning(request, "لا يوجد أي فرع محدد. رجاءً أنشئ فرعًا أولاً.")
     # change "branches" below to your actual branches list url name if different
@@ -81,110 +139,290 @@ def order_board(request, branch_id: int | None = None):
     if branch_from_query and (branch_id is None or str(branch_id) != str(branch_from_query)):
         return redirect("orders:order_board_by_branch", branch_id=int(branch_from_query))
 
-    if request.user.profile.role == 'Cashier' and branch_id != request.user.profile.branch.id:
-        return redirect('orders:order_board')
-    
-    # allowed branches per role (your code)
-    if hasattr(request.user, "role") and request.user.role in ["Cashier", "KitchenStaff"]: # مهو شغال الشرط لازم توصل للدور من البروفايل
-        branches = Branch.objects.filter(employees__user=request.user).distinct()
-    elif hasattr(request.user.profile, "role") and request.user.profile.role == "RestaurantOwner":
-        branches = Branch.objects.filter(restaurant__owner=request.user)
-    else:
-        branches = Branch.objects.all()
+    branch_ids = allowed_branch_ids(request)
+    branches = Branch.objects.filter(pk__in=branch_ids).order_by("id")
 
     active_branch = None
     if branch_id is not None:
-        try:
-            active_branch = get_object_or_404(branches, pk=branch_id)
-        except Http404:
+        if branch_id not in branch_ids:
             messages.error(request, 'الفرع غير موجود الرجاء اختيار الفرع المناسب', 'alert-danger')
             return redirect('orders:order_board')
 
-    # نجلب الطلبات مع العميل والفرع، ونُحضّر الفواتير لتفادي استعلامات إضافية في القالب
+    # لوحة لم تتغير منذ آخر تحديث: 304 بعد قراءة عدّاد الفرع فقط
+    etag = _board_etag(request, branch_id)
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    if branch_id is not None:
+        active_branch = next((b for b in branches if b.pk == branch_id), None)
+
+    # نجلب الطلبات المفتوحة باستعلام واحد مع العميل والفرع، ونُحضّر الفواتير لتفادي استعلامات إضافية في القالب
     qs = (Order.objects.select_related("customer", "branch")
                      .prefetch_related("invoices")
-                     .filter(branch__in=branches)
+                     .filter(branch_id__in=branch_ids, status__in=BOARD_STATUSES)
                      .order_by("-created_at"))
     if active_branch:
         qs = qs.filter(branch=active_branch)
 
+    columns = {status: [] for status in BOARD_STATUSES}
+    for order in qs:
+        columns[order.status].append(order)
+
     context = {
         "branches": branches,
         "active_branch": active_branch,
-        "new_orders": qs.filter(status=OrderStatus.NEW),
-        "preparing_orders": qs.filter(status=OrderStatus.PREPARING),
-        "ready_orders": qs.filter(status=OrderStatus.READY),
+        "new_orders": columns[OrderStatus.NEW],
+        "preparing_orders": columns[OrderStatus.PREPARING],
+        "ready_orders": columns[OrderStatus.READY],
         "advanceable_statuses": [OrderStatus.NEW, OrderStatus.PREPARING, OrderStatus.READY],
+        "board_cursor": board_head(active_branch.id) if active_branch else (0, 0),
+        "capacity": branch_capacity(active_branch.id) if active_branch else None,
+        "live_stream": _is_asgi(request),
         "current_page": "orders:order_board", 
     }
-    return render(request, "orders/board.html", context)
+    return _set_validators(render(request, "orders/board.html", context), etag)
+
+
+CHANGES_PAGE_SIZE = 200
+
+@login_required(login_url='/users/login/')
+def order_board_changes(request, branch_id: int):
+    """
+    Orders of a branch whose state changed after the cursor
+    ``?since=<seq>&after=<id>``.  Without ``since`` only the current cursor
+    is returned.  ``?html=1`` adds the rendered board card of each order
+    (used by the board itself).
+    """
+    if not can_access_branch(request, branch_id):
+        return HttpResponseForbidden()
+
+    try:
+        since = int(request.GET.get("since", ""))
+        after = int(request.GET.get("after") or 0)
+    except ValueError:
+        seq, last_id = board_head(branch_id)
+        return JsonResponse({"cursor": seq, "cursor_id": last_id, "orders": []})
+
+    with_html = request.GET.get("html") == "1"
+    # المؤشر (التسلسل، المعرّف): التحديث الجماعي يعطي عدة طلبات نفس التسلسل
+    rows = changed_orders(branch_id, since, after, limit=CHANGES_PAGE_SIZE + 1, with_html=with_html)
+    more = len(rows) > CHANGES_PAGE_SIZE
+    rows = rows[:CHANGES_PAGE_SIZE]
+
+    orders = []
+    for o in rows:
+        if with_html:
+            item = build_order_event(o, "changed")
+        else:
+            item = {"order_id": o.pk, "status": o.status}
+        item.update({
+            "seq": o.change_seq,
+            "total": str(o.total_price),
+            "payment_method": o.payment_method,
+            "created_at": o.created_at.isoformat(),
+        })
+        orders.append(item)
+
+    if rows:
+        cursor, cursor_id = rows[-1].change_seq, rows[-1].pk
+    else:
+        cursor, cursor_id = max(since, 0), after
+    return JsonResponse({"cursor": cursor, "cursor_id": cursor_id, "more": more, "orders": orders})
+
+
+async def order_board_stream(request, branch_id: int):
+    """
+    Server-Sent Events stream of order changes for one branch.
+    Needs an ASGI server (see hallaOrder/asgi.py); each screen keeps one
+    connection open and applies the diffs pushed by orders.events.
+    """
+    if not await sync_to_async(can_access_branch)(request, branch_id):
+        return HttpResponseForbidden()
+    if not _is_asgi(request):
+        # WSGI يقرأ المولّد كاملًا قبل الإرسال فيحجز العامل؛ 204 يوقف EventSource
+        # عن إعادة الاتصال وتبقى الشاشة على سحب نقطة changes
+        return HttpResponse(status=204)
+
+    async def _events():
+        yield "retry: 3000\n\n"
+        async for event in get_broker().subscribe(branch_id):
+            if event is None:
+                yield ": ping\n\n"  # heartbeat keeps proxies from closing the stream
+                continue
+            yield f"event: order\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    response = StreamingHttpResponse(_events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+@login_required(login_url='/users/login/')
+def kitchen_board(request, branch_id: int):
+    """
+    Items to prepare across every New/Preparing order of a branch,
+    e.g. "14 × شاورما".  ``?format=json`` returns the rows only.
+    """
+    if not can_access_branch(request, branch_id):
+        raise Http404
+    branch = get_object_or_404(Branch, pk=branch_id)
+    rows = kitchen_summary(branch.id)
+    if request.GET.get("format") == "json":
+        return JsonResponse({"branch_id": branch.id, "rows": rows})
+    return render(request, "orders/kitchen.html", {
+        "active_branch": branch,
+        "rows": rows,
+        "live_stream": _is_asgi(request),
+        "current_page": "orders:order_board",
+    })
+
+@login_required(login_url='/users/login/')
+def order_search(request, branch_id: int):
+    """
+    Cashier lookup within one branch: ``?q=`` phone prefix, name prefix,
+    ticket (A-042) or order id; ``?days=`` window (default today, max 31).
+    """
+    if not can_access_branch(request, branch_id):
+        raise Http404
+    try:
+        days = int(request.GET.get("days") or 1)
+    except ValueError:
+        days = 1
+    orders = search_orders(branch_id, request.GET.get("q"), days=days)
+    return JsonResponse({"results": [
+        {
+            "id": o.pk,
+            "ticket": o.ticket,
+            "name": o.guest_name or "",
+            "phone": o.guest_phone or "",
+            "status": o.status,
+            "total": float(o.total_price or 0),
+            "created_at": o.created_at.isoformat(),
+            "url": _rev("order_detail", pk=o.pk),
+        }
+        for o in orders
+    ]})
 
 @login_required(login_url='/users/login/')
 def order_detail(request, pk: int):
-    order = (
-        Order.objects.select_related("customer", "branch")
-        .prefetch_related("items__product", "invoices")
-        .get(pk=pk)
-    )
-    return render(request, "orders/detail.html", {"order": order})
+    version, updated_at = _order_version(request, pk)
+    etag = f'"order-page-{pk}-v{version}"'
+    not_modified = _not_modified(request, etag, updated_at)
+    if not_modified is not None:
+        return not_modified
+    response = render(request, "orders/detail.html", {
+        "order_id": pk,
+        "fragment": _order_fragment_html(pk, version),
+        "current_page": "orders:order_board",
+    })
+    return _set_validators(response, etag, updated_at)
 
 @login_required(login_url='/users/login/')
+@require_POST
 def advance_status(request, pk: int):
     """
     Advance: New → Preparing → Ready → Delivered
     """
-    if request.method != "POST":
-        # allow GET fallback during testing; you can enforce POST only
-        pass
-
-    order = get_object_or_404(Order, pk=pk)
-    nxt = STATUS_FLOW.get(order.status)
+    # طلبات فروع المستخدم فقط، كما في النقل الجماعي
+    order = get_object_or_404(Order, pk=pk, branch_id__in=allowed_branch_ids(request))
+    # الحالة التي رآها الكاشير على الشاشة؛ النقل يتم فقط إن لم تتغير منذ ذلك
+    expected = request.POST.get("expected") or order.status
+    nxt = STATUS_FLOW.get(expected)
     if not nxt:
         messages.info(request, "لا يمكن نقل الطلب من حالته الحالية.")
         return redirect(_rev("order_board_by_branch", branch_id=order.branch_id))
 
-    order.status = nxt
-    order.save(update_fields=["status"])
+    if not services.advance_order(order, expected):
+        messages.warning(request, f"تم تحديث الطلب #{order.pk} من شاشة أخرى، راجع حالته الحالية.")
+        return redirect(_rev("order_board_by_branch", branch_id=order.branch_id))
+
     messages.success(request, f"تم نقل الطلب #{order.pk} إلى {nxt}.")
     return redirect(_rev("order_board_by_branch", branch_id=order.branch_id))
 
 @login_required(login_url='/users/login/')
-def cancel_order(request, pk: int):
+def advance_bulk(request, branch_id: int):
+    """
+    Advance several selected orders of a branch in one round-trip.
+    POST ``orders`` repeated as ``<id>:<expected status>``.
+    """
     if request.method != "POST":
-        # allow GET fallback during testing; you can enforce POST only
-        pass
+        return JsonResponse({"error": "POST required"}, status=405)
+    if not can_access_branch(request, branch_id):
+        return HttpResponseForbidden()
+
+    expected_by_id = {}
+    for raw in request.POST.getlist("orders"):
+        order_id, _, expected = raw.partition(":")
+        if order_id.isdigit() and expected in STATUS_FLOW:
+            expected_by_id[int(order_id)] = expected
+    if not expected_by_id:
+        return JsonResponse({"advanced": [], "conflicts": []})
+
+    result = services.advance_orders(branch_id, expected_by_id)
+    if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+        return JsonResponse(result)
 
-    order = get_object_or_404(Order, pk=pk)
-    if order.status in (OrderStatus.DELIVERED, OrderStatus.CANCELLED):
+    if result["advanced"]:
+        messages.success(request, f"تم نقل {len(result['advanced'])} طلب(ات).")
+    if result["conflicts"]:
+        messages.warning(request, f"{len(result['conflicts'])} طلب(ات) تغيّرت حالتها من شاشة أخرى ولم تُنقل.")
+    return redirect(_rev("order_board_by_branch", branch_id=branch_id))
+
+@login_required(login_url='/users/login/')
+def toggle_online_orders(request, branch_id: int):
+    """Pause / resume online ordering for a branch (manual override)."""
+    if request.method != "POST":
+        return redirect(_rev("order_board_by_branch", branch_id=branch_id))
+    if not can_access_branch(request, branch_id):
+        return HttpResponseForbidden()
+
+    limits, _ = BranchCapacity.objects.get_or_create(branch_id=branch_id)
+    limits.paused = not limits.paused
+    # العلم يُقرأ من قاعدة البيانات في كل عامل؛ لا كاش لنمسحه
+    limits.save(update_fields=["paused"])
+    if limits.paused:
+        messages.warning(request, "تم إيقاف استقبال الطلبات أونلاين لهذا الفرع.")
+    else:
+        messages.success(request, "تم استئناف استقبال الطلبات أونلاين.")
+    return redirect(_rev("order_board_by_branch", branch_id=branch_id))
+
+@login_required(login_url='/users/login/')
+@require_POST
+def cancel_order(request, pk: int):
+    order = get_object_or_404(Order, pk=pk, branch_id__in=allowed_branch_ids(request))
+    # كما في النقل: الإلغاء فقط إن بقي الطلب على الحالة التي رآها الكاشير
+    expected = request.POST.get("expected") or order.status
+    if expected not in CANCELLABLE_STATUSES:
         messages.info(request, "لا يمكن إلغاء هذا الطلب.")
         return redirect(_rev("order_board_by_branch", branch_id=order.branch_id))
 
-    order.status = OrderStatus.CANCELLED
-    order.save(update_fields=["status"])
+    if not services.cancel_order(order, expected):
+        messages.warning(request, f"تم تحديث الطلب #{order.pk} من شاشة أخرى، راجع حالته الحالية.")
+        return redirect(_rev("order_board_by_branch", branch_id=order.branch_id))
+
     messages.warning(request, f"تم إلغاء الطلب #{order.pk}.")
     return redirect(_rev("order_board_by_branch", branch_id=order.branch_id))
 
-def _allowed_branches_for(user):
-    if hasattr(user, "role") and user.role in ["Cashier", "KitchenStaff"]:
-        return Branch.objects.filter(employees__user=user).distinct()
-    elif hasattr(user, "role") and user.role == "RestaurantOwner":
-        return Branch.objects.filter(restaurant__owner=user)
-    return Branch.objects.all()
-
+@login_required(login_url='/users/login/')
 def order_detail_fragment(request, pk: int):
-    allowed = _allowed_branches_for(request.user)
-
-    order = get_object_or_404(
-        Order.objects.select_related("customer", "branch"),
-        pk=pk,
-        branch__in=allowed,
-    )
-
-    items = (
-        OrderItem.objects
-        .select_related("product")
-        .filter(order=order)
-        .order_by("id")
-    )
-
-    return render(request, "orders/_order_detail.html", {"order": order, "items": items})
\ No newline at end of file
+    """
+    Rendered ``_order_detail.html`` for the board modal.
+    Cached per order version; repeat opens of an unchanged order get a 304.
+    """
+    version, updated_at = _order_version(request, pk)
+    etag = f'"order-{pk}-v{version}"'
+    not_modified = _not_modified(request, etag, updated_at, page=False)
+    if not_modified is not None:
+        return not_modified
+    return _set_validators(HttpResponse(_order_fragment_html(pk, version)), etag, updated_at)
+
+
+def metrics(request):
+    """Prometheus scrape endpoint (see orders/metrics.py)."""
+    token = getattr(settings, "ORDERS_METRICS_TOKEN", None)
+    if token:
+        scheme, _, given = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not constant_time_compare(given.strip(), token):
+            return HttpResponseForbidden()
+    elif not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(order_metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,5 +1,6 @@
-from django.contrib import admin
-from .models import Payment, Invoice
+from django.contrib import admin, messages
+from django.utils import timezone
+from .models import Payment, Invoice, CheckoutSession, EmailOutbox
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
@@ -13,3 +14,32 @@ class InvoiceAdmin(admin.ModelAdmin):
     list_display = ("id", "order", "customer_email", "total_amount", "compliance_status", "sent_via", "created_at")
     list_filter = ("compliance_status", "sent_via", "created_at")
     search_fields = ("order__id", "customer_email")
+
+
+@admin.register(CheckoutSession)
+class CheckoutSessionAdmin(admin.ModelAdmin):
+    list_display = ("id", "session_id", "website", "amount", "status", "order", "created_at", "completed_at")
+    list_filter = ("status",)
+    search_fields = ("session_id", "payment_intent")
+    raw_id_fields = ("customer", "order")
+    readonly_fields = ("created_at", "completed_at")
+
+
+
+@admin.action(description="إعادة الإرسال")
+def retry_emails(modeladmin, request, queryset):
+    updated = queryset.exclude(status=EmailOutbox.Status.SENT).update(
+        status=EmailOutbox.Status.PENDING, attempts=0, available_at=timezone.now(),
+    )
+    messages.success(request, f"أُعيدت {updated} رسالة إلى صندوق الإرسال.")
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ("id", "invoice", "to_email", "status", "attempts", "created_at", "sent_at")
+    list_filter = ("status",)
+    search_fields = ("to_email",)
+    raw_id_fields = ("invoice",)
+    readonly_fields = ("last_error",)
+    ordering = ("-id",)
+    actions = [retry_emails]
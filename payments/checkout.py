@@ -0,0 +1,272 @@
+# payments/checkout.py
+"""
+Storefront checkout → order, exactly once.
+
+``quick_checkout`` saves the cart, customer details and order data in a
+``CheckoutSession`` row keyed by the Stripe session id before sending the
+customer to Stripe.  ``materialize(session_id)`` builds the Order, its
+details, items and invoice from that row, and credits the restaurant
+wallet once the order has committed (retried by every later call until
+the ledger line exists).  It is called by
+the ``checkout.session.completed`` webhook and, as a fallback, by the
+status endpoint the success page polls; the row is locked while the order
+is built, so a refresh, a double redirect or a webhook retry never creates
+a second order.
+"""
+import json
+import logging
+from decimal import Decimal
+
+import stripe
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from menu.models import Product
+from orders.capacity import checkout_branch_id
+from orders.events import publish_order_event, ORDER_CREATED
+from orders.models import (
+    Order, OrderStatus, OrderItem, OrderItemOption, PaymentMethod, DeliveryDetails, PickupDetails, DineInDetails,
+)
+from orders.pricing import OptionPrices, item_option_rows
+from orders.scheduling import due_time_from_order_data, initial_status, schedule_order
+from restaurants.models import Branch
+
+from .models import CheckoutSession, CheckoutStatus, Invoice
+from .outbox import queue_invoice_email
+from .wallet import credit_order_on_commit
+
+logger = logging.getLogger(__name__)
+
+# أقل مدة بين استعلامين من Stripe لنفس الجلسة من صفحة الانتظار
+STRIPE_SYNC_INTERVAL = 5
+
+
+def save_checkout_session(request, website, stripe_session, amount, currency) -> CheckoutSession:
+    """Persist what the order will be built from, keyed by the Stripe session id."""
+    user = request.user if request.user.is_authenticated else None
+    checkout, _ = CheckoutSession.objects.update_or_create(
+        session_id=stripe_session.id,
+        defaults={
+            "website": website,
+            "customer": user,
+            "cart": request.session.get(f"cart_{website.id}", []),
+            "meta": request.session.get(f"cart_meta_{website.id}", {}),
+            "order_data": request.session.get("order_data"),
+            "amount": amount,
+            "currency": currency,
+        },
+    )
+    return checkout
+
+
+# ---- materialization --------------------------------------------------------
+
+def materialize(session_id, payment_intent="") -> int | None:
+    """
+    Build the order of a paid checkout session once; returns its id.
+    Later calls for the same session return the existing order id.
+    """
+    with transaction.atomic():
+        checkout = (
+            CheckoutSession.objects.select_for_update()
+            .select_related("website__restaurant", "customer")
+            .filter(session_id=session_id)
+            .first()
+        )
+        if checkout is None:
+            return None
+        if not checkout.order_id:
+            order = _build_order(checkout)
+            checkout.order = order
+            checkout.status = CheckoutStatus.COMPLETED
+            checkout.payment_intent = payment_intent or ""
+            checkout.completed_at = timezone.now()
+            checkout.save(update_fields=["order", "status", "payment_intent", "completed_at"])
+            # آخر خطوة قبل الالتزام: قفل عدّاد الفرع لا يُمسك أثناء كتابة الطلب وعناصره
+            Order.stamp_change_seq(order)
+    # رصيد المحفظة بعد الالتزام وفي كل استدعاء: لو فشل بعد حفظ الطلب
+    # تضيفه إعادة الويب هوك (credit_order لا يضيف الرصيد مرتين)
+    credit_order_on_commit(checkout.website.restaurant_id, checkout.order_id)
+    return checkout.order_id
+
+
+def _branch_for(checkout):
+    restaurant = checkout.website.restaurant
+    branch_id = checkout_branch_id(checkout.order_data, restaurant)
+    if branch_id:
+        return Branch.objects.filter(pk=branch_id).first()
+    return Branch.objects.order_by("id").first()
+
+
+def _build_order(checkout) -> Order:
+    website = checkout.website
+    cart = checkout.cart or []
+    meta = checkout.meta or {}
+    order_data = checkout.order_data or {}
+    method = order_data.get("order_method") or None
+
+    subtotal = sum((Decimal(str(i.get("price", 0)))) for i in cart)
+    tax = 0  # (subtotal * Decimal("0.15")).quantize(Decimal("0.01"))
+    total = (subtotal + tax).quantize(Decimal("0.01"))
+
+    branch = _branch_for(checkout)
+    # طلب مسبق: يبقى خارج اللوحة حتى قبل موعده بمدة التجهيز
+    due_at = due_time_from_order_data(order_data)
+    initial = initial_status(due_at)
+    order = Order(
+        branch=branch,
+        status=initial,
+        total_price=total,
+        payment_method=PaymentMethod.ONLINE,
+        order_method=method,
+    )
+    if checkout.customer_id:
+        order.customer = checkout.customer
+    else:
+        order.guest_name = meta.get("name", "")
+        order.guest_phone = meta.get("phone", "")
+    order.save(defer_change_seq=True)
+
+    if method == "dine_in":
+        DineInDetails.objects.create(
+            order=order,
+            branch=branch,
+            number_of_people=order_data["dinein"]["number_of_people"],
+            special_requests=order_data["dinein"]["special_requests"],
+            reservation_time=due_at,
+        )
+    elif method == "pickup":
+        PickupDetails.objects.create(order=order, branch=branch, pickup_time=due_at)
+    elif method == "delivery":
+        DeliveryDetails.objects.create(
+            order=order,
+            address=order_data["delivery"]["address"],
+            city="",
+            delivery_time=due_at,
+        )
+    if initial == OrderStatus.SCHEDULED:
+        schedule_order(order, due_at)
+
+    _create_lines(order, cart, website.restaurant_id)
+
+    email = checkout.customer.email if checkout.customer_id else (meta.get("email") or "")
+    _sync_invoice(order, (meta.get("name") or "").strip(), (meta.get("phone") or "").strip(), email)
+
+    # إشعار شاشات لوحة الطلبات بالطلب الجديد (المجدول يُنشر عند إطلاقه)
+    if order.status != OrderStatus.SCHEDULED:
+        publish_order_event(order, ORDER_CREATED)
+    return order
+
+
+def _cart_product_id(line):
+    try:
+        return int(line.get("id"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _create_lines(order, cart, restaurant_id) -> list:
+    """
+    Order lines of ``cart`` with a fixed number of queries: products and
+    options are loaded once, lines are priced in memory and written with
+    one ``bulk_create`` (plus one for their option snapshots).
+    """
+    products = Product.objects.filter(category__restaurant_id=restaurant_id).in_bulk(
+        {pk for pk in map(_cart_product_id, cart) if pk is not None}
+    )
+    option_prices = OptionPrices(restaurant_id)
+    items, selections = [], []
+    for line in cart:
+        product = products.get(_cart_product_id(line))
+        try:
+            qty = int(line.get("qty", 1) or 1)
+        except (TypeError, ValueError):
+            qty = 0
+        if product is None or qty <= 0:
+            # منتج محذوف أو من مطعم آخر: لا نضيفه للطلب
+            logger.warning("Skipping cart line %r of order %s", line, order.pk)
+            continue
+        # سعر القطعة كما دُفع، وتعديل الخيارات = السعر النهائي - السعر الأساسي
+        unit_price = Decimal(str(line.get("final_price", product.price) or 0)).quantize(Decimal("0.01"))
+        adjustment = unit_price - Decimal(str(line.get("base_price", product.price) or 0))
+        options = json.dumps(line.get("options") or {}, ensure_ascii=False) if line.get("options") else ""
+        addons = ",".join(line.get("addons", []) or [])
+        items.append(OrderItem(
+            order=order,
+            product=product,
+            quantity=qty,
+            options=options,
+            addons=addons,
+            option_adjustment=adjustment.quantize(Decimal("0.01")),
+            unit_price=unit_price,
+            line_total=unit_price * qty,
+        ))
+        selections.append(option_prices.resolve(options, addons))
+
+    # bulk_create لا يمر بـ OrderItem.save ولا إشاراته؛ الطلب جديد فلا نسخة مخزنة تسقط
+    OrderItem.objects.bulk_create(items)
+    if items and items[0].pk is None:
+        # MySQL لا يعيد المعرفات من الإدخال الجماعي؛ الطلب جديد فترتيبها هو ترتيب الإدخال
+        pks = OrderItem.objects.filter(order=order).order_by("pk").values_list("pk", flat=True)
+        for item, pk in zip(items, pks):
+            item.pk = pk
+    # لقطة الخيارات وأسعارها وقت البيع
+    OrderItemOption.objects.bulk_create([
+        row for item, selected in zip(items, selections) for row in item_option_rows(item, selected)
+    ])
+    return items
+
+
+def _sync_invoice(order, name, phone, email) -> None:
+    """Fill the invoice created with the order with the checkout's customer details."""
+    invoice, created = Invoice.objects.get_or_create(
+        order=order,
+        defaults={
+            "customer_name": name,
+            "customer_phone": phone,
+            "customer_email": email,
+            "total_amount": order.total_price,
+            "compliance_status": False,
+            "sent_via": "Email",
+        },
+    )
+    if created:
+        return
+    changes = {}
+    if name and invoice.customer_name != name:
+        changes["customer_name"] = name
+    if phone and invoice.customer_phone != phone:
+        changes["customer_phone"] = phone
+    if email and invoice.customer_email != email:
+        changes["customer_email"] = email
+    if invoice.total_amount != order.total_price:
+        changes["total_amount"] = order.total_price
+    if changes:
+        # update() بدل save(): الطلب جديد فلا داعي لإشارة رفع نسخته مرة أخرى
+        Invoice.objects.filter(pk=invoice.pk).update(document_hash="", **changes)
+        if "customer_email" in changes:
+            queue_invoice_email(invoice, email)
+
+
+# ---- fallback when the webhook is late --------------------------------------
+
+def sync_with_stripe(checkout) -> int | None:
+    """
+    Ask Stripe about a session the webhook has not completed yet (throttled
+    per session).  Materializes it when paid; returns the order id if any.
+    """
+    if checkout.order_id or checkout.status != CheckoutStatus.OPEN:
+        return checkout.order_id
+    if not cache.add(f"payments:stripe_sync:{checkout.session_id}", 1, STRIPE_SYNC_INTERVAL):
+        return None
+    try:
+        session = stripe.checkout.Session.retrieve(checkout.session_id)
+    except stripe.error.StripeError:
+        logger.warning("Stripe lookup failed for checkout %s", checkout.session_id, exc_info=True)
+        return None
+    if session.payment_status == "paid":
+        return materialize(checkout.session_id, session.payment_intent or "")
+    if session.status == "expired":
+        CheckoutSession.objects.filter(pk=checkout.pk, status=CheckoutStatus.OPEN).update(status=CheckoutStatus.EXPIRED)
+    return None
@@ -0,0 +1,114 @@
+# payments/documents.py
+"""
+Invoice documents rendered once and kept as files.
+
+``invoice_document(invoice)`` renders ``invoice_document.html`` and a PDF of
+the same content from the invoice and its order lines (snapshot prices), and
+stores both under ``MEDIA_ROOT/invoices/`` named by the SHA-256 of the HTML.
+The hash is kept on ``Invoice.document_hash``; as long as it is set, pages
+and emails use the stored files without touching the order tables.  Pages
+link to ``payments.views.invoice_document_file``, which checks who is asking
+and streams the file (MEDIA is only served by Django itself under DEBUG).
+``Invoice.save`` and changes to the order's lines clear the hash, so the
+next request renders a new file (old files are immutable and never edited).
+"""
+import hashlib
+from decimal import Decimal
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from orders.archive import get_order_any
+from orders.kitchen import parse_addons, parse_options
+from orders.models import ArchivedOrderItem, OrderItem
+from orders.printing import lines_to_pdf
+
+from .models import Invoice
+
+DOCUMENT_DIR = "invoices"
+
+
+def document_path(digest, ext) -> str:
+    return f"{DOCUMENT_DIR}/{digest[:2]}/{digest}.{ext}"
+
+
+def document_url(invoice, ext="html"):
+    """URL of the stored document (served by an access-checked view), rendering it first if needed."""
+    digest = invoice_document(invoice)
+    return reverse("payments:invoice_document", args=[invoice.pk, digest, ext]) if digest else None
+
+
+def open_document(invoice, ext="html"):
+    """The stored document as an open binary file."""
+    return default_storage.open(document_path(invoice_document(invoice), ext), "rb")
+
+
+def read_document(invoice, ext="html") -> bytes:
+    with open_document(invoice, ext) as fh:
+        return fh.read()
+
+
+# ---- rendering --------------------------------------------------------------
+
+def _lines(order) -> list:
+    model = OrderItem if order._meta.model_name == "order" else ArchivedOrderItem
+    items = model.objects.filter(order_id=order.pk).select_related("product").order_by("pk")
+    lines = []
+    for item in items:
+        # سطر أرشيف حُذف منتجه: السعر من اللقطة فقط، وبلا لقطة لا يُعرض
+        unit_price = item.unit_price
+        if unit_price is None:
+            if not item.product_id:
+                continue
+            unit_price = Decimal(item.product.price)
+        lines.append({
+            "name": item.product.name if item.product_id else "—",
+            "quantity": item.quantity,
+            "options": parse_options(item.options) + parse_addons(item.addons),
+            "unit_price": unit_price,
+            "line_total": item.line_total if item.line_total is not None else unit_price * item.quantity,
+        })
+    return lines
+
+
+def render_invoice(invoice) -> tuple:
+    """``(html, pdf_bytes)`` of an invoice, from the live tables."""
+    order = get_order_any(pk=invoice.order_id)
+    lines = _lines(order) if order else []
+    html = render_to_string("payments/invoice_document.html", {"invoice": invoice, "order": order, "lines": lines})
+
+    pdf_lines = [("title", f"#{invoice.order_id}")]
+    if order is not None:
+        pdf_lines.append(("", f"{order.ticket}  {order.created_at:%Y-%m-%d %H:%M}"))
+    pdf_lines += [("", invoice.customer_name or ""), ("", "-" * 32)]
+    for line in lines:
+        pdf_lines.append(("bold", f"{line['quantity']} x {line['name']}  {line['line_total']:.2f}"))
+        pdf_lines += [("", f"   + {label}") for label in line["options"]]
+    pdf_lines += [("", "-" * 32), ("bold", f"SAR {invoice.total_amount}")]
+    return html, lines_to_pdf(pdf_lines)
+
+
+def _store(name, data) -> None:
+    if default_storage.exists(name):
+        return
+    saved = default_storage.save(name, ContentFile(data))
+    if saved != name:
+        # نفس المحتوى كُتب للتو من طلب آخر؛ لا حاجة للنسخة ذات الاسم البديل
+        default_storage.delete(saved)
+
+
+def invoice_document(invoice) -> str:
+    """Content hash of the invoice's stored documents, rendering them if stale."""
+    if invoice.document_hash and default_storage.exists(document_path(invoice.document_hash, "pdf")):
+        return invoice.document_hash
+    html, pdf = render_invoice(invoice)
+    data = html.encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()
+    _store(document_path(digest, "html"), data)
+    _store(document_path(digest, "pdf"), pdf)
+    # update() لا يمر بـ Invoice.save فلا يُسقط البصمة التي حفظناها للتو
+    Invoice.objects.filter(pk=invoice.pk).update(document_hash=digest)
+    invoice.document_hash = digest
+    return digest
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.outbox import send_batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Send queued invoice emails from the outbox, one SMTP connection per "
+        "batch. With --loop it keeps polling every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=50, help="emails claimed per round")
+        parser.add_argument("--loop", action="store_true", help="run as a worker process")
+        parser.add_argument("--interval", type=float, default=5, help="seconds between polls with --loop")
+
+    def handle(self, *args, **opts):
+        while True:
+            result = send_batch(limit=opts["batch"])
+            if result["sent"] or result["failed"] or not opts["loop"]:
+                self.stdout.write(f"sent {result['sent']}, failed {result['failed']}")
+            if not opts["loop"]:
+                return
+            # دفعة ممتلئة: نكمل مباشرة بدل الانتظار
+            if result["sent"] + result["failed"] < opts["batch"]:
+                time.sleep(opts["interval"])
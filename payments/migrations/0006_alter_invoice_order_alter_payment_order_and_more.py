@@ -0,0 +1,30 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_order_archive'),
+        ('payments', '0005_wallettransaction'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='invoice',
+            name='order',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='invoices', to='orders.order'),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='order',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='payments', to='orders.order'),
+        ),
+        migrations.AlterField(
+            model_name='wallettransaction',
+            name='order',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='wallet_transactions', to='orders.order'),
+        ),
+    ]
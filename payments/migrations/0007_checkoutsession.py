@@ -0,0 +1,41 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('websites', '0002_alter_website_logo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('orders', '0016_kitchen_printing'),
+        ('payments', '0006_alter_invoice_order_alter_payment_order_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckoutSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=255, unique=True)),
+                ('cart', models.JSONField(default=list)),
+                ('meta', models.JSONField(blank=True, default=dict)),
+                ('order_data', models.JSONField(blank=True, null=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('currency', models.CharField(default='sar', max_length=3)),
+                ('status', models.CharField(choices=[('open', 'open'), ('completed', 'completed'), ('expired', 'expired')], default='open', max_length=10)),
+                ('payment_intent', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('customer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='checkout_sessions', to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='checkout_sessions', to='orders.order')),
+                ('website', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='checkout_sessions', to='websites.website')),
+            ],
+            options={
+                'db_table': 'checkout_sessions',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='checkout_se_status_f9da21_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0008_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='document_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
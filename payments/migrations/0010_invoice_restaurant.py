@@ -0,0 +1,57 @@
+# Generated by Django 4.2.23 on 2026-10-18 08:58
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+CHUNK = 5000
+
+
+def backfill_restaurant(apps, schema_editor):
+    # الطلب قد يكون في الجدول الحي أو في الأرشيف؛ دفعات بالمعرّف لتقصير الأقفال
+    Invoice = apps.get_model("payments", "Invoice")
+    sources = [apps.get_model("orders", "Order"), apps.get_model("orders", "ArchivedOrder")]
+    last = 0
+    while True:
+        ids = list(Invoice.objects.filter(pk__gt=last, restaurant__isnull=True)
+                                  .order_by("pk").values_list("pk", flat=True)[:CHUNK])
+        if not ids:
+            break
+        for model in sources:
+            restaurant = model.objects.filter(pk=OuterRef("order_id")).values("branch__restaurant_id")[:1]
+            Invoice.objects.filter(pk__in=ids, restaurant__isnull=True).update(restaurant_id=Subquery(restaurant))
+        last = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0002_restaurantverification'),
+        ('orders', '0016_kitchen_printing'),
+        ('payments', '0009_invoice_document_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='restaurant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='invoices', to='restaurants.restaurant'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['restaurant', 'sent_via', 'compliance_status'], name='invoices_restaur_d32f01_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['restaurant', 'customer_name'], name='invoices_restaur_966fdb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['restaurant', 'customer_email'], name='invoices_restaur_5b8d0a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['restaurant', 'customer_phone'], name='invoices_restaur_75c80b_idx'),
+        ),
+        migrations.RunPython(backfill_restaurant, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.23 on 2026-10-18 09:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+CHUNK = 2000
+
+
+def backfill_balances(apps, schema_editor):
+    # رصيد تراكمي لكل مطعم بترتيب المعرّف، ثم صف الرصيد بالمجاميع
+    WalletTransaction = apps.get_model("payments", "WalletTransaction")
+    WalletBalance = apps.get_model("payments", "WalletBalance")
+    restaurant_ids = WalletTransaction.objects.order_by().values_list("restaurant_id", flat=True).distinct()
+    for restaurant_id in list(restaurant_ids):
+        balance = credits = refunds = 0
+        last = 0
+        while True:
+            rows = list(WalletTransaction.objects.filter(restaurant_id=restaurant_id, pk__gt=last)
+                                                 .order_by("pk").only("pk", "kind", "amount_halalah")[:CHUNK])
+            if not rows:
+                break
+            for row in rows:
+                if row.kind == "credit":
+                    credits += row.amount_halalah
+                    balance += row.amount_halalah
+                else:
+                    refunds += row.amount_halalah
+                    balance -= row.amount_halalah
+                row.balance_after = balance
+            WalletTransaction.objects.bulk_update(rows, ["balance_after"])
+            last = rows[-1].pk
+        WalletBalance.objects.update_or_create(
+            restaurant_id=restaurant_id,
+            defaults={"balance_halalah": balance, "credit_total_halalah": credits, "refund_total_halalah": refunds},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0002_restaurantverification'),
+        ('payments', '0010_invoice_restaurant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletBalance',
+            fields=[
+                ('restaurant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='wallet_balance', serialize=False, to='restaurants.restaurant')),
+                ('balance_halalah', models.BigIntegerField(default=0)),
+                ('credit_total_halalah', models.BigIntegerField(default=0)),
+                ('refund_total_halalah', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'wallet_balances',
+            },
+        ),
+        migrations.AddField(
+            model_name='wallettransaction',
+            name='balance_after',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
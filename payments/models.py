@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 # نماذج الدفع والفواتير الخاصة بتطبيق الدفع
 from orders.models import Order
 from restaurants.models import Restaurant
@@ -18,7 +20,8 @@ class PaymentStatus(models.TextChoices):
 
 class Payment(models.Model):
     # سجل دفع مرتبط بأمر شراء معيّن
-    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="payments" , null=True , blank=True)
+    # بدون قيد على مستوى القاعدة: الطلب قد يُنقل إلى الأرشيف ويبقى السجل
+    order = models.ForeignKey(Order, on_delete=models.DO_NOTHING, db_constraint=False, related_name="payments" , null=True , blank=True)
     method = models.CharField(
         max_length=16,
         choices=PaymentMethodGateway.choices,
@@ -45,11 +48,15 @@ class InvoiceSentVia(models.TextChoices):
 
 class Invoice(models.Model):
     # الفاتورة مرتبطة بـ Order واحد، وتضم بيانات العميل من نموذج السلة
+    # بدون قيد على مستوى القاعدة: الطلب قد يُنقل إلى الأرشيف وتبقى الفاتورة
     order = models.ForeignKey(
         Order,
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
         related_name="invoices",
     )
+    # نسخة من مطعم الطلب: لوحة الفواتير تقرأ فواتير المطعم باستعلام واحد على فهرس
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, null=True, blank=True, related_name="invoices")
     customer_name = models.CharField(max_length=255, blank=True)
     customer_phone = models.CharField(max_length=20, blank=True)
     customer_email = models.EmailField()
@@ -57,16 +64,35 @@ class Invoice(models.Model):
     compliance_status = models.BooleanField(default=False)
     sent_via = models.CharField(max_length=10, choices=InvoiceSentVia.choices)
     created_at = models.DateTimeField(auto_now_add=True)
+    # بصمة مستند الفاتورة المولَّد (HTML/PDF) تحت MEDIA_ROOT؛ فارغة = يحتاج توليدًا
+    document_hash = models.CharField(max_length=64, blank=True, default="")
 
     class Meta:
         db_table = "invoices"
         indexes = [
             models.Index(fields=["order", "-created_at"]),
+            models.Index(fields=["restaurant", "sent_via", "compliance_status"]),
+            models.Index(fields=["restaurant", "customer_name"]),
+            models.Index(fields=["restaurant", "customer_email"]),
+            models.Index(fields=["restaurant", "customer_phone"]),
         ]
 
     def __str__(self):
         return f"Invoice #{self.pk} – Order #{self.order_id}"
 
+    def save(self, *args, **kwargs):
+        # أي تعديل على الفاتورة يُسقط المستند المولَّد؛ يُعاد توليده عند أول طلب
+        self.document_hash = ""
+        if self.restaurant_id is None and self.order_id:
+            from orders.models import OrderHistory
+
+            self.restaurant_id = (OrderHistory.objects.filter(pk=self.order_id)
+                                  .values_list("branch__restaurant_id", flat=True).first())
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "document_hash"}
+        super().save(*args, **kwargs)
+
 
 # ---- Wallet ----
 class WalletKind(models.TextChoices):
@@ -76,9 +102,11 @@ class WalletKind(models.TextChoices):
 
 class WalletTransaction(models.Model):
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name="wallet_transactions")
-    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name="wallet_transactions")
+    order = models.ForeignKey(Order, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name="wallet_transactions")
     kind = models.CharField(max_length=10, choices=WalletKind.choices)
     amount_halalah = models.IntegerField()  # store amounts in halalah (1 SAR = 100 halalah)
+    # رصيد المطعم بعد هذه العملية؛ يُكتب مع السطر تحت قفل WalletBalance (payments/wallet.py)
+    balance_after = models.BigIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -89,4 +117,93 @@ class WalletTransaction(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.kind} – {self.amount_halalah}h for {getattr(self.order, 'id', None)}"
+        return f"{self.kind} – {self.amount_halalah}h for {self.order_id}"
+
+
+class WalletBalance(models.Model):
+    """
+    Running totals of a restaurant's wallet, one row per restaurant.  Every
+    ledger insert locks this row and updates it in the same transaction,
+    so reading the balance is one row and withdrawals are serialized.
+    """
+    restaurant = models.OneToOneField(Restaurant, on_delete=models.CASCADE, primary_key=True, related_name="wallet_balance")
+    balance_halalah = models.BigIntegerField(default=0)
+    credit_total_halalah = models.BigIntegerField(default=0)
+    refund_total_halalah = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "wallet_balances"
+
+    def __str__(self):
+        return f"{self.restaurant_id}: {self.balance_halalah}h"
+
+
+# ---- Checkout sessions ----
+class CheckoutStatus(models.TextChoices):
+    OPEN = "open", "open"
+    COMPLETED = "completed", "completed"
+    EXPIRED = "expired", "expired"
+
+
+class CheckoutSession(models.Model):
+    """
+    Cart and checkout choices saved when the Stripe session is created.
+    ``session_id`` is the idempotency key: the order is built once from this
+    row by whichever of the webhook or the success page gets there first
+    (see payments/checkout.py).
+    """
+    session_id = models.CharField(max_length=255, unique=True)
+    website = models.ForeignKey("websites.Website", on_delete=models.SET_NULL, null=True, blank=True, related_name="checkout_sessions")
+    customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="checkout_sessions")
+    cart = models.JSONField(default=list)
+    meta = models.JSONField(default=dict, blank=True)  # اسم/جوال/بريد/ملاحظات العميل
+    order_data = models.JSONField(null=True, blank=True)  # طريقة الاستلام والفرع والموعد
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    currency = models.CharField(max_length=3, default="sar")
+    status = models.CharField(max_length=10, choices=CheckoutStatus.choices, default=CheckoutStatus.OPEN)
+    payment_intent = models.CharField(max_length=255, blank=True)
+    # بدون قيد على مستوى القاعدة: الطلب قد يُنقل إلى الأرشيف
+    order = models.ForeignKey(Order, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name="checkout_sessions")
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "checkout_sessions"
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"Checkout {self.session_id} – {self.status}"
+
+
+# ---- Email outbox ----
+class EmailOutbox(models.Model):
+    """
+    Invoice email waiting to be sent.  Written in the same transaction as the
+    invoice and sent by ``python manage.py email_worker`` (payments/outbox.py).
+    """
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        SENDING = "sending", "Sending"
+        SENT = "sent", "Sent"
+        FAILED = "failed", "Failed"
+
+    # بدون قيد على مستوى القاعدة مثل باقي سجلات الفاتورة
+    invoice = models.ForeignKey(Invoice, on_delete=models.DO_NOTHING, db_constraint=False, related_name="emails")
+    to_email = models.EmailField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # لا يُعاد الإرسال قبل هذا الوقت؛ ووقت الحجز أثناء الإرسال
+    available_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "email_outbox"
+        indexes = [models.Index(fields=["status", "available_at"])]
+
+    def __str__(self):
+        return f"Email for invoice #{self.invoice_id} to {self.to_email} ({self.status})"
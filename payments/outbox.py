@@ -0,0 +1,138 @@
+# payments/outbox.py
+"""
+Invoice emails through an outbox table.
+
+``queue_invoice_email`` only inserts an ``EmailOutbox`` row, in the caller's
+transaction, so an invoice and its email commit (or roll back) together and
+no request waits on SMTP.  The ``email_worker`` command claims pending rows
+in batches and sends each batch over one SMTP connection.  A failed message
+is retried with a growing delay up to MAX_ATTEMPTS; if the connection itself
+drops, it is reopened once and the rest of the batch waits otherwise.
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from .documents import read_document
+from .models import EmailOutbox, Invoice
+
+logger = logging.getLogger(__name__)
+
+CLAIM_TIMEOUT = datetime.timedelta(minutes=5)
+MAX_ATTEMPTS = 6
+RETRY_DELAY_SECONDS = 30  # 30s، 60s، 2m، 4m، 8m
+
+
+# ---- queue ------------------------------------------------------------------
+
+def queue_invoice_email(invoice, to_email=None):
+    """Queue the invoice email; returns the row, or None without a recipient."""
+    to_email = (to_email or invoice.customer_email or "").strip()
+    if not to_email:
+        return None
+    return EmailOutbox.objects.create(invoice_id=invoice.pk, to_email=to_email)
+
+
+# ---- rendering --------------------------------------------------------------
+
+def build_message(row, invoice, connection=None) -> EmailMultiAlternatives:
+    # المستند المولَّد مرة واحدة للفاتورة (payments/documents.py) هو نص الرسالة ومرفقها
+    html_message = read_document(invoice, "html").decode("utf-8")
+    message = EmailMultiAlternatives(
+        subject=f"فاتورة طلبك #{invoice.order_id} - HalaOrder",
+        body=strip_tags(html_message),
+        from_email=getattr(settings, "DEFAULT_FROM_EMAIL", None) or "no-reply@halaorder.local",
+        to=[row.to_email],
+        connection=connection,
+    )
+    message.attach_alternative(html_message, "text/html")
+    message.attach(f"invoice-{invoice.order_id}.pdf", read_document(invoice, "pdf"), "application/pdf")
+    return message
+
+
+# ---- worker -----------------------------------------------------------------
+
+def claim_emails(limit=50) -> list:
+    """
+    Mark up to ``limit`` due rows as sending and return them.  A claim
+    expires after CLAIM_TIMEOUT, so rows of a crashed worker come back.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            EmailOutbox.objects.filter(
+                status__in=(EmailOutbox.Status.PENDING, EmailOutbox.Status.SENDING), available_at__lte=now,
+            )
+            .order_by("pk")
+            .select_for_update(skip_locked=True)
+            .values_list("pk", flat=True)[:limit]
+        )
+        EmailOutbox.objects.filter(pk__in=ids).update(
+            status=EmailOutbox.Status.SENDING, available_at=now + CLAIM_TIMEOUT,
+        )
+    return list(EmailOutbox.objects.filter(pk__in=ids).order_by("pk"))
+
+
+def _finish(row, error=None) -> None:
+    now = timezone.now()
+    attempts = row.attempts + 1
+    if error is None:
+        EmailOutbox.objects.filter(pk=row.pk).update(
+            status=EmailOutbox.Status.SENT, sent_at=now, attempts=attempts, last_error="",
+        )
+        return
+    logger.warning("Invoice email %s failed (attempt %s): %s", row.pk, attempts, error)
+    EmailOutbox.objects.filter(pk=row.pk).update(
+        status=EmailOutbox.Status.FAILED if attempts >= MAX_ATTEMPTS else EmailOutbox.Status.PENDING,
+        attempts=attempts,
+        last_error=str(error)[:1000],
+        available_at=now + datetime.timedelta(seconds=RETRY_DELAY_SECONDS * 2 ** (attempts - 1)),
+    )
+
+
+def send_batch(limit=50) -> dict:
+    """Send one batch over a single connection.  Returns ``{"sent": n, "failed": n}``."""
+    rows = claim_emails(limit)
+    if not rows:
+        return {"sent": 0, "failed": 0}
+    invoices = Invoice.objects.in_bulk({row.invoice_id for row in rows})
+
+    sent = failed = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        # الخادم غير متاح: كل الدفعة تنتظر المحاولة التالية
+        for row in rows:
+            _finish(row, exc)
+        return {"sent": 0, "failed": len(rows)}
+    try:
+        for row in rows:
+            invoice = invoices.get(row.invoice_id)
+            try:
+                if invoice is None:
+                    raise Invoice.DoesNotExist(f"invoice {row.invoice_id} not found")
+                connection.send_messages([build_message(row, invoice, connection)])
+            except Exception as exc:
+                _finish(row, exc)
+                failed += 1
+                # قد يكون الاتصال انقطع؛ نعيد فتحه مرة للرسائل التالية
+                connection.close()
+                connection.open()
+                continue
+            _finish(row)
+            sent += 1
+    except Exception as exc:
+        # تعذرت إعادة الاتصال: ما تبقى من الدفعة يعود للانتظار
+        done = sent + failed
+        for row in rows[done:]:
+            _finish(row, exc)
+        failed += len(rows) - done
+    finally:
+        connection.close()
+    return {"sent": sent, "failed": failed}
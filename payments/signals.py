@@ -1,56 +1,19 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-from django.conf import settings
-from django.db import transaction
+
+from orders.models import Order
+from users.models import Profile
 
 from .models import Invoice
+from .outbox import queue_invoice_email
 
 
 @receiver(post_save, sender=Invoice)
 def send_invoice_email_on_create(sender, instance: Invoice, created: bool, **kwargs):
     if not created:
         return
-    # لا ترسل إذا لم يتوفر بريد إلكتروني
-    to_email = (instance.customer_email or '').strip()
-    if not to_email:
-        return
-
-    invoice_pk = instance.pk
-    from_email = getattr(settings, "DEFAULT_FROM_EMAIL", "no-reply@halaorder.local")
-
-    def _send_after_commit():
-        try:
-            inv = Invoice.objects.select_related("order").get(pk=invoice_pk)
-            order = inv.order
-            items = list(getattr(order, "items", []).select_related("product").all()) if hasattr(order, "items") else []
-
-            subject = f"فاتورة طلبك #{getattr(order, 'id', '')} - HalaOrder"
-            context = {"invoice": inv, "order": order, "items": items}
-            html_message = render_to_string("payments/email_invoice.html", context)
-            plain_message = strip_tags(html_message)
-
-            send_mail(
-                subject=subject,
-                message=plain_message,
-                from_email=from_email,
-                recipient_list=[to_email],
-                html_message=html_message,
-                fail_silently=True,
-            )
-        except Exception:
-            # لا نفشل العملية الأساسية بسبب خطأ في البريد
-            pass
-
-    transaction.on_commit(_send_after_commit)
-
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from orders.models import Order
-from .models import Invoice
-from users.models import Profile
+    # يُرسل لاحقًا من email_worker؛ هنا نضيفه للصندوق ضمن معاملة الفاتورة نفسها
+    queue_invoice_email(instance)
 
 
 @receiver(post_save, sender=Order)
@@ -79,6 +42,7 @@ def create_invoice_for_new_order(sender, instance: Order, created: bool, **kwarg
     # إنشاء الفاتورة بقيم افتراضية مأخوذة من المستخدم/البروفايل
     Invoice.objects.create(
         order=instance,
+        restaurant_id=instance.branch.restaurant_id,
         customer_name=customer_name,
         customer_phone=customer_phone,
         customer_email=customer_email,
@@ -88,3 +52,12 @@ def create_invoice_for_new_order(sender, instance: Order, created: bool, **kwarg
     )
 
 
+# تعديل عناصر الطلب يغيّر محتوى الفاتورة: نُسقط المستند المولَّد ليُعاد توليده
+@receiver(post_save, sender="orders.OrderItem")
+@receiver(post_delete, sender="orders.OrderItem")
+def invalidate_invoice_document(sender, instance, origin=None, **kwargs):
+    # حذف الطلب نفسه (أو أرشفته) يحذف عناصره: لا تحديث لكل سطر ولا إسقاط لمستند طلب مؤرشف
+    if isinstance(origin, Order) or getattr(origin, "model", None) is Order:
+        return
+    if instance.order_id:
+        Invoice.objects.filter(order_id=instance.order_id).exclude(document_hash="").update(document_hash="")
@@ -1,3 +1,435 @@
-from django.test import TestCase
+import shutil
+import smtplib
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from menu.models import Category, Option, OptionGroup, Product
+from orders.archive import archive_chunk, archive_cutoff
+from orders.models import ArchivedOrderItem, Order, OrderItem, OrderItemOption, OrderStatus
+from orders.pricing import recalc_order_totals
+from restaurants.models import Branch, Restaurant
+from websites.models import Website
+
+from .checkout import materialize
+from .documents import document_path, document_url, invoice_document
+from .models import CheckoutSession, CheckoutStatus, EmailOutbox, Invoice, WalletBalance, WalletTransaction
+from .outbox import send_batch
+from .wallet import credit_order, withdraw
+
+
+class CheckoutMaterializeTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user("owner", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        self.branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+        self.website = Website.objects.create(restaurant=restaurant, slug="r")
+        category = Category.objects.create(restaurant=restaurant, name="C")
+        self.products = [
+            Product.objects.create(category=category, name=f"P{i}", price="10.00") for i in range(3)
+        ]
+
+    def _checkout(self, session_id, lines):
+        cart = [
+            {"id": self.products[i % 3].pk, "qty": 2, "base_price": 10.0, "final_price": 12.0,
+             "price": 24.0, "options": {"Size": "Large"}}
+            for i in range(lines)
+        ]
+        return CheckoutSession.objects.create(
+            session_id=session_id, website=self.website, cart=cart, amount=24 * lines,
+            meta={"name": "Guest", "phone": "0550000000", "email": "guest@example.com"},
+            order_data={"order_method": "pickup", "pickup": {"branch_id": str(self.branch.pk), "pickup_time": ""}},
+        )
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        # الطلب الأول ينشئ صفوف العدادات (التذاكر والتسلسل) للفرع
+        self._checkout("cs_first", 1)
+        materialize("cs_first")
+        self._checkout("cs_small", 1)
+        self._checkout("cs_family", 15)
+        with CaptureQueriesContext(connection) as small:
+            materialize("cs_small")
+        with self.assertNumQueries(len(small.captured_queries)):
+            order_id = materialize("cs_family")
+        # 33 على sqlite/postgres؛ MySQL يضيف استعلامًا لمعرفات العناصر بعد الإدخال الجماعي
+        self.assertLessEqual(len(small.captured_queries), 34)
+        sqls = [q["sql"] for q in small.captured_queries]
+        # رصيد المحفظة يُضاف بعد الالتزام: لا قفل لصف رصيد المطعم أثناء الدفع
+        self.assertFalse([sql for sql in sqls if "wallet_" in sql])
+        # تسلسل الفرع يؤخذ في آخر المعاملة لا عند إدخال الطلب
+        last_insert = max(i for i, sql in enumerate(sqls) if sql.startswith("INSERT"))
+        first_seq = min(i for i, sql in enumerate(sqls) if "order_branch_sequences" in sql)
+        self.assertGreater(first_seq, last_insert)
+
+        order = Order.objects.get(pk=order_id)
+        self.assertEqual(order.total_price, 360)
+        items = OrderItem.objects.filter(order=order)
+        self.assertEqual(items.count(), 15)
+        self.assertEqual({(i.unit_price, i.line_total, i.option_adjustment) for i in items}, {(12, 24, 2)})
+        self.assertEqual(OrderItemOption.objects.filter(order_item__order=order).count(), 15)
+
+    def test_materialize_runs_once_per_session(self):
+        self._checkout("cs_twice", 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            first = materialize("cs_twice", "pi_1")
+        # savepoint, locked read, release, then the ledger check after commit
+        with self.assertNumQueries(4), self.captureOnCommitCallbacks(execute=True):
+            second = materialize("cs_twice", "pi_1")
+        self.assertEqual(first, second)
+        self.assertEqual(Order.objects.filter(checkout_sessions__session_id="cs_twice").count(), 1)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(WalletTransaction.objects.filter(order_id=first).count(), 1)
+        checkout = CheckoutSession.objects.get(session_id="cs_twice")
+        self.assertEqual((checkout.status, checkout.order_id), (CheckoutStatus.COMPLETED, first))
+
+    def test_option_prices_are_snapshotted_at_sale_time(self):
+        group = OptionGroup.objects.create(restaurant=self.website.restaurant, name="Size")
+        large = Option.objects.create(group=group, name="Large", price_adjustment="2.00")
+        self._checkout("cs_options", 2)
+        order_id = materialize("cs_options")
+
+        rows = OrderItemOption.objects.filter(order_item__order_id=order_id)
+        self.assertEqual(
+            list(rows.values_list("group_id", "option_id", "group_name", "option_name", "price_adjustment")),
+            [(group.pk, large.pk, "Size", "Large", 2)] * 2,
+        )
+        # تعديل الخيار في القائمة (أو حذفه) لا يغيّر ما بيع ولا إجمالي الطلب
+        Option.objects.filter(pk=large.pk).update(price_adjustment="5.00")
+        self.assertEqual(recalc_order_totals(Order.objects.filter(pk=order_id)), 0)
+        large.delete()
+        self.assertEqual(
+            list(rows.values_list("option_id", "option_name", "price_adjustment")), [(None, "Large", 2)] * 2,
+        )
+        self.assertEqual(Order.objects.get(pk=order_id).total_price, 48)
+
+    def test_failed_wallet_credit_is_made_on_the_next_call(self):
+        self._checkout("cs_retry", 2)
+        with mock.patch("payments.wallet.credit_order", side_effect=RuntimeError("lock wait timeout")):
+            with self.assertRaises(RuntimeError), self.captureOnCommitCallbacks(execute=True):
+                materialize("cs_retry", "pi_1")
+        order_id = CheckoutSession.objects.get(session_id="cs_retry").order_id
+        self.assertIsNotNone(order_id)
+        self.assertFalse(WalletTransaction.objects.filter(order_id=order_id).exists())
+
+        # إعادة الويب هوك: الطلب موجود، والرصيد يُضاف الآن مرة واحدة
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(materialize("cs_retry", "pi_1"), order_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            materialize("cs_retry", "pi_1")
+        self.assertEqual(
+            list(WalletTransaction.objects.filter(order_id=order_id).values_list("kind", "amount_halalah")),
+            [("credit", 4800)],
+        )
+
+    def test_unknown_session_is_ignored(self):
+        self.assertIsNone(materialize("cs_missing"))
+
+
+class RecordingBackend(locmem.EmailBackend):
+    """locmem backend that counts connections and rejects "bounce@" recipients."""
+    opened = 0
+
+    def open(self):
+        RecordingBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        for message in messages:
+            if any(to.startswith("bounce@") for to in message.to):
+                raise smtplib.SMTPRecipientsRefused({message.to[0]: (550, b"no such user")})
+        return super().send_messages(messages)
+
+
+class MediaRootMixin:
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+        super().setUp()
+
+
+@override_settings(EMAIL_BACKEND="payments.tests.RecordingBackend")
+class EmailOutboxTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        RecordingBackend.opened = 0
+        owner = User.objects.create_user("owner", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        self.branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+
+    def _order_for(self, email):
+        customer = User.objects.create_user(email, email=email, password="x")
+        return Order.objects.create(branch=self.branch, customer=customer, total_price="20.00")
+
+    def test_invoice_is_queued_not_sent_inline(self):
+        order = self._order_for("a@example.com")
+        row = EmailOutbox.objects.get()
+        self.assertEqual((row.invoice_id, row.to_email, row.status),
+                         (Invoice.objects.get(order=order).pk, "a@example.com", EmailOutbox.Status.PENDING))
+        self.assertEqual(mail.outbox, [])
+
+    def test_worker_sends_a_batch_over_one_connection(self):
+        for i in range(3):
+            self._order_for(f"c{i}@example.com")
+        self.assertEqual(send_batch(), {"sent": 3, "failed": 0})
+        self.assertEqual(RecordingBackend.opened, 1)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ["c0@example.com", "c1@example.com", "c2@example.com"])
+        self.assertIn("text/html", mail.outbox[0].alternatives[0][1])
+        self.assertEqual(mail.outbox[0].attachments[0][2], "application/pdf")
+        self.assertFalse(EmailOutbox.objects.exclude(status=EmailOutbox.Status.SENT).exists())
+        self.assertEqual(send_batch(), {"sent": 0, "failed": 0})
+
+    def test_failed_email_is_retried_later(self):
+        self._order_for("bounce@example.com")
+        self._order_for("ok@example.com")
+        self.assertEqual(send_batch(), {"sent": 1, "failed": 1})
+        row = EmailOutbox.objects.get(to_email="bounce@example.com")
+        self.assertEqual((row.status, row.attempts), (EmailOutbox.Status.PENDING, 1))
+        self.assertGreater(row.available_at, timezone.now())
+        self.assertIn("no such user", row.last_error)
+        # ليست مستحقة بعد
+        self.assertEqual(send_batch(), {"sent": 0, "failed": 0})
+
+
+class InvoiceDocumentTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        owner = User.objects.create_user("owner", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+        category = Category.objects.create(restaurant=restaurant, name="C")
+        product = Product.objects.create(category=category, name="Shawarma", price="10.00")
+        self.order = Order.objects.create(branch=branch, guest_name="Guest", total_price="20.00")
+        self.item = OrderItem.objects.create(order=self.order, product=product, quantity=2)
+        self.invoice = Invoice.objects.get(order=self.order)
+
+    def test_document_is_rendered_once_and_stored_by_hash(self):
+        from django.core.files.storage import default_storage
+
+        digest = invoice_document(self.invoice)
+        self.assertTrue(default_storage.exists(document_path(digest, "html")))
+        self.assertTrue(default_storage.exists(document_path(digest, "pdf")))
+        with default_storage.open(document_path(digest, "html")) as fh:
+            self.assertIn("Shawarma", fh.read().decode("utf-8"))
+
+        invoice = Invoice.objects.get(pk=self.invoice.pk)
+        self.assertEqual(invoice.document_hash, digest)
+        with self.assertNumQueries(0):
+            self.assertEqual(invoice_document(invoice), digest)
+
+    def test_changes_to_the_invoice_or_its_lines_render_a_new_document(self):
+        first = invoice_document(self.invoice)
+        self.item.quantity = 3
+        self.item.save()
+        invoice = Invoice.objects.get(pk=self.invoice.pk)
+        self.assertEqual(invoice.document_hash, "")
+        second = invoice_document(invoice)
+        self.assertNotEqual(first, second)
+
+        invoice.customer_name = "Someone else"
+        invoice.save(update_fields=["customer_name"])
+        self.assertEqual(Invoice.objects.get(pk=invoice.pk).document_hash, "")
+
+    def _session_order(self, order_id):
+        session = self.client.session
+        session["last_order_id"] = order_id
+        session.save()
+
+    def test_invoice_page_frames_an_access_checked_document_view(self):
+        self._session_order(self.order.pk)
+        response = self.client.get(reverse("payments:last_invoice"))
+        html_url = response.context["document_url"]
+        pdf_url = response.context["document_pdf_url"]
+        self.assertTrue(html_url.startswith(f"/invoice/{self.invoice.pk}/"))
+        self.assertNotIn(settings.MEDIA_URL, html_url)
+        # الصفحة نفسها لا تُؤطَّر؛ ملف الفاتورة فقط داخل نفس الموقع
+        self.assertEqual(response["X-Frame-Options"], "DENY")
+
+        document = self.client.get(html_url)
+        self.assertEqual(document.status_code, 200)
+        self.assertEqual(document["X-Frame-Options"], "SAMEORIGIN")
+        self.assertIn("Shawarma", b"".join(document.streaming_content).decode("utf-8"))
+
+        pdf = self.client.get(pdf_url)
+        self.assertEqual(pdf["Content-Type"], "application/pdf")
+        self.assertIn("attachment", pdf["Content-Disposition"])
+        self.assertTrue(b"".join(pdf.streaming_content).startswith(b"%PDF"))
+
+    def test_document_view_checks_who_is_asking(self):
+        self._session_order(self.order.pk)
+        url = self.client.get(reverse("payments:last_invoice")).context["document_url"]
+
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(User.objects.create_user("stranger", password="x"))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        customer = User.objects.create_user("customer", password="x")
+        Order.objects.filter(pk=self.order.pk).update(customer=customer)
+        self.client.force_login(customer)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_stale_document_link_redirects_to_the_current_file(self):
+        self._session_order(self.order.pk)
+        old_url = self.client.get(reverse("payments:last_invoice")).context["document_url"]
+        self.item.quantity = 3
+        self.item.save()
+        response = self.client.get(old_url)
+        self.assertEqual(response.status_code, 302)
+        self.assertNotEqual(response["Location"], old_url)
+        self.assertEqual(self.client.get(response["Location"]).status_code, 200)
+
+
+    def test_archiving_keeps_the_rendered_document(self):
+        digest = invoice_document(self.invoice)
+        Order.objects.filter(pk=self.order.pk).update(
+            status=OrderStatus.DELIVERED, created_at=timezone.now() - timedelta(days=400),
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(archive_chunk(archive_cutoff()), 1)
+        self.assertFalse([q["sql"] for q in ctx.captured_queries if q["sql"].startswith('UPDATE "invoices"')])
+        self.assertEqual(Invoice.objects.get(pk=self.invoice.pk).document_hash, digest)
+
+    def test_archived_invoice_renders_after_its_product_is_deleted(self):
+        extra = OrderItem.objects.create(order=self.order, product=self.item.product, quantity=1)
+        Order.objects.filter(pk=self.order.pk).update(
+            status=OrderStatus.DELIVERED, created_at=timezone.now() - timedelta(days=400),
+        )
+        archive_chunk(archive_cutoff())
+        # سطر أرشيف قديم بلا لقطة سعر ولا منتج لا يُعرض
+        ArchivedOrderItem.objects.filter(pk=extra.pk).update(unit_price=None, line_total=None)
+        self.item.product.delete()
+
+        self._session_order(self.order.pk)
+        url = document_url(Invoice.objects.get(pk=self.invoice.pk))
+        html = b"".join(self.client.get(url).streaming_content).decode("utf-8")
+        self.assertIn("—", html)
+        self.assertIn("20.00", html)
+        self.assertNotIn("Shawarma", html)
+
+@mock.patch("payments.views.INVOICES_PAGE_SIZE", 5)
+class InvoicesDashboardTests(TestCase):
+    def setUp(self):
+        from users.models import Profile
+
+        owner = User.objects.create_user("owner", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        Profile.objects.create(user=owner, role="RestaurantOwner", restaurant=restaurant)
+        branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+        for i in range(7):
+            Order.objects.create(branch=branch, guest_name=f"Guest{i}", total_price="10.00")
+        Invoice.objects.filter(order__guest_name="Guest3").update(customer_name="Sara", customer_phone="0551")
+
+        other = User.objects.create_user("other", password="x")
+        other_branch = Branch.objects.create(
+            restaurant=Restaurant.objects.create(name="O", description="d", owner=other), name="B", address="a",
+        )
+        Order.objects.create(branch=other_branch, guest_name="Elsewhere", total_price="99.00")
+        self.client.force_login(owner)
+
+    def test_pages_by_id_with_a_total_of_all_matches(self):
+        first = self.client.get("/invoices_dashboard/")
+        self.assertEqual(len(first.context["invoices"]), 5)
+        self.assertEqual(first.context["invoices_count"], 7)
+        self.assertEqual(first.context["invoices_total"], 70)
+
+        second = self.client.get("/invoices_dashboard/" + first.context["next_url"])
+        self.assertEqual(len(second.context["invoices"]), 2)
+        self.assertIsNone(second.context["next_url"])
+        seen = {i.pk for i in first.context["invoices"]} | {i.pk for i in second.context["invoices"]}
+        self.assertEqual(len(seen), 7)
+
+    def test_search_matches_the_start_of_name_or_phone(self):
+        for q in ("sar", "055"):
+            response = self.client.get("/invoices_dashboard/", {"q": q})
+            self.assertEqual([i.customer_name for i in response.context["invoices"]], ["Sara"])
+        response = self.client.get("/invoices_dashboard/", {"q": "ara"})
+        self.assertEqual(response.context["invoices_count"], 0)
+
+
+class WalletTests(TestCase):
+    def setUp(self):
+        from users.models import Profile
+
+        owner = User.objects.create_user("owner", password="x")
+        self.restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        Profile.objects.create(user=owner, role="RestaurantOwner", restaurant=self.restaurant)
+        branch = Branch.objects.create(restaurant=self.restaurant, name="B", address="a")
+        self.order = Order.objects.create(branch=branch, guest_name="Guest", total_price="50.00")
+        self.client.force_login(owner)
+
+    def test_ledger_lines_carry_the_running_balance(self):
+        self.assertIsNotNone(credit_order(self.restaurant.pk, self.order.pk, 5000))
+        self.assertIsNone(credit_order(self.restaurant.pk, self.order.pk, 5000))
+        self.client.post("/wallet/withdraw/", {"amount": "20"})
+        self.client.post("/wallet/withdraw/", {"amount": "40"})
+
+        self.assertEqual(
+            list(WalletTransaction.objects.order_by("pk").values_list("kind", "balance_after")),
+            [("credit", 5000), ("refund", 3000)],
+        )
+        balance = WalletBalance.objects.get(restaurant=self.restaurant)
+        self.assertEqual(
+            (balance.balance_halalah, balance.credit_total_halalah, balance.refund_total_halalah), (3000, 5000, 2000),
+        )
+
+    def test_wallet_page_reads_the_balance_row(self):
+        credit_order(self.restaurant.pk, self.order.pk, 5000)
+        withdraw(self.restaurant.pk, 1250)
+        response = self.client.get("/wallet/")
+        self.assertEqual(response.context["balance"], 37.5)
+        self.assertEqual(response.context["refund_total"], 12.5)
+
+
+class WalletConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        owner = User.objects.create_user("owner", password="x")
+        self.restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        branch = Branch.objects.create(restaurant=self.restaurant, name="B", address="a")
+        self.order = Order.objects.create(branch=branch, guest_name="Guest", total_price="100.00")
+
+    # SQLite يقفل قاعدة البيانات كلها: الخيوط تفشل بـ "database is locked" بدل أن تنتظر صف الرصيد
+    @skipUnlessDBFeature("has_select_for_update")
+    def test_concurrent_withdrawals_never_overdraw(self):
+        credit_order(self.restaurant.pk, self.order.pk, 10000)
+        barrier = threading.Barrier(8)
+        results, errors = [], []
+        lock = threading.Lock()
+
+        def request_withdrawal():
+            try:
+                barrier.wait()
+                line = withdraw(self.restaurant.pk, 2000)
+                with lock:
+                    results.append(line)
+            except Exception as exc:  # pragma: no cover - reported below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=request_withdrawal) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len([line for line in results if line is not None]), 5)
+        balance = WalletBalance.objects.get(restaurant=self.restaurant)
+        self.assertEqual((balance.balance_halalah, balance.refund_total_halalah), (0, 10000))
+        # كل سطر في السجل يحمل الرصيد بعده، متسلسلًا بلا قفزات
+        ledger = list(WalletTransaction.objects.order_by("pk").values_list("kind", "balance_after"))
+        self.assertEqual(ledger, [("credit", 10000)] + [("refund", 10000 - 2000 * i) for i in range(1, 6)])
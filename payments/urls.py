@@ -6,9 +6,11 @@ app_name = "payments"
 urlpatterns = [
     path("quick-checkout/", views.quick_checkout, name="quick_checkout"),
     path("success/", views.success, name="success"),
+    path("success/status/", views.checkout_status, name="checkout_status"),
     path("cancel/", views.cancel, name="cancel"),
     path("last-invoice/", views.last_invoice, name="last_invoice"),
     path("order-status/<int:order_id>/", views.public_order_status, name="public_order_status"),
+    path("invoice/<int:pk>/<slug:digest>.<slug:ext>", views.invoice_document_file, name="invoice_document"),
     path("webhook/", views.stripe_webhook, name="stripe_webhook"),
     path("wallet/", views.wallet_view, name="wallet"),
     path("wallet/withdraw/", views.wallet_withdraw, name="wallet_withdraw"),
@@ -3,26 +3,38 @@ from decimal import Decimal
 
 import stripe
 from django.conf import settings
-from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest, HttpRequest
+from django.http import (
+    FileResponse, Http404, JsonResponse, HttpResponse, HttpResponseBadRequest, HttpRequest,
+)
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
+from django.views.decorators.clickjacking import xframe_options_sameorigin
 from django.views.decorators.csrf import csrf_exempt
 from django.middleware.csrf import get_token
 from django.db import models
 from django.db import transaction
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
-from django.utils.html import strip_tags
+from django.utils import timezone
 
-from .models import Payment, Invoice, WalletTransaction, WalletKind
+from .models import Payment, Invoice, WalletTransaction, CheckoutSession, CheckoutStatus
+from .checkout import materialize, save_checkout_session, sync_with_stripe
+from .documents import document_url, open_document
+from .wallet import credit_order, get_balance, withdraw
 # نماذج الطلبات والفروع والمنتجات
 from websites.models import Website
-from restaurants.models import Branch
 from restaurants.models import Restaurant
-from menu.models import Product
-from orders.models import Order, OrderStatus, OrderItem, PaymentMethod, DeliveryDetails, PickupDetails, DineInDetails
+from orders.models import Order, OrderStatus
+from orders.archive import get_order_any
+from orders.capacity import branch_capacity, checkout_branch_id
+from orders.scheduling import due_time_from_order_data, initial_status
+from orders.services import set_order_status
 from .models import Invoice
 from django.db.models import Q
+from django.contrib.auth.decorators import login_required
+from django.contrib import messages
+from users.access import can_access_branch
+from users.decorators import restaurant_owner_required
 from django.utils.http import urlencode
 
 # إعداد مفتاح Stripe السري
@@ -61,201 +73,100 @@ def _order_total(order: Order) -> Decimal:
 
 """
 مسارات الدفع المستخدمة فعليًا:
- - quick_checkout: إنشاء جلسة Stripe مباشرة من إجمالي معروف
- - success/cancel: الرجوع من Stripe وإنشاء الطلب/الفاتورة
- - stripe_webhook: تأكيد الحالة من Stripe
+ - quick_checkout: حفظ السلة في CheckoutSession ثم إنشاء جلسة Stripe
+ - stripe_webhook: تأكيد الدفع وإنشاء الطلب/الفاتورة مرة واحدة (payments.checkout)
+ - success/cancel: الرجوع من Stripe؛ صفحة النجاح تنتظر الطلب فقط ولا تنشئه
 تمت إزالة مسارات تجريبية غير مستخدمة (checkout/create_checkout_session) لتبسيط التطبيق.
 """
 
 
-# نجاح الدفع: إنشاء طلب من السلة (إن لم يكن موجودًا) ثم عرض الفاتورة
+# نجاح الدفع: عرض الفاتورة إن اكتمل الطلب، وإلا صفحة انتظار تستعلم عن حالته
+
+def _invoice_ctx(order, **extra):
+    # ملخص الفاتورة يُعرض من الملف المولَّد مسبقًا (payments/documents.py) بدل قراءة العناصر
+    invoice = Invoice.objects.filter(order_id=order.pk).order_by("-created_at").first()
+    ctx = {
+        "order": order,
+        "document_url": document_url(invoice, "html") if invoice else None,
+        "document_pdf_url": document_url(invoice, "pdf") if invoice else None,
+    }
+    ctx.update(extra)
+    return ctx
+
+
+def _can_view_invoice(request, invoice) -> bool:
+    # صاحب الجلسة التي أنشأت الطلب (ضيف أو مسجّل)، أو العميل نفسه، أو موظف لديه صلاحية الفرع
+    if request.session.get("last_order_id") == invoice.order_id:
+        return True
+    if not request.user.is_authenticated:
+        return False
+    order = get_order_any(pk=invoice.order_id)
+    return order is not None and (
+        order.customer_id == request.user.pk or can_access_branch(request, order.branch_id)
+    )
+
+
+DOCUMENT_TYPES = {"html": "text/html; charset=utf-8", "pdf": "application/pdf"}
+
+@xframe_options_sameorigin
+def invoice_document_file(request: HttpRequest, pk: int, digest: str, ext: str):
+    """The stored invoice document, for the invoice page iframe and the PDF link."""
+    invoice = get_object_or_404(Invoice, pk=pk)
+    if ext not in DOCUMENT_TYPES or not _can_view_invoice(request, invoice):
+        raise Http404
+    current = document_url(invoice, ext)
+    if current != request.path:
+        # الفاتورة تغيّرت بعد عرض الصفحة: نوجّه للنسخة الحالية
+        return redirect(current)
+    response = FileResponse(
+        open_document(invoice, ext), content_type=DOCUMENT_TYPES[ext],
+        as_attachment=ext == "pdf", filename=f"invoice-{invoice.order_id}.{ext}",
+    )
+    # الرابط يحمل بصمة المحتوى فلا يتغير ما خلفه
+    response["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
+
 
 def success(request:HttpRequest):
     session_id = request.GET.get("session_id")
     slug = request.GET.get("slug") or request.session.get("last_cart_slug")
-    order_for_invoice = None
-    status = None
+    checkout = (
+        CheckoutSession.objects.select_related("website").filter(session_id=session_id).first()
+        if session_id else None
+    )
 
-    # قراءة حالة الجلسة من Stripe وتحديث سجل الدفع إن وجد
-    if session_id:
-        session = stripe.checkout.Session.retrieve(session_id, expand=["payment_intent"])
-        status = session.payment_status  # 'paid' or 'unpaid'
-        pi = session.payment_intent.id if hasattr(session.payment_intent, "id") else session.payment_intent
+    if checkout and checkout.order_id:
+        order = Order.objects.select_related("branch").filter(pk=checkout.order_id).first()
+        if order:
+            website = checkout.website
+            # تفريغ السلة وتخزين رقم الطلب
+            if website:
+                request.session[f"cart_{website.id}"] = []
+            request.session["last_order_id"] = order.id
+            request.session.modified = True
+            return render(request, "payments/invoice.html", _invoice_ctx(order, slug=slug, website=website))
+
+    status_url = f"{reverse('payments:checkout_status')}?{urlencode({'session_id': session_id})}" if checkout else None
+    return render(request, "payments/success.html", {
+        "session_id": session_id,
+        "status": checkout.status if checkout else None,
+        "status_url": status_url,
+        "slug": slug,
+    })
 
-        p = Payment.objects.select_related("order").filter(transaction_id=session_id).first()
-        if p and status == "paid":
-            p.status = "Completed"
-            if pi:
-                p.transaction_id = pi
-            p.save(update_fields=["status", "transaction_id"])
-            if p.order:
-                p.order.status = OrderStatus.DELIVERED
-                p.order.save(update_fields=["status"])
-
-    if status == "paid":
-        # أنشئ طلبًا جديدًا من السلة الحالية أولاً إن وُجدت عناصر، وإلاFallback لآخر طلب
-        website = Website.objects.select_related("restaurant").filter(slug=slug).first() if slug else None
-        created_from_cart = False
-        if website:
-            cart = request.session.get(f"cart_{website.id}", [])
-            if cart:
-                cart_meta = request.session.get(f"cart_meta_{website.id}", {"name": "", "phone": "", "notes": "", "email": ""})
-                subtotal = sum((Decimal(str(i.get("price", 0)))) for i in cart)
-                tax = 0 #(subtotal * Decimal("0.15")).quantize(Decimal("0.01"))
-                total = (subtotal + tax).quantize(Decimal("0.01"))
-
-                # اختيار فرع مناسب (أول فرع)
-                if 'order_data' in request.session:
-                    if request.session['order_data']['order_method'] == 'dine_in':
-                        branch = Branch.objects.get(pk = request.session['order_data']['dinein']['branch_id'])
-                    elif request.session['order_data']['order_method'] == 'pickup':
-                        branch = Branch.objects.get(pk = request.session['order_data']['pickup']['branch_id'])
-                    else:
-                        branch = Branch.objects.filter(restaurant=website.restaurant).order_by("id").first() or Branch.objects.order_by("id").first()
-                if branch:
-                    if request.user.is_authenticated:
-                        created_order = Order.objects.create(
-                            customer=request.user,
-                            branch=branch,
-                            status=OrderStatus.NEW,
-                            total_price=total,
-                            payment_method=PaymentMethod.ONLINE,
-                        )
-                    else:
-                        created_order = Order.objects.create(
-                            guest_name=cart_meta['name'],
-                            guest_phone=cart_meta['phone'],
-                            branch=branch,
-                            status=OrderStatus.NEW,
-                            total_price=total,
-                            payment_method=PaymentMethod.ONLINE,
-                        )
-                    if request.session['order_data']['order_method'] == 'dine_in':
-                        created_order.order_method = 'dine_in'
-                        DineInDetails.objects.create(
-                            order=created_order,
-                            branch=branch,
-                            number_of_people=request.session['order_data']['dinein']['number_of_people'],
-                            special_requests=request.session['order_data']['dinein']['special_requests'],
-                        )
-                    elif request.session['order_data']['order_method'] == 'pickup':
-                        created_order.order_method = 'pickup'
-                        PickupDetails.objects.create(
-                            order=created_order,
-                            branch=branch,
-                        )
-                    elif request.session['order_data']['order_method'] == 'delivery':
-                        created_order.order_method = 'delivery'
-                        DeliveryDetails.objects.create(
-                            order=created_order,
-                            address=request.session['order_data']['delivery']['address'],
-                            city=''
-                        )
-                    created_order.save()
-                    for i in cart:
-                        try:
-                            product = Product.objects.filter(pk=int(i.get("id"))).first()
-                        except Exception:
-                            product = None
-                        qty = int(i.get("qty", 1) or 1)
-                        if product and qty > 0:
-                            OrderItem.objects.create(
-                                order=created_order,
-                                product=product,
-                                quantity=qty,
-                                options=cart[0]['options'],
-                                addons=",".join(i.get("addons", []) or []),
-                            )
-                    # تفريغ السلة وتخزين رقم الطلب
-                    request.session[f"cart_{website.id}"] = []
-                    request.session["last_order_id"] = created_order.id
-                    request.session.modified = True
-
-                    # إنشاء/تحديث الفاتورة (يشمل بريد الضيف)
-                    meta = request.session.get(f"cart_meta_{website.id}", {"name": "", "phone": "", "notes": ""})
-                    try:
-                        invoice, inv_created = Invoice.objects.get_or_create(
-                            order=created_order,
-                            defaults={
-                                "customer_name": (meta.get("name") or "").strip(),
-                                "customer_phone": (meta.get("phone") or "").strip(),
-                                "customer_email": (request.user.email if request.user.is_authenticated else (meta.get("email") or "")),
-                                "total_amount": created_order.total_price,
-                                "compliance_status": False,
-                                "sent_via": "Email",
-                            }
-                        )
-                        if not inv_created:
-                            changed = False
-                            name = (meta.get("name") or "").strip()
-                            phone = (meta.get("phone") or "").strip()
-                            email = (request.user.email if request.user.is_authenticated else (meta.get("email") or ""))
-                            if name and invoice.customer_name != name:
-                                invoice.customer_name = name; changed = True
-                            if phone and invoice.customer_phone != phone:
-                                invoice.customer_phone = phone; changed = True
-                            email_changed = False
-                            if email and invoice.customer_email != email:
-                                invoice.customer_email = email; changed = True; email_changed = True
-                            if invoice.total_amount != created_order.total_price:
-                                invoice.total_amount = created_order.total_price; changed = True
-                            if changed:
-                                invoice.save()
-                                if email_changed:
-                                    def _send_after_commit():
-                                        try:
-                                            inv = Invoice.objects.select_related("order").get(pk=invoice.pk)
-                                            order = inv.order
-                                            items = list(getattr(order, "items", []).select_related("product").all()) if hasattr(order, "items") else []
-                                            subject = f"فاتورة طلبك #{getattr(order, 'id', '')} - HalaOrder"
-                                            context = {"invoice": inv, "order": order, "items": items}
-                                            html_message = render_to_string("payments/email_invoice.html", context)
-                                            plain_message = strip_tags(html_message)
-                                            from_email = getattr(settings, "DEFAULT_FROM_EMAIL", "no-reply@halaorder.local")
-                                            send_mail(
-                                                subject=subject,
-                                                message=plain_message,
-                                                from_email=from_email,
-                                                recipient_list=[email],
-                                                html_message=html_message,
-                                                fail_silently=True,
-                                            )
-                                        except Exception:
-                                            pass
-                                    transaction.on_commit(_send_after_commit)
-                    except Exception:
-                        pass
-                    order_for_invoice = created_order
-                    created_from_cart = True
-
-                    # إنشاء معاملة محفظة (رصيد)
-                    try:
-                        r = website.restaurant if hasattr(website, "restaurant") else None
-                        if r and created_order and created_order.total_price is not None:
-                            amount_h = int((created_order.total_price or 0) * 100)
-                            WalletTransaction.objects.create(
-                                restaurant=r,
-                                order=created_order,
-                                kind=WalletKind.CREDIT,
-                                amount_halalah=amount_h,
-                            )
-                    except Exception:
-                        pass
-
-        if not created_from_cart:
-            # استخدم آخر طلب محفوظ فقط إن لم ننشئ طلبًا جديدًا الآن
-            last_order_id = request.session.get("last_order_id")
-            if last_order_id:
-                order_for_invoice = (
-                    Order.objects.select_related("branch").prefetch_related("items__product").filter(pk=last_order_id).first()
-                )
-
-    if order_for_invoice:                
-        website = Website.objects.get(slug=slug)
-        return render(request, "payments/invoice.html", {"order": order_for_invoice, "slug": slug, 'website':website})
-
-    # في حال لم يتم الدفع أو حدث خطأ نعرض صفحة نجاح بسيطة
-    return render(request, "payments/success.html", {"session_id": session_id, "status": status, "slug": slug})
+
+def checkout_status(request: HttpRequest):
+    """Polled by the success page until the order of the session exists."""
+    checkout = get_object_or_404(CheckoutSession, session_id=request.GET.get("session_id", ""))
+    order_id = checkout.order_id
+    if not order_id and checkout.status == CheckoutStatus.OPEN:
+        # الويب هوك لم يصل بعد (أو غير مفعّل): نسأل Stripe بعد مهلة قصيرة
+        grace = getattr(settings, "CHECKOUT_WEBHOOK_GRACE_SECONDS", 10)
+        webhook_enabled = bool(getattr(settings, "STRIPE_WEBHOOK_SECRET", None))
+        if not webhook_enabled or (timezone.now() - checkout.created_at).total_seconds() > grace:
+            order_id = sync_with_stripe(checkout)
+            checkout.refresh_from_db(fields=["status"])
+    return JsonResponse({"ready": bool(order_id), "status": checkout.status})
 
 
 def last_invoice(request: HttpRequest):
@@ -270,15 +181,13 @@ def last_invoice(request: HttpRequest):
             return redirect("websites:menu", slug=slug)
         return HttpResponse("لا توجد فاتورة حديثة.", status=404)
 
-    order = (
-        Order.objects.select_related("branch").prefetch_related("items__product").filter(pk=last_order_id).first()
-    )
+    order = Order.objects.select_related("branch").filter(pk=last_order_id).first()
     if not order:
         if slug:
             return redirect("websites:menu", slug=slug)
         return HttpResponse("الطلب غير موجود.", status=404)
 
-    return render(request, "payments/invoice.html", {"order": order, "slug": slug})
+    return render(request, "payments/invoice.html", _invoice_ctx(order, slug=slug))
 
 
 # الإلغاء: الرجوع إلى سلة الموقع الصحيح
@@ -307,11 +216,15 @@ def stripe_webhook(request):
     except stripe.error.SignatureVerificationError:
         return HttpResponse(status=400)
 
-    if event["type"] == "checkout.session.completed":
+    if event["type"] in ("checkout.session.completed", "checkout.session.async_payment_succeeded"):
         session = event["data"]["object"]
         session_id = session.get("id")
         payment_intent = session.get("payment_intent")
 
+        # إنشاء الطلب من السلة المحفوظة (مرة واحدة مهما تكرر الحدث)
+        if session.get("payment_status") == "paid":
+            materialize(session_id, payment_intent or "")
+
         p = Payment.objects.select_related("order").filter(transaction_id=session_id).first()
         if p:
             p.status = "Completed"
@@ -320,28 +233,22 @@ def stripe_webhook(request):
             p.save(update_fields=["status", "transaction_id"])
 
             if p.order and hasattr(p.order, "status"):
-                p.order.status = OrderStatus.DELIVERED
-                p.order.save(update_fields=["status"])
+                set_order_status(p.order, OrderStatus.DELIVERED)
 
             # سجل رصيد في المحفظة عند اكتمال الدفع عبر الويب هوك
             try:
                 order = getattr(p, "order", None)
                 if order and order.branch and order.total_price is not None:
-                    restaurant = getattr(order.branch, "restaurant", None)
-                    if restaurant:
-                        amount_h = int((order.total_price or 0) * 100)
-                        WalletTransaction.objects.create(
-                            restaurant=restaurant,
-                            order=order,
-                            kind=WalletKind.CREDIT,
-                            amount_halalah=amount_h,
-                        )
+                    credit_order(order.branch.restaurant_id, order.pk, int((order.total_price or 0) * 100))
             except Exception:
                 pass
 
     elif event["type"] == "checkout.session.expired":
         session = event["data"]["object"]
         Payment.objects.filter(transaction_id=session.get("id")).update(status="Failed")
+        CheckoutSession.objects.filter(
+            session_id=session.get("id"), status=CheckoutStatus.OPEN,
+        ).update(status=CheckoutStatus.EXPIRED)
 
     elif event["type"] == "payment_intent.payment_failed":
         obj = event["data"]["object"]
@@ -361,6 +268,16 @@ def quick_checkout(request):
     currency = (request.GET.get("currency") or getattr(settings, "STRIPE_DEFAULT_CURRENCY", "sar")).lower()
     slug = request.GET.get("slug")
 
+    # لا ننشئ جلسة دفع لفرع متوقف أو مزدحم؛ نعيد العميل للسلة حيث تظهر الرسالة
+    website = Website.objects.select_related("restaurant").filter(slug=slug).first() if slug else None
+    if website:
+        order_data = request.session.get("order_data")
+        branch_id = checkout_branch_id(order_data, website.restaurant)
+        # الطلب المسبق لا يتأثر بازدحام الفرع الآن
+        scheduled = initial_status(due_time_from_order_data(order_data)) == OrderStatus.SCHEDULED
+        if branch_id and not scheduled and not branch_capacity(branch_id)["accepting"]:
+            return redirect("websites:cart", slug=slug)
+
     amount_smallest = _smallest_unit(amount, currency)
     success_url = request.build_absolute_uri(reverse("payments:success")) + "?session_id={CHECKOUT_SESSION_ID}"
     cancel_url  = request.build_absolute_uri(reverse("payments:cancel"))
@@ -383,6 +300,9 @@ def quick_checkout(request):
         success_url=success_url,
         cancel_url=cancel_url,
     )
+    # السلة تُحفظ في القاعدة قبل التحويل؛ الطلب يُبنى منها لا من الـ Session
+    if website:
+        save_checkout_session(request, website, session, amount, currency)
 
     return redirect(session.url, permanent=False)
 
@@ -390,7 +310,7 @@ def quick_checkout(request):
 # نقطة API بسيطة لإرجاع حالة الطلب (يُستخدم في تحديث صفحة الفاتورة)
 
 def public_order_status(request, order_id: int):
-    order = Order.objects.filter(pk=order_id).first()
+    order = get_order_any(pk=order_id)
     if not order:
         return JsonResponse({"ok": False, "error": "not_found"}, status=404)
     return JsonResponse({
@@ -402,50 +322,71 @@ def public_order_status(request, order_id: int):
 
 
 
+INVOICES_PAGE_SIZE = 50
+
+@login_required(login_url='/users/login/')
+@restaurant_owner_required
 def invoices_dashboard(request:HttpRequest):
-    branches = request.user.restaurants.branches.all()
-    invoices = []
-    
-    for branch in branches:
-        for order in branch.orders.all():
-            for invoice in order.invoices.all():
-                invoices.append(invoice)
-    # invoices = Invoice.objects.all().order_by("-created_at") # عدلها عشان يصير الواتير الخاصه بكل مطعم
-
-    query = None
-    sent_via_filter = None
-    compliance_filter = None
-
-    if request.method == "POST":
-        query = request.POST.get("q")
-        sent_via_filter = request.POST.get("sent_via")
-        compliance_filter = request.POST.get("compliance_status")
-
-        if query:
-            invoices = invoices.filter(
-                Q(customer_name__icontains=query) |
-                Q(customer_email__icontains=query)
-            )
-
-        if sent_via_filter:
-            invoices = invoices.filter(sent_via=sent_via_filter)
-
-        if compliance_filter in ["true", "false"]:
-            invoices = invoices.filter(compliance_status=(compliance_filter == "true"))
+    """
+    Invoices of the owner's restaurant, newest first, ``?after=<id>`` pages.
+    Filters come from GET so they survive paging; search matches the start
+    of the name, email or phone (indexed per restaurant).
+    """
+    restaurant = getattr(request.user, "restaurants", None)
+    invoices = Invoice.objects.filter(restaurant=restaurant)
+
+    query = (request.GET.get("q") or "").strip()
+    sent_via_filter = request.GET.get("sent_via") or ""
+    compliance_filter = request.GET.get("compliance_status") or ""
+
+    if query:
+        invoices = invoices.filter(
+            Q(customer_name__istartswith=query) |
+            Q(customer_email__istartswith=query) |
+            Q(customer_phone__startswith=query)
+        )
+    if sent_via_filter:
+        invoices = invoices.filter(sent_via=sent_via_filter)
+    if compliance_filter in ["true", "false"]:
+        invoices = invoices.filter(compliance_status=(compliance_filter == "true"))
+
+    # الإجمالي والعدد لكل النتائج المطابقة باستعلام تجميعي واحد
+    summary = invoices.aggregate(total=models.Sum("total_amount"), count=models.Count("id"))
+
+    try:
+        after = int(request.GET.get("after") or 0)
+    except ValueError:
+        after = 0
+    page = invoices.order_by("-id")
+    if after:
+        page = page.filter(pk__lt=after)
+    rows = list(page.only(
+        "id", "customer_name", "customer_phone", "customer_email", "total_amount", "sent_via", "created_at",
+    )[:INVOICES_PAGE_SIZE + 1])
+    next_url = None
+    if len(rows) > INVOICES_PAGE_SIZE:
+        rows = rows[:INVOICES_PAGE_SIZE]
+        params = request.GET.copy()
+        params["after"] = rows[-1].pk
+        next_url = f"?{params.urlencode()}"
+    first_params = request.GET.copy()
+    first_params.pop("after", None)
 
     context = {
-        "invoices": invoices,
+        "invoices": rows,
         "query": query,
         "sent_via_filter": sent_via_filter,
         "compliance_filter": compliance_filter,
+        "invoices_total": summary["total"] or 0,
+        "invoices_count": summary["count"],
+        "next_url": next_url,
+        "first_url": f"?{first_params.urlencode()}" if after else None,
+        "current_page": "payments:invoices_dashboard",
     }
     return render(request, 'payments/invoices_dashboard.html', context)
 
 
 # ============ Wallet ============
-from django.contrib.auth.decorators import login_required
-from users.decorators import restaurant_owner_required
-from django.contrib import messages
 
 @login_required(login_url='/users/login/')
 @restaurant_owner_required
@@ -458,20 +399,13 @@ def wallet_view(request):
     qs = WalletTransaction.objects.filter(restaurant=restaurant).order_by('-created_at')
     last100 = list(qs[:100])
     transactions_fmt = [(t, (t.amount_halalah or 0) / 100.0) for t in last100]
-    credits = sum(t.amount_halalah for t in last100 if t.kind == WalletKind.CREDIT)
-    refunds = sum(t.amount_halalah for t in last100 if t.kind == WalletKind.REFUND)
-    # للحساب الصحيح، استخدم كل السجل إن أردت. هنا لسرعة العرض نستخدم التجميعة الكاملة.
-    total_credits = WalletTransaction.objects.filter(restaurant=restaurant, kind=WalletKind.CREDIT).aggregate(s=models.Sum('amount_halalah'))['s'] or 0
-    total_refunds = WalletTransaction.objects.filter(restaurant=restaurant, kind=WalletKind.REFUND).aggregate(s=models.Sum('amount_halalah'))['s'] or 0
-    balance_halalah = int(total_credits) - int(total_refunds)
-    balance_sar = balance_halalah / 100.0
-    credit_total_sar = (int(total_credits) / 100.0)
-    refund_total_sar = (int(total_refunds) / 100.0)
+    # الرصيد والمجاميع من صف WalletBalance بدل جمع كل السجل في كل طلب
+    balance = get_balance(restaurant.pk)
 
     ctx = {
-        "balance": balance_sar,
-        "credit_total": credit_total_sar,
-        "refund_total": refund_total_sar,
+        "balance": balance.balance_halalah / 100.0,
+        "credit_total": balance.credit_total_halalah / 100.0,
+        "refund_total": balance.refund_total_halalah / 100.0,
         "transactions_fmt": transactions_fmt,
         "tx_count": len(last100),
         "current_page": "payments:wallet",
@@ -490,11 +424,6 @@ def wallet_withdraw(request):
         messages.error(request, 'لا يوجد مطعم مرتبط بالحساب.', 'alert-danger')
         return redirect('payments:wallet')
 
-    # احسب الرصيد المتاح
-    total_credits = WalletTransaction.objects.filter(restaurant=restaurant, kind=WalletKind.CREDIT).aggregate(s=models.Sum('amount_halalah'))['s'] or 0
-    total_refunds = WalletTransaction.objects.filter(restaurant=restaurant, kind=WalletKind.REFUND).aggregate(s=models.Sum('amount_halalah'))['s'] or 0
-    balance_halalah = int(total_credits) - int(total_refunds)
-
     # قراءة المبلغ من الطلب (بالريال)
     amount_str = request.POST.get('amount', '0').strip()
     try:
@@ -506,16 +435,10 @@ def wallet_withdraw(request):
     if amount_halalah <= 0:
         messages.error(request, 'الرجاء إدخال مبلغ صالح.', 'alert-danger')
         return redirect('payments:wallet')
-    if amount_halalah > balance_halalah:
+
+    # إنشاء عملية سحب كرَدّ محفظة؛ فحص الرصيد والخصم تحت قفل صف الرصيد
+    if withdraw(restaurant.pk, amount_halalah) is None:
         messages.error(request, 'المبلغ أكبر من الرصيد المتاح.', 'alert-danger')
         return redirect('payments:wallet')
-
-    # إنشاء عملية سحب كرَدّ محفظة (بدون ربط بطلب)
-    WalletTransaction.objects.create(
-        restaurant=restaurant,
-        order=None,
-        kind=WalletKind.REFUND,
-        amount_halalah=amount_halalah,
-    )
     messages.success(request, 'تم إنشاء طلب سحب الرصيد بنجاح.', 'alert-success')
     return redirect('payments:wallet')
\ No newline at end of file
@@ -0,0 +1,88 @@
+# payments/wallet.py
+"""
+Restaurant wallet: an append-only ledger (``WalletTransaction``) plus one
+``WalletBalance`` row per restaurant holding the running totals.
+
+Every ledger write goes through ``_record``, which locks the balance row
+(``select_for_update``), inserts the ledger line with its ``balance_after``
+and updates the totals in the same transaction.  Reads are one row, and
+two withdrawals (or a withdrawal and an order credit) for the same
+restaurant run one after the other, so the balance check cannot be
+passed twice with the same money.  Checkout credits through
+``credit_order_on_commit``, so the lock is never held while an order is
+being written.
+"""
+from django.db import transaction
+
+from orders.models import Order
+
+from .models import WalletBalance, WalletKind, WalletTransaction
+
+
+def get_balance(restaurant_id) -> WalletBalance:
+    """Current totals (unsaved zero row for a restaurant without a ledger)."""
+    balance = WalletBalance.objects.filter(restaurant_id=restaurant_id).first()
+    return balance or WalletBalance(restaurant_id=restaurant_id)
+
+
+def _locked_balance(restaurant_id) -> WalletBalance:
+    balance = WalletBalance.objects.select_for_update().filter(restaurant_id=restaurant_id).first()
+    if balance is None:
+        # أول عملية للمطعم: ننشئ الصف (أو نأخذ ما أنشأه طلب موازٍ) ثم نقفله
+        WalletBalance.objects.get_or_create(restaurant_id=restaurant_id)
+        balance = WalletBalance.objects.select_for_update().get(restaurant_id=restaurant_id)
+    return balance
+
+
+def _record(balance, kind, amount_halalah, order_id=None) -> WalletTransaction:
+    # يُستدعى داخل transaction.atomic وصف الرصيد مقفول
+    if kind == WalletKind.CREDIT:
+        balance.balance_halalah += amount_halalah
+        balance.credit_total_halalah += amount_halalah
+    else:
+        balance.balance_halalah -= amount_halalah
+        balance.refund_total_halalah += amount_halalah
+    balance.save(update_fields=["balance_halalah", "credit_total_halalah", "refund_total_halalah", "updated_at"])
+    return WalletTransaction.objects.create(
+        restaurant_id=balance.restaurant_id,
+        order_id=order_id,
+        kind=kind,
+        amount_halalah=amount_halalah,
+        balance_after=balance.balance_halalah,
+    )
+
+
+def credit_order(restaurant_id, order_id, amount_halalah):
+    """Credit a paid order once; returns the ledger line, or None if already credited."""
+    with transaction.atomic():
+        balance = _locked_balance(restaurant_id)
+        # الفحص تحت القفل: إعادة إرسال الويب هوك لا تضيف الرصيد مرتين
+        if WalletTransaction.objects.filter(order_id=order_id, kind=WalletKind.CREDIT).exists():
+            return None
+        return _record(balance, WalletKind.CREDIT, amount_halalah, order_id)
+
+
+def credit_order_on_commit(restaurant_id, order_id) -> None:
+    """
+    Credit the order's total once the caller's transaction commits, unless
+    its ledger line already exists.  Errors propagate to the caller (the
+    webhook), so a failed credit is made again on the retry.
+    """
+    def credit():
+        if WalletTransaction.objects.filter(order_id=order_id, kind=WalletKind.CREDIT).exists():
+            return
+        total = Order.objects.filter(pk=order_id).values_list("total_price", flat=True).first()
+        if total is not None:
+            credit_order(restaurant_id, order_id, int(total * 100))
+
+    if order_id:
+        transaction.on_commit(credit)
+
+
+def withdraw(restaurant_id, amount_halalah):
+    """Withdraw if the balance covers it; returns the ledger line, or None."""
+    with transaction.atomic():
+        balance = _locked_balance(restaurant_id)
+        if amount_halalah <= 0 or amount_halalah > balance.balance_halalah:
+            return None
+        return _record(balance, WalletKind.REFUND, amount_halalah)
@@ -6,7 +6,10 @@ from django.db.models import F, DecimalField, ExpressionWrapper
 from django.db.models.functions import Coalesce
 
 from restaurants.models import Restaurant
-from orders.models import Order, OrderItem, OrderStatus
+from menu.models import Product
+# OrderHistory / OrderItemHistory تشمل الطلبات المؤرشفة؛ history_models يختار الجدول الساخن للفترات الحديثة
+from orders.archive import history_models
+from orders.models import OrderHistory, OrderItemHistory, OrderStatus
 
 REVENUE_STATUSES = (OrderStatus.DELIVERED,)
 
@@ -37,7 +40,8 @@ def param_int(request, key):
         return None
 
 def paid_orders_qs(restaurant, s, e, branch_id=None):
-    qs = Order.objects.filter(
+    orders_model, _ = history_models(s)
+    qs = orders_model.objects.filter(
         branch__restaurant=restaurant,
         created_at__date__gte=s,
         created_at__date__lte=e,
@@ -48,7 +52,10 @@ def paid_orders_qs(restaurant, s, e, branch_id=None):
     return qs
 
 def line_revenue():
-    names = {f.name for f in OrderItem._meta.get_fields()}
+    names = {f.name for f in OrderItemHistory._meta.get_fields()}
+    # إجمالي السطر وقت البيع؛ لا نعيد تسعير التاريخ بسعر المنتج الحالي
+    if "line_total" in names:
+        return F("line_total")
     if "total_price" in names:
         return F("total_price")
     unit = "unit_price" if "unit_price" in names else ("price" if "price" in names else None)
@@ -58,8 +65,12 @@ def line_revenue():
     return ExpressionWrapper(F("quantity") * F("product__price"), output_field=DecimalField(max_digits=14, decimal_places=2))
 
 def detect_customer_field():
-    names = {f.name for f in Order._meta.get_fields()}
+    names = {f.name for f in OrderHistory._meta.get_fields()}
     for cand in ("customer_id", "customer", "user_id", "user", "client_id", "client"):
         if cand in names:
             return cand
     return None
+
+def product_names(ids):
+    """{product_id: name} with one lookup, so item aggregates need not join Product."""
+    return {p.pk: p.name for p in Product.objects.filter(pk__in=set(ids)).only("id", "name")}
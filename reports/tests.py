@@ -1,3 +1,131 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from orders import services
+from orders.archive import archive_chunk, archive_cutoff
+from menu.models import Category, Product
+from orders.models import Order, OrderItem, OrderItemOption, OrderStatus, OrderStatusEvent
+from restaurants.models import Branch, Restaurant
+from users.models import Profile
+
+
+class StatusTimesTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user("owner", password="x")
+        self.restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        Profile.objects.create(user=owner, role="RestaurantOwner", restaurant=self.restaurant)
+        self.branch = Branch.objects.create(restaurant=self.restaurant, name="B", address="a")
+        self.client.force_login(owner)
+
+    def test_transitions_are_logged_with_time_in_status(self):
+        order = Order.objects.create(branch=self.branch, total_price="5.00")
+        Order.objects.filter(pk=order.pk).update(status_changed_at=timezone.now() - timedelta(minutes=4))
+        order.refresh_from_db()
+        services.advance_order(order)
+        services.cancel_order(order)
+
+        events = list(OrderStatusEvent.objects.filter(order=order).order_by("pk")
+                                             .values_list("from_status", "to_status", "duration_seconds"))
+        self.assertEqual([e[:2] for e in events], [
+            ("", OrderStatus.NEW), (OrderStatus.NEW, OrderStatus.PREPARING),
+            (OrderStatus.PREPARING, OrderStatus.CANCELLED),
+        ])
+        self.assertIsNone(events[0][2])
+        self.assertGreaterEqual(events[1][2], 240)
+
+    def test_percentiles_per_branch_and_status(self):
+        other = Branch.objects.create(restaurant=self.restaurant, name="B2", address="a")
+        now = timezone.now()
+        OrderStatusEvent.objects.bulk_create([
+            OrderStatusEvent(order_id=i, branch=self.branch, from_status=OrderStatus.NEW,
+                             to_status=OrderStatus.PREPARING, duration_seconds=i, created_at=now)
+            for i in range(100, 0, -1)
+        ] + [
+            OrderStatusEvent(order_id=1, branch=other, from_status=OrderStatus.NEW,
+                             to_status=OrderStatus.PREPARING, duration_seconds=999, created_at=now),
+        ])
+
+        url = reverse("reports:api_ops_status_times")
+        response = self.client.get(url, {"branch": self.branch.id})
+        self.assertEqual(response.status_code, 200)
+        rows = {row["status"]: row for row in response.json()["rows"]}
+        self.assertEqual(set(r["branch_id"] for r in rows.values()), {self.branch.id})
+        self.assertEqual(
+            (rows["New"]["count"], rows["New"]["p50"], rows["New"]["p90"], rows["New"]["p95"]), (100, 50, 90, 95),
+        )
+        self.assertEqual((rows["Ready"]["count"], rows["Ready"]["p50"]), (0, None))
+
+        self.assertEqual(len(self.client.get(url).json()["rows"]), 6)
+        self.assertEqual(self.client.get(url, {"branch": "x"}).json()["rows"], [])
+
+
+class ArchivedOrdersReportTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user("owner", password="x")
+        self.restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        Profile.objects.create(user=owner, role="RestaurantOwner", restaurant=self.restaurant)
+        self.branch = Branch.objects.create(restaurant=self.restaurant, name="B", address="a")
+        self.client.force_login(owner)
+
+    def _summary(self, start, end):
+        url = reverse("reports:api_sales_summary")
+        return self.client.get(url, {"start": start.isoformat(), "end": end.isoformat()}).json()["kpi"]
+
+    def test_sales_summary_reads_archived_and_recent_orders(self):
+        old = Order.objects.create(branch=self.branch, total_price="30.00", status=OrderStatus.DELIVERED)
+        Order.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=400))
+        Order.objects.create(branch=self.branch, total_price="5.00", status=OrderStatus.DELIVERED)
+        self.assertEqual(archive_chunk(archive_cutoff()), 1)
+
+        today = timezone.localdate()
+        kpi = self._summary(today - timedelta(days=500), today)
+        self.assertEqual((kpi["orders"], kpi["revenue"]), (2, 35.0))
+        # فترة حديثة تُقرأ من الجدول الساخن وحده
+        with CaptureQueriesContext(connection) as ctx:
+            kpi = self._summary(today - timedelta(days=6), today)
+        self.assertEqual((kpi["orders"], kpi["revenue"]), (1, 5.0))
+        self.assertFalse([q["sql"] for q in ctx.captured_queries if "orders_history" in q["sql"]])
+
+
+class OptionSalesTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user("owner", password="x")
+        restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        Profile.objects.create(user=owner, role="RestaurantOwner", restaurant=restaurant)
+        self.branch = Branch.objects.create(restaurant=restaurant, name="B", address="a")
+        self.other = Branch.objects.create(restaurant=restaurant, name="B2", address="a")
+        category = Category.objects.create(restaurant=restaurant, name="C")
+        self.product = Product.objects.create(category=category, name="Shawarma", price="10.00")
+        self.client.force_login(owner)
+
+    def _line(self, branch, quantity, *options):
+        order = Order.objects.create(branch=branch, total_price="0", status=OrderStatus.DELIVERED)
+        item = OrderItem.objects.create(order=order, product=self.product, quantity=quantity)
+        OrderItemOption.objects.bulk_create([
+            OrderItemOption(order_item_id=item.pk, group_name=group, option_name=name, price_adjustment=price)
+            for group, name, price in options
+        ])
+
+    def test_totals_come_from_the_snapshots_and_follow_the_branch_filter(self):
+        self._line(self.branch, 2, ("Size", "Large", "2.00"), ("", "Cheese", "1.50"))
+        self._line(self.branch, 1, ("Size", "Large", "3.00"))
+        self._line(self.other, 5, ("Size", "Large", "2.00"))
+
+        url = reverse("reports:api_sales_options")
+        today = timezone.localdate().isoformat()
+        params = {"start": today, "end": today, "branch": self.branch.pk}
+        rows = {(r["group"], r["option"]): r for r in self.client.get(url, params).json()["rows"]}
+        self.assertEqual(set(rows), {("Size", "Large"), ("", "Cheese")})
+        # السعر المحفوظ لكل سطر وقت البيع: 2×2 + 1×3
+        self.assertEqual((rows["Size", "Large"]["lines"], rows["Size", "Large"]["qty"]), (2, 3))
+        self.assertEqual(rows["Size", "Large"]["revenue"], 7.0)
+        self.assertEqual(rows["", "Cheese"]["revenue"], 3.0)
 
-# Create your tests here.
+        rows = self.client.get(url, {"start": today, "end": today}).json()["rows"]
+        self.assertEqual([(r["option"], r["qty"], r["revenue"]) for r in rows][0], ("Large", 8, 17.0))
@@ -20,6 +20,8 @@ urlpatterns = [
     path("api/ai/promo/",                 views_sales.api_ai_promo,                 name="api_ai_promo"),
     path("api/marketing/whatsapp.csv",    views_sales.api_marketing_whatsapp_csv,   name="api_marketing_whatsapp_csv"),
     path("api/ds/rfm/",                   views_sales.api_ds_rfm,                   name="api_ds_rfm"),
+    path("api/ops/status-times/",         views_sales.api_ops_status_times,         name="api_ops_status_times"),
+    path("api/sales/options/",            views_sales.api_sales_options,            name="api_sales_options"),
 
     path("api/customers/",                 views_customers.customers_list,            name="api_customers_list"),
     path("api/customers/export/",          views_customers.customers_export_csv,      name="api_customers_export"),
@@ -9,8 +9,12 @@ from django.shortcuts import render
 from django.utils import timezone
 
 from restaurants.models import Branch, Restaurant
-from orders.models import Order, OrderItem, OrderStatus
+# OrderHistory / OrderItemHistory تشمل الطلبات المؤرشفة؛ history_models يختار الجدول الساخن للفترات الحديثة
+from orders.archive import history_models
+from orders.models import OrderStatus
+from .common import product_names
 from users.decorators import restaurant_owner_required
+from users.access import can_access_branch
 
 # نعدّد الحالات التي نعتبرها "إيراد" فعلاً
 REVENUE_STATUSES = (OrderStatus.DELIVERED,)
@@ -60,7 +64,8 @@ def dashboard_view(request):
         start_date = now - timedelta(days=6)
 
     # 4) نجيب الطلبات الخاصة بمطعمنا ضمن المدة
-    orders = Order.objects.filter(
+    orders_model, items_model = history_models(start_date.date())
+    orders = orders_model.objects.filter(
         branch__restaurant=restaurant,
         created_at__date__gte=start_date.date(),
         created_at__date__lte=now.date(),
@@ -69,7 +74,7 @@ def dashboard_view(request):
 
     # 5) فلترة الفرع لو المستخدم اختار فرع معيّن
     if branch_id != "all":
-        orders = orders.filter(branch_id=branch_id)
+        orders = orders.filter(branch_id=branch_id) if can_access_branch(request, branch_id) else orders.none()
 
     # 6) حساب الـ KPI (إجمالي المبيعات، عدد الطلبات، متوسط الطلب)
     totals = orders.aggregate(
@@ -86,15 +91,15 @@ def dashboard_view(request):
 
     # 7) أكثر منتج تم طلبه (بالكمية)
     top_item = (
-        OrderItem.objects
+        items_model.objects
         .filter(order__in=orders)
-        .values("product__name")
+        .values("product_id")
         .annotate(total_qty=Sum("quantity"))
         .order_by("-total_qty")
         .first()
     )
     if top_item:
-        kpi["top_product"] = top_item["product__name"]
+        kpi["top_product"] = product_names([top_item["product_id"]]).get(top_item["product_id"], "-")
     else:
         kpi["top_product"] = "-"
 
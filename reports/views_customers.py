@@ -11,7 +11,10 @@ from django.utils import timezone
 
 from users.decorators import restaurant_owner_required
 from restaurants.models import Restaurant
-from orders.models import Order, OrderItem, OrderStatus
+# OrderHistory / OrderItemHistory تشمل الطلبات المؤرشفة؛ history_models يختار الجدول الساخن للفترات الحديثة
+from orders.archive import history_models
+from orders.models import OrderHistory, OrderStatus
+from .common import product_names
 from .models import CustomerProfile
 
 REVENUE_STATUSES = (OrderStatus.DELIVERED,)
@@ -23,7 +26,7 @@ def _get_restaurant(user):
         return None
 
 def _detect_customer_field():
-    fields = {f.name for f in Order._meta.get_fields()}
+    fields = {f.name for f in OrderHistory._meta.get_fields()}
     for cand in ("customer_id", "customer", "user_id", "user", "client_id", "client"):
         if cand in fields:
             return cand
@@ -42,7 +45,8 @@ def _parse_range(request):
     return s, e
 
 def _orders_qs(r, s, e):
-    return Order.objects.filter(
+    orders_model, _ = history_models(s)
+    return orders_model.objects.filter(
         branch__restaurant=r,
         created_at__date__gte=s,
         created_at__date__lte=e,
@@ -212,18 +216,27 @@ def customer_orders_preview(request):
     cust_field = _detect_customer_field()
     if not cust_field:
         return JsonResponse({"orders": []})
-    base = _orders_qs(r, s, e).filter(**{cust_field: ext}).order_by("-created_at")[:5]
+    base = list(_orders_qs(r, s, e).filter(**{cust_field: ext}).order_by("-created_at")[:5])
+    # استعلام واحد لعناصر الطلبات الخمسة، بأسعار وقت البيع
+    _, items_model = history_models(s)
+    items = (items_model.objects.filter(order__in=[o.id for o in base])
+             .values("order_id", "product_id")
+             .annotate(qty=Sum("quantity"), total=Sum("line_total"))
+             .order_by())
+    by_order = {}
+    for it in items:
+        by_order.setdefault(it["order_id"], []).append(it)
+    names = product_names(it["product_id"] for it in items)
     out = []
     for o in base:
-        items = (OrderItem.objects.filter(order=o)
-                 .values("product__name")
-                 .annotate(qty=Sum("quantity"))
-                 .order_by())
         out.append({
             "id": o.id,
             "at": o.created_at.isoformat(),
             "total": float(o.total_price or 0),
-            "items": [{"name": it["product__name"], "qty": int(it["qty"] or 0)} for it in items]
+            "items": [
+                {"name": names.get(it["product_id"]), "qty": int(it["qty"] or 0), "total": float(it["total"] or 0)}
+                for it in by_order.get(o.id, [])
+            ]
         })
     return JsonResponse({"orders": out})
 
@@ -240,12 +253,14 @@ def customers_ai_tags(request):
         return JsonResponse({"rows":[]})
     end = timezone.now().date()
     start = end - timedelta(days=days)
-    items = (OrderItem.objects.filter(
+    _, items_model = history_models(start)
+    items = (items_model.objects.filter(
                 order__branch__restaurant=r,
                 **{f"order__created_at__date__gte": start, f"order__created_at__date__lte": end})
-             .values(f"order__{cust_field}","product__name")
+             .values(f"order__{cust_field}","product_id")
              .annotate(qty=Sum("quantity"))
              .order_by())
+    names = {pid: (name or "").lower() for pid, name in product_names(row["product_id"] for row in items).items()}
     kw = {
         "برجر":"يحب البرجر","برغر":"يحب البرجر","chicken":"دجاج","دجاج":"دجاج","beef":"لحم","لحم":"لحم",
         "بيتزا":"بيتزا","شاورما":"شاورما","قهوة":"قهوة","موكا":"قهوة","لاتيه":"قهوة","اسبريسو":"قهوة",
@@ -256,7 +271,7 @@ def customers_ai_tags(request):
     score = {}
     for row in items:
         ext = str(row[f"order__{cust_field}"])
-        name = (row["product__name"] or "").lower()
+        name = names.get(row["product_id"], "")
         score.setdefault(ext, {})
         for k,t in kw.items():
             if k.lower() in name:
@@ -1,3 +1,4 @@
+from collections import defaultdict
 from datetime import datetime, timedelta, time
 from io import StringIO
 import csv
@@ -8,14 +9,18 @@ from django.http import JsonResponse, HttpResponse
 from django.shortcuts import render
 from django.utils import timezone
 from django.db.models import (
-    Sum, Count, Avg, Max, Value,
+    Sum, Count, Avg, Max, Value, F, OuterRef, Subquery, ExpressionWrapper,
     DecimalField, FloatField, DateTimeField
 )
 from django.db.models.functions import Coalesce
 
 from users.decorators import restaurant_owner_required
+from users.access import allowed_branch_ids, can_access_branch
 from restaurants.models import Restaurant, Branch
-from orders.models import Order, OrderItem
+# OrderHistory / OrderItemHistory تشمل الطلبات المؤرشفة؛ history_models يختار الجدول الساخن للفترات الحديثة
+from orders.archive import history_models
+from orders.models import OrderHistory, OrderItemOption, OrderStatus, OrderStatusEvent
+from .common import product_names
 
 
 def _detect_field(model, candidates):
@@ -26,19 +31,19 @@ def _detect_field(model, candidates):
     return None
 
 def _total_field():
-    return _detect_field(Order, ("total_price", "total", "grand_total", "amount", "price"))
+    return _detect_field(OrderHistory, ("total_price", "total", "grand_total", "amount", "price"))
 
 def _created_field():
-    return _detect_field(Order, ("created_at", "created", "ordered_at", "placed_at", "timestamp", "date"))
+    return _detect_field(OrderHistory, ("created_at", "created", "ordered_at", "placed_at", "timestamp", "date"))
 
 def _order_type_field():
-    return _detect_field(Order, ("order_type", "type", "channel", "source", "mode"))
+    return _detect_field(OrderHistory, ("order_type", "type", "channel", "source", "mode"))
 
 def _payment_field():
-    return _detect_field(Order, ("payment_method", "pay_method", "payment", "method"))
+    return _detect_field(OrderHistory, ("payment_method", "pay_method", "payment", "method"))
 
 def _customer_field():
-    return _detect_field(Order, ("customer", "customer_id", "user", "user_id", "client", "client_id"))
+    return _detect_field(OrderHistory, ("customer", "customer_id", "user", "user_id", "client", "client_id"))
 
 AR_2_DB_OTYPE = {"محلي": "dine_in", "استلام": "pickup", "توصيل": "delivery"}
 def _map_otype_value(v): return AR_2_DB_OTYPE.get(v, v)
@@ -74,7 +79,8 @@ def _parse_range(request):
 
 def _base_orders_qs(r, s, e):
     created_f = _created_field() or "created_at"
-    return Order.objects.filter(
+    orders_model, _ = history_models(s)
+    return orders_model.objects.filter(
         branch__restaurant=r,
         **{f"{created_f}__date__gte": s, f"{created_f}__date__lte": e},
     )
@@ -82,10 +88,11 @@ def _base_orders_qs(r, s, e):
 def _apply_branch(qs, request):
     branch_id = request.GET.get("branch")
     if branch_id:
-        try:
+        # فرع خارج صلاحيات المستخدم لا يُرجع شيئًا
+        if can_access_branch(request, branch_id):
             qs = qs.filter(branch_id=int(branch_id))
-        except Exception:
-            pass
+        else:
+            qs = qs.none()
     return qs
 
 def _apply_otype(qs, request):
@@ -100,7 +107,7 @@ def _apply_otype(qs, request):
 def _zero_for_total():
     name = _total_field() or "total_price"
     try:
-        fld = Order._meta.get_field(name)
+        fld = OrderHistory._meta.get_field(name)
         if isinstance(fld, DecimalField):
             max_d = getattr(fld, "max_digits", 12) or 12
             dec_p = getattr(fld, "decimal_places", 2) or 2
@@ -117,7 +124,7 @@ def _customer_related_model():
     if not cf:
         return None, None
     try:
-        fld = Order._meta.get_field(cf)
+        fld = OrderHistory._meta.get_field(cf)
         model = getattr(fld, "remote_field", None) and fld.remote_field.model or None
         return cf, model
     except Exception:
@@ -313,14 +320,14 @@ def api_growth_reengage(request):
     cust_f    = _customer_field()
     if not cust_f:
         return JsonResponse({"rows": []})
-    base = Order.objects.filter(branch__restaurant=r)
+    base = OrderHistory.objects.filter(branch__restaurant=r)
     qs = base.values(cust_f).annotate(
         last=Max(created_f),
         orders=Count("id"),
         spent=Coalesce(Sum(total_f), zero),
     )
     try:
-        fld = Order._meta.get_field(created_f)
+        fld = OrderHistory._meta.get_field(created_f)
     except Exception:
         fld = None
     if isinstance(fld, DateTimeField):
@@ -367,10 +374,7 @@ def api_growth_top_customers(request):
     cust_f    = _customer_field()
     if not cust_f:
         return JsonResponse({"rows": []})
-    base = Order.objects.filter(
-        branch__restaurant=r,
-        **{f"{created_f}__date__gte": s, f"{created_f}__date__lte": e},
-    )
+    base = _base_orders_qs(r, s, e)
     data = (
         base.values(cust_f)
             .annotate(orders=Count("id"),
@@ -412,10 +416,7 @@ def api_sales_debug(request):
     s, e = _parse_range(request)
     created_f = _created_field() or "created_at"
     total_f   = _total_field() or "total_price"
-    base = Order.objects.filter(
-        branch__restaurant=r,
-        **{f"{created_f}__date__gte": s, f"{created_f}__date__lte": e},
-    )
+    base = _base_orders_qs(r, s, e)
     after_branch = _apply_branch(base, request)
     after_branch, otype_label = _apply_otype(after_branch, request)
     rows = []
@@ -452,10 +453,7 @@ def api_sales_ping(request):
     s, e = _parse_range(request)
     created_f = _created_field() or "created_at"
     total_f   = _total_field() or "total_price"
-    qs = Order.objects.filter(
-        branch__restaurant=r,
-        **{f"{created_f}__date__gte": s, f"{created_f}__date__lte": e},
-    ).select_related("branch").order_by("-id")[:3]
+    qs = _base_orders_qs(r, s, e).select_related("branch").order_by("-id")[:3]
     rows = []
     for o in qs:
         created_val = getattr(o, created_f, None)
@@ -540,21 +538,21 @@ def _segment_customers(request, kind="inactive"):
     cust_f    = _customer_field()
     if not cust_f:
         return []
-    base = Order.objects.filter(branch__restaurant=r)
+    base = OrderHistory.objects.filter(branch__restaurant=r)
     if kind == "inactive":
         days = int(request.GET.get("days") or 30)
         cutoff = timezone.now().date() - timedelta(days=days)
         qs = (base.values(cust_f)
               .annotate(last=Max(created_f), orders=Count("id"), spent=Coalesce(Sum(total_f), zero)))
         try:
-            fld = Order._meta.get_field(created_f)
+            fld = OrderHistory._meta.get_field(created_f)
         except Exception:
             fld = None
         qs = qs.filter(last__date__lte=cutoff) if isinstance(fld, DateTimeField) else qs.filter(last__lte=cutoff)
         data = qs.order_by("last")[:500]
     else:
         s, e = _parse_range(request)
-        qs = (base.filter(**{f"{created_f}__date__gte": s, f"{created_f}__date__lte": e})
+        qs = (_base_orders_qs(r, s, e)
               .values(cust_f)
               .annotate(last=Max(created_f), orders=Count("id"), spent=Coalesce(Sum(total_f), zero))
               .order_by("-spent")[:500])
@@ -654,10 +652,7 @@ def api_ds_rfm(request):
     cust_f    = _customer_field()
     if not cust_f:
         return JsonResponse({"summary":{}, "rows":[]})
-    base = Order.objects.filter(
-        branch__restaurant=r,
-        **{f"{created_f}__date__gte": start, f"{created_f}__date__lte": end},
-    )
+    base = _base_orders_qs(r, start, end)
     from django.db.models import Max
     data = (base.values(cust_f)
                  .annotate(last=Max(created_f),
@@ -717,22 +712,23 @@ def api_growth_bundles(request):
         return JsonResponse({"rows":[]})
     s, e = _parse_range(request)
     created_f = _created_field() or "created_at"
+    _, items_model = history_models(s)
     items = (
-        OrderItem.objects.filter(
+        items_model.objects.filter(
             order__branch__restaurant=r,
             **{f"order__{created_f}__date__gte": s, f"order__{created_f}__date__lte": e},
         )
-        .values("order_id","product__name")
+        .values("order_id","product_id")
         .annotate(qty=Sum("quantity"))
         .order_by()
     )
     by_order = {}
     for it in items:
-        if not it["product__name"]:
-            continue
         if (it["qty"] or 0) <= 0:
             continue
-        by_order.setdefault(it["order_id"], set()).add(it["product__name"])
+        by_order.setdefault(it["order_id"], set()).add(it["product_id"])
+    names = product_names({pid for prods in by_order.values() for pid in prods})
+    by_order = {oid: {names[pid] for pid in prods if names.get(pid)} for oid, prods in by_order.items()}
     pairs = {}
     for prods in by_order.values():
         lst = sorted(prods)
@@ -754,10 +750,7 @@ def api_growth_best_times(request):
     s, e = _parse_range(request)
     created_f = _created_field() or "created_at"
     total_f   = _total_field() or "total_price"
-    qs = Order.objects.filter(
-        branch__restaurant=r,
-        **{f"{created_f}__date__gte": s, f"{created_f}__date__lte": e},
-    ).values_list(created_f, total_f)
+    qs = _base_orders_qs(r, s, e).values_list(created_f, total_f)
     hours = [0.0]*24
     week = [0.0]*7
     for dt, total in qs:
@@ -777,3 +770,101 @@ def api_growth_best_times(request):
     wlabels = ["الاثنين","الثلاثاء","الأربعاء","الخميس","الجمعة","السبت","الأحد"]
     hlabels = [str(i) for i in range(24)]
     return JsonResponse({"hours":{"labels":hlabels,"values":hours},"weekdays":{"labels":wlabels,"values":week}})
+
+
+# ---- operations: time in status ----
+
+STATUS_TIME_PERCENTILES = (50, 90, 95)
+
+def _duration_percentiles(durations, percentiles=STATUS_TIME_PERCENTILES):
+    """Nearest-rank percentiles of an ascending list of durations."""
+    n = len(durations)
+    out = {"count": n}
+    for p in percentiles:
+        out[f"p{p}"] = durations[max((n * p + 99) // 100 - 1, 0)] if n else None
+    return out
+
+def _report_branches(r, request):
+    """The restaurant's branches the user may see, narrowed by ``?branch=``."""
+    branches = Branch.objects.filter(restaurant=r, pk__in=allowed_branch_ids(request))
+    branch_id = request.GET.get("branch")
+    if branch_id:
+        # _apply_branch يفلتر branch_id على جداول الطلبات؛ هنا الجدول هو Branch نفسه
+        branches = branches.filter(pk=branch_id) if branch_id.isdigit() else branches.none()
+    return branches
+
+@login_required
+@restaurant_owner_required
+def api_ops_status_times(request):
+    """
+    Seconds spent in each kitchen status (New → Preparing → Ready) per branch.
+    Filters: start/end (dates), branch.
+
+    One range scan on the (branch, from_status, created_at, duration_seconds)
+    covering index reads every duration of the period; each branch/status
+    group is sorted once in Python for all its percentiles.
+    """
+    r = _get_restaurant(request.user)
+    if not r:
+        return JsonResponse({"rows": []})
+    s, e = _parse_range(request)
+    branches = list(_report_branches(r, request).only("id", "name"))
+    # حدود زمنية صريحة بدل __date حتى يبقى الفلتر على الفهرس
+    tz = timezone.get_current_timezone()
+    since = timezone.make_aware(datetime.combine(s, time.min), tz)
+    until = timezone.make_aware(datetime.combine(e + timedelta(days=1), time.min), tz)
+    statuses = (OrderStatus.NEW, OrderStatus.PREPARING, OrderStatus.READY)
+
+    durations = defaultdict(list)
+    events = OrderStatusEvent.objects.filter(
+        branch_id__in=[b.id for b in branches], from_status__in=statuses,
+        created_at__gte=since, created_at__lt=until, duration_seconds__isnull=False,
+    ).values_list("branch_id", "from_status", "duration_seconds")
+    for branch_id, status, seconds in events.iterator():
+        durations[(branch_id, status)].append(seconds)
+
+    rows = []
+    for b in branches:
+        for st in statuses:
+            group = sorted(durations[(b.id, st)])
+            rows.append({"branch": b.name, "branch_id": b.id, "status": st, **_duration_percentiles(group)})
+    return JsonResponse({"rows": rows})
+
+
+@login_required
+@restaurant_owner_required
+def api_sales_options(request):
+    """
+    Option popularity and upsell revenue from the checkout snapshots
+    (``OrderItemOption``), grouped in SQL.  Filters: start/end, branch.
+    """
+    r = _get_restaurant(request.user)
+    if not r:
+        return JsonResponse({"rows": []})
+    s, e = _parse_range(request)
+    tz = timezone.get_current_timezone()
+    since = timezone.make_aware(datetime.combine(s, time.min), tz)
+    until = timezone.make_aware(datetime.combine(e + timedelta(days=1), time.min), tz)
+    orders_model, items_model = history_models(since)
+    orders = _apply_branch(
+        orders_model.objects.filter(branch__restaurant=r, created_at__gte=since, created_at__lt=until),
+        request,
+    )
+    lines = items_model.objects.filter(order__in=orders.values("pk"))
+    revenue = ExpressionWrapper(
+        F("price_adjustment") * F("line_quantity"), output_field=DecimalField(max_digits=12, decimal_places=2)
+    )
+    rows = (
+        OrderItemOption.objects.filter(order_item_id__in=lines.values("pk"))
+        .annotate(line_quantity=Subquery(lines.filter(pk=OuterRef("order_item_id")).values("quantity")[:1]))
+        .values("group_name", "option_name")
+        .annotate(lines=Count("id"), qty=Sum("line_quantity"), revenue=Sum(revenue))
+        .order_by("-qty", "group_name", "option_name")
+    )
+    return JsonResponse({"rows": [
+        {
+            "group": row["group_name"], "option": row["option_name"], "lines": row["lines"],
+            "qty": row["qty"] or 0, "revenue": float(row["revenue"] or 0),
+        }
+        for row in rows[:50]
+    ]})
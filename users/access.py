@@ -0,0 +1,91 @@
+# users/access.py
+"""
+Which branches a user may work on.
+
+``allowed_branch_ids(request)`` resolves the set once and keeps it in the
+session, so the board, order fragments and reports share one answer instead
+of each re-querying ``profile`` and ``Branch``.  The session entry is stamped
+with the profile's ``branch_access_version``; saving the profile, or any
+change to a Branch or Restaurant it may cover (see users/signals.py), bumps
+that column in the database and the session recomputes on its next request,
+in every process.  Users without a profile are never cached.
+"""
+from django.db.models import F, Q
+
+from restaurants.models import Branch
+
+from .models import Profile
+
+SESSION_KEY = "branch_access"
+
+
+def _access_stamp(user):
+    """What the cached branch set was computed from, or None if it cannot be cached."""
+    profile = getattr(user, "profile", None) if user.is_authenticated else None
+    if profile is None:
+        return None
+    return [profile.pk, profile.branch_access_version, user.is_superuser]
+
+
+def invalidate_restaurant_access(restaurant_id, owner_ids=()) -> None:
+    """Bump every profile whose branch set may include ``restaurant_id``'s branches."""
+    Profile.objects.filter(
+        Q(role="Admin") | Q(user__is_superuser=True)
+        | Q(restaurant_id=restaurant_id) | Q(branch__restaurant_id=restaurant_id)
+        | Q(user__restaurants__id=restaurant_id) | Q(user_id__in=[i for i in owner_ids if i])
+    ).update(branch_access_version=F("branch_access_version") + 1)
+
+
+def compute_branch_ids(user) -> list:
+    """Branch ids ``user`` may see, by profile role (uncached)."""
+    if not user.is_authenticated:
+        return []
+    branches = Branch.objects.order_by("id")
+    if user.is_superuser:
+        return list(branches.values_list("id", flat=True))
+
+    profile = getattr(user, "profile", None)
+    role = getattr(profile, "role", None)
+    if role == "Admin":
+        qs = branches
+    elif role == "RestaurantOwner":
+        qs = branches.filter(restaurant__owner=user)
+    elif role in ("Cashier", "BranchManager") and profile.branch_id:
+        qs = branches.filter(pk=profile.branch_id)
+    elif role == "BranchManager" and profile.restaurant_id:
+        qs = branches.filter(restaurant_id=profile.restaurant_id)
+    else:
+        return []
+    return list(qs.values_list("id", flat=True))
+
+
+def allowed_branch_ids(request) -> list:
+    """Ordered list of the current user's branch ids (cached per session)."""
+    cached = getattr(request, "_branch_ids", None)
+    if cached is not None:
+        return cached
+
+    user = request.user
+    stamp = _access_stamp(user)
+    session = getattr(request, "session", None)
+    stored = session.get(SESSION_KEY) if session is not None else None
+    if stamp is not None and stored and stored.get("user") == user.pk and stored.get("stamp") == stamp:
+        ids = stored["ids"]
+    else:
+        ids = compute_branch_ids(user)
+        if session is not None and stamp is not None:
+            session[SESSION_KEY] = {"user": user.pk, "stamp": stamp, "ids": ids}
+    request._branch_ids = ids
+    return ids
+
+
+def can_access_branch(request, branch_id) -> bool:
+    try:
+        return int(branch_id) in allowed_branch_ids(request)
+    except (TypeError, ValueError):
+        return False
+
+
+def default_branch_id(request):
+    ids = allowed_branch_ids(request)
+    return ids[0] if ids else None
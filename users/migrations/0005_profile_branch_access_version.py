@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_alter_profile_role'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='branch_access_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import F
 from restaurants.models import Branch, Restaurant
 from django.contrib.auth.models import User
 # Create your models here.
@@ -19,6 +20,19 @@ class Profile(models.Model):
     branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # يُقارن بختم الجلسة في users/access.py؛ أي تغيير يرفعه فتُعاد حساب الفروع في الطلب التالي
+    branch_access_version = models.PositiveIntegerField(default=1)
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        # الزيادة داخل UPDATE: نسخة قديمة من الملف لا تعيد رقمًا قديمًا
+        self.branch_access_version = F("branch_access_version") + 1
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "branch_access_version"}
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=["branch_access_version"])
 
 # # Employees
 # class Employee(models.Model):
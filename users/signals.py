@@ -0,0 +1,27 @@
+# users/signals.py
+from django.db.models.signals import post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .access import invalidate_restaurant_access
+
+
+# أي تغيير في الفروع أو ملكية المطعم يغيّر صلاحيات الفروع؛ تعديل الملف الشخصي نفسه يرفع نسخته في Profile.save
+@receiver(post_save, sender="restaurants.Branch")
+@receiver(pre_delete, sender="restaurants.Branch")
+def reset_branch_access(sender, instance, **kwargs):
+    # pre_delete: قبل أن يصبح profile.branch فارغًا (SET_NULL لا يرسل إشارات)
+    invalidate_restaurant_access(instance.restaurant_id)
+
+
+@receiver(pre_save, sender="restaurants.Restaurant")
+def remember_restaurant_owner(sender, instance, **kwargs):
+    instance._previous_owner_id = (
+        sender.objects.filter(pk=instance.pk).values_list("owner_id", flat=True).first() if instance.pk else None
+    )
+
+
+@receiver(post_save, sender="restaurants.Restaurant")
+@receiver(pre_delete, sender="restaurants.Restaurant")
+def reset_restaurant_access(sender, instance, **kwargs):
+    # المالك السابق يفقد فروع المطعم عند نقل الملكية
+    invalidate_restaurant_access(instance.pk, (instance.owner_id, getattr(instance, "_previous_owner_id", None)))
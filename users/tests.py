@@ -1,3 +1,64 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import RequestFactory, TestCase
 
-# Create your tests here.
+from restaurants.models import Branch, Restaurant
+
+from .access import allowed_branch_ids
+from .models import Profile
+
+
+class BranchAccessTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user("owner", password="x")
+        self.restaurant = Restaurant.objects.create(name="R", description="d", owner=owner)
+        self.branch = Branch.objects.create(restaurant=self.restaurant, name="B", address="a")
+        self.other = Branch.objects.create(restaurant=self.restaurant, name="B2", address="a")
+        self.cashier = User.objects.create_user("cashier", password="x")
+        self.profile = Profile.objects.create(user=self.cashier, role="Cashier", branch=self.branch)
+        self.session = self.client.session
+
+    def _ids(self, user=None):
+        # طلب جديد كل مرة بمستخدم محمّل من قاعدة البيانات، كما يفعل AuthenticationMiddleware
+        request = RequestFactory().get("/")
+        request.user = User.objects.get(pk=(user or self.cashier).pk)
+        request.session = self.session
+        return allowed_branch_ids(request)
+
+    def test_session_reuses_the_branch_set(self):
+        self.assertEqual(self._ids(), [self.branch.pk])
+        request = RequestFactory().get("/")
+        request.user = User.objects.get(pk=self.cashier.pk)
+        request.session = self.session
+        with self.assertNumQueries(1):  # الملف الشخصي فقط للمقارنة مع الختم
+            self.assertEqual(allowed_branch_ids(request), [self.branch.pk])
+
+    def test_revoking_a_branch_applies_on_the_next_request(self):
+        self.assertEqual(self._ids(), [self.branch.pk])
+        self.profile.branch = self.other
+        self.profile.save(update_fields=["branch"])
+        self.assertEqual(self._ids(), [self.other.pk])
+        self.profile.role = "Customer"
+        self.profile.save()
+        self.assertEqual(self._ids(), [])
+
+    def test_stale_profile_instance_cannot_restore_an_old_stamp(self):
+        stale = Profile.objects.get(pk=self.profile.pk)
+        self.assertEqual(self._ids(), [self.branch.pk])
+        Profile.objects.get(pk=self.profile.pk).save()
+        self.assertEqual(self._ids(), [self.branch.pk])
+        stale.role = "Customer"
+        stale.save()
+        self.assertEqual(self._ids(), [])
+
+    def test_branch_and_ownership_changes_reach_cached_sessions(self):
+        owner = self.restaurant.owner
+        Profile.objects.create(user=owner, role="RestaurantOwner", restaurant=self.restaurant)
+        self.assertEqual(self._ids(owner), [self.branch.pk, self.other.pk])
+
+        self.branch.delete()
+        self.assertEqual(self._ids(owner), [self.other.pk])
+        self.assertEqual(self._ids(), [])
+
+        self.restaurant.owner = User.objects.create_user("buyer", password="x")
+        self.restaurant.save()
+        self.assertEqual(self._ids(owner), [])
@@ -4,6 +4,8 @@ from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from menu.models import Product
 from .models import Website
+from orders.models import ArchivedOrder, Order
+from orders.capacity import branch_capacity, capacity_for_branches, checkout_branch_id
 
 
 # =============================
@@ -36,11 +38,23 @@ def _base_ctx(request, website, **extra):
         "cart_count": cart_count,
         # يوفر آخر رقم طلب لتمكين رابط العودة إلى الفاتورة
         "last_order_id": request.session.get("last_order_id"),
+        "branch_options": _branch_options(website),
     }
     ctx.update(extra)
     return ctx
 
 
+def _branch_options(website):
+    # الفروع مع حالة الاستقبال والوقت المتوقع (من الكاش، بدون عدّ الطلبات)
+    branches = list(website.restaurant.branches.order_by("id").values("id", "name"))
+    capacity = capacity_for_branches([b["id"] for b in branches])
+    for b in branches:
+        status = capacity[b["id"]]
+        b["accepting"] = status["accepting"]
+        b["eta_minutes"] = status["eta_minutes"]
+    return branches
+
+
 # =============================
 # صفحات العرض العامة
 # =============================
@@ -172,6 +186,9 @@ def cart_view(request, slug):
     tax = 0 #round(subtotal * tax_rate, 2)
     total = round(subtotal + tax, 2)
 
+    branch_id = checkout_branch_id(request.session.get("order_data"), website.restaurant)
+    checkout_capacity = branch_capacity(branch_id) if branch_id else None
+
     return render(
         request,
         "websites/cart.html",
@@ -184,6 +201,7 @@ def cart_view(request, slug):
             total=total,
             tax_rate=int(tax_rate * 100),
             meta=meta,
+            checkout_capacity=checkout_capacity,
             current_tab="cart",
         ),
     )
@@ -332,12 +350,13 @@ def user_orders(request, slug):
     
     # إذا كان المستخدم مسجل دخول
     if request.user.is_authenticated:
-        orders = []
-        branches = website.restaurant.branches.all()
-        for branch in branches:
-            for order in branch.orders.all():
-                if order.customer == request.user:
-                    orders.append(order)
+        # استعلام على فهرس العميل في كل جدول (الساخن ثم الأرشيف) بدل عرض UNION ALL
+        filters = {"customer": request.user, "branch__restaurant": website.restaurant}
+        orders = sorted(
+            [*Order.objects.filter(**filters).select_related("branch"),
+             *ArchivedOrder.objects.filter(**filters).select_related("branch")],
+            key=lambda o: o.created_at, reverse=True,
+        )
     else:
         orders = []
 